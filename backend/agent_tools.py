@@ -6,16 +6,24 @@ Agent 工具集 — 供 OpenAI function calling 调用
 import json
 import re
 
-import cv2
 import numpy as np
 
-from video_utils import extract_frame, crop_region, frame_to_base64
+from decode_pool import decode_pool
+from vision_cache import content_key
+
+
+# 平均运动量低于该值视为静止
+MOTION_STATIONARY_THRESHOLD = 3.0
+# 运动分析默认在区间内取样的间隔数，以及单次分析的最大采样帧数
+MOTION_SAMPLES = 20
+MOTION_MAX_SAMPLES = 200
 
 
 # ── 模块级客户端引用（由 app.py 初始化时注入） ─────────────────────────
 
 _ai_client = None
 _vision_model = None
+_vision_cache = None
 
 
 def set_client(client, vision_model: str = None):
@@ -25,6 +33,41 @@ def set_client(client, vision_model: str = None):
     _vision_model = vision_model
 
 
+def set_vision_cache(cache):
+    """设置视觉模型响应缓存（VisionResponseCache），None 表示不缓存"""
+    global _vision_cache
+    _vision_cache = cache
+
+
+def _cached_vision_chat(image_b64: str, key: tuple, prompt: str, exact: bool = False, cache_if=None) -> str:
+    """
+    单图（JPEG base64 + 感知哈希）+ 文本提示词的视觉请求；相同或几乎相同的图片直接返回缓存的响应。
+    exact=True 时只按图片内容精确匹配（结果取决于细节的请求，如车牌）；cache_if(text) 为假的响应不缓存。
+    """
+    if _vision_cache is not None:
+        if exact:
+            cached = _vision_cache.get_exact(_vision_model, prompt, content_key(image_b64))
+        else:
+            cached = _vision_cache.get(_vision_model, prompt, key)
+        if cached is not None:
+            return cached
+
+    messages = [{
+        "role": "user",
+        "content": [
+            {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{image_b64}"}},
+            {"type": "text", "text": prompt}
+        ]
+    }]
+    text = _ai_client.vision_chat(messages, model=_vision_model)
+    if _vision_cache is not None and (cache_if is None or cache_if(text)):
+        if exact:
+            _vision_cache.put_exact(_vision_model, prompt, content_key(image_b64), text)
+        else:
+            _vision_cache.put(_vision_model, prompt, key, text)
+    return text
+
+
 # ── OpenAI function calling 格式的工具定义 ──────────────────────────────
 
 TOOL_ANALYZE_SCENE = {
@@ -83,6 +126,8 @@ TOOL_MOTION_ANALYSIS = {
         "description": (
             "用 OpenCV 帧差法分析视频中某区域在指定帧范围内的运动量，"
             "判断是否存在静止车辆。avg_motion_score < 3.0 视为静止。"
+            "可通过 bboxes 一次传入多个区域（如所有疑似违停车辆），只解码一遍视频；"
+            "结果包含每个采样区间的运动曲线 motion_curve。"
         ),
         "parameters": {
             "type": "object",
@@ -92,6 +137,11 @@ TOOL_MOTION_ANALYSIS = {
                     "items": {"type": "number"},
                     "description": "分析区域 [x1, y1, x2, y2]"
                 },
+                "bboxes": {
+                    "type": "array",
+                    "items": {"type": "array", "items": {"type": "number"}},
+                    "description": "多个分析区域 [[x1, y1, x2, y2], ...]，结果按顺序放在 regions 中"
+                },
                 "start_frame": {
                     "type": "integer",
                     "description": "起始帧序号"
@@ -101,7 +151,7 @@ TOOL_MOTION_ANALYSIS = {
                     "description": "结束帧序号"
                 }
             },
-            "required": ["bbox", "start_frame", "end_frame"]
+            "required": ["start_frame", "end_frame"]
         }
     }
 }
@@ -115,11 +165,11 @@ def tool_analyze_scene_frame(video_path: str, frame_index: int, focus: str = "ge
     if _ai_client is None:
         return {"error": "AI 客户端未初始化"}, "场景分析失败：客户端未初始化"
 
-    frame = extract_frame(video_path, frame_index)
-    if frame is None:
+    # 解码与 JPEG 编码在解码进程池中完成
+    status, image_b64, key = decode_pool.crop_jpegs(video_path, [(frame_index, None)])[0]
+    if status != "ok":
         return {"error": "帧提取失败"}, "场景分析失败：无法提取帧"
 
-    img_b64 = frame_to_base64(frame)
     focus_hint = {
         "road_markings": "重点识别道路标线（黄线、白线、禁停线）的位置和含义",
         "parking_signs": "重点识别禁停标志、限时停车标志等交通标志",
@@ -137,14 +187,7 @@ def tool_analyze_scene_frame(video_path: str, frame_index: int, focus: str = "ge
     )
 
     try:
-        messages = [{
-            "role": "user",
-            "content": [
-                {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{img_b64}"}},
-                {"type": "text", "text": prompt}
-            ]
-        }]
-        text = _ai_client.vision_chat(messages, model=_vision_model)
+        text = _cached_vision_chat(image_b64, key, prompt)
         json_match = re.search(r'\{.*\}', text, re.DOTALL)
         result = json.loads(json_match.group()) if json_match else {"raw": text}
     except Exception as e:
@@ -158,62 +201,71 @@ def tool_recognize_license_plate(video_path: str, frame_index: int, bbox: list)
     if _ai_client is None:
         return {"plate": "N/A", "error": "AI 客户端未初始化"}, "车牌识别失败：客户端未初始化"
 
-    frame = extract_frame(video_path, frame_index)
-    if frame is None:
+    status, image_b64, key = decode_pool.crop_jpegs(video_path, [(frame_index, bbox)])[0]
+    if status == "no_frame":
         return {"plate": "N/A", "error": "帧提取失败"}, "车牌识别失败：无法提取帧"
-
-    cropped = crop_region(frame, bbox)
-    img_b64 = frame_to_base64(cropped)
+    if status == "empty":
+        return {"plate": "N/A", "error": "裁剪区域无效"}, "车牌识别失败：裁剪区域无效"
 
     try:
-        messages = [{
-            "role": "user",
-            "content": [
-                {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{img_b64}"}},
-                {"type": "text", "text": "请识别图中车辆的车牌号。只输出车牌号，无法识别则输出 N/A。"}
-            ]
-        }]
-        plate = _ai_client.vision_chat(messages, model=_vision_model).strip()
+        plate = _cached_vision_chat(
+            image_b64, key, "请识别图中车辆的车牌号。只输出车牌号，无法识别则输出 N/A。",
+            exact=True, cache_if=lambda text: text.strip() not in ("", "N/A"),
+        ).strip()
     except Exception as e:
         plate = "N/A"
 
     return {"plate": plate}, f"车牌识别：{plate}"
 
 
-def tool_analyze_motion_in_region(video_path: str, bbox: list, start_frame: int, end_frame: int) -> tuple:
-    x1, y1, x2, y2 = [int(v) for v in bbox]
-    cap = cv2.VideoCapture(video_path)
-
-    prev_gray = None
-    motion_scores = []
-    sample_step = max(1, (end_frame - start_frame) // 20)
-
-    for fi in range(start_frame, min(end_frame + 1, start_frame + 200 * sample_step), sample_step):
-        cap.set(cv2.CAP_PROP_POS_FRAMES, fi)
-        ret, frame = cap.read()
-        if not ret:
-            break
-        roi = frame[y1:y2, x1:x2]
-        if roi.size == 0:
+def motion_curves(stacks: list) -> list:
+    """
+    每个区域的灰度序列 (T, h, w) -> 相邻采样帧之间的平均绝对差 (T-1,)，整批一次计算。
+    空区域或不足两帧时返回空数组。
+    """
+    curves = []
+    for stack in stacks:
+        if stack.shape[0] < 2 or stack[0].size == 0:
+            curves.append(np.zeros(0))
             continue
-        gray = cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY)
-        if prev_gray is not None and prev_gray.shape == gray.shape:
-            diff = cv2.absdiff(prev_gray, gray)
-            motion_scores.append(float(np.mean(diff)))
-        prev_gray = gray
-
-    cap.release()
-
-    avg_motion = float(np.mean(motion_scores)) if motion_scores else 0.0
-    is_stationary = avg_motion < 3.0
-
-    result = {
-        "avg_motion_score": round(avg_motion, 3),
-        "is_stationary": is_stationary,
-        "frames_analyzed": len(motion_scores),
-    }
-    status = "静止" if is_stationary else "运动中"
-    return result, f"运动分析：平均运动量 {avg_motion:.2f}，{status}"
+        diffs = np.abs(np.diff(stack.astype(np.int16), axis=0))
+        curves.append(diffs.reshape(diffs.shape[0], -1).mean(axis=1))
+    return curves
+
+
+def tool_analyze_motion_in_region(video_path: str, start_frame: int, end_frame: int, bbox: list = None,
+                                  bboxes: list = None, samples: int = MOTION_SAMPLES) -> tuple:
+    regions = [bbox] if bboxes is None else list(bboxes)
+    if bboxes is not None and bbox is not None:
+        regions.insert(0, bbox)
+    if not regions or any(r is None or len(r) != 4 for r in regions):
+        return {"error": "bbox 参数无效"}, "运动分析失败：bbox 参数无效"
+
+    # 区间内均匀取样（最多 MOTION_MAX_SAMPLES 帧），在解码进程池中一次顺序解码取出所有区域的灰度序列
+    sample_step = max(1, (end_frame - start_frame) // max(1, samples))
+    frame_indices = list(range(start_frame, end_frame + 1, sample_step))[:MOTION_MAX_SAMPLES]
+    decoded, stacks = decode_pool.region_stacks(video_path, frame_indices, regions)
+
+    results = []
+    for region, curve in zip(regions, motion_curves(stacks)):
+        avg_motion = float(curve.mean()) if curve.size else 0.0
+        results.append({
+            "bbox": [int(v) for v in region],
+            "avg_motion_score": round(avg_motion, 3),
+            "max_motion_score": round(float(curve.max()), 3) if curve.size else 0.0,
+            "is_stationary": avg_motion < MOTION_STATIONARY_THRESHOLD,
+            "frames_analyzed": int(curve.size),
+            # 每个采样区间的运动量：[起始帧, 结束帧, 平均绝对差]
+            "motion_curve": [[decoded[i], decoded[i + 1], round(float(score), 3)] for i, score in enumerate(curve)],
+        })
+
+    def describe(r):
+        return f"平均运动量 {r['avg_motion_score']:.2f}，{'静止' if r['is_stationary'] else '运动中'}"
+
+    if bboxes is None:
+        return results[0], f"运动分析：{describe(results[0])}"
+    summary = "；".join(f"区域 {i + 1} {describe(r)}" for i, r in enumerate(results))
+    return {"regions": results}, f"运动分析：{summary}"
 
 
 # ── 工具分发表 ────────────────────────────────────────────────────────
@@ -1,18 +1,38 @@
 import os
+import ipaddress
 import json
 import re
 import secrets
+import shutil
 import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
 from flask import Flask, render_template, request, jsonify, Response, session, send_from_directory
 from flask_cors import CORS
 from dotenv import dotenv_values
 from PIL import Image
+import numpy as np
 from database import init_db, db
-from models import Conversation, Message
+from models import Conversation, Message, CameraProfile
 from routes.auth import auth_bp, login_required
-from video_utils import extract_frame, crop_region, frame_to_base64, get_video_info
-from sam3_service import SAM3Predictor
+from video_utils import (
+    get_video_info, release_decoders, frame_cache, file_sha256, seek_aligned_frame
+)
+from sam3_service import SAM3Predictor, is_stream_url
 from openai_client import OpenAIClient
+from sam3_jobs import SAM3JobQueue, ProgressMeter
+from sam3_cache import SAM3ResultCache, cache_key
+from vision_cache import VisionResponseCache, content_key
+from decode_pool import decode_pool, DecodePoolBusy
+from sse import sse_event, text_envelope, coalesce
+from metrics import registry as metrics_registry, AGENT_TOOL_SECONDS, SAM3_STAGE_SECONDS
+from track_store import (
+    tracks_path, save_tracks, load_tracks, slice_frames, sample_frames, frame_annotations, annotation_batches,
+    ANNOTATION_WINDOW_FRAMES, ANNOTATION_QUANT
+)
 
 app = Flask(__name__)
 
@@ -51,12 +71,24 @@ OPENAI_API_KEY = config.get("OPENAI_API_KEY", "")
 CHAT_MODEL = config.get("CHAT_MODEL", "")
 VISION_MODEL = config.get("VISION_MODEL", "")
 TEXT_MODEL = config.get("TEXT_MODEL", "")
+# 车牌识别并发请求数，以及每个请求打包的裁剪图数量（1 表示不打包）
+VISION_CONCURRENCY = int(config.get("VISION_CONCURRENCY", "4"))
+VISION_BATCH_SIZE = int(config.get("VISION_BATCH_SIZE", "1"))
+# Agent 同一轮工具调用的并发数
+AGENT_TOOL_CONCURRENCY = int(config.get("AGENT_TOOL_CONCURRENCY", "4"))
+# 流式文本 token 合并阈值（字符数 / 毫秒），设为 0 则逐 token 发送
+SSE_COALESCE_CHARS = int(config.get("SSE_COALESCE_CHARS", "64"))
+SSE_COALESCE_SEC = int(config.get("SSE_COALESCE_MS", "50")) / 1000
 
 # 初始化统一 AI 客户端
 ai_client = OpenAIClient(
     base_url=OPENAI_API_BASE,
     api_key=OPENAI_API_KEY,
-    default_model=CHAT_MODEL
+    default_model=CHAT_MODEL,
+    pool_size=int(config.get("OPENAI_POOL_SIZE", "16")),
+    max_retries=int(config.get("OPENAI_MAX_RETRIES", "3")),
+    connect_timeout=float(config.get("OPENAI_CONNECT_TIMEOUT", "5")),
+    read_timeout=float(config.get("OPENAI_READ_TIMEOUT", "120")),
 )
 
 if not OPENAI_API_BASE:
@@ -64,16 +96,49 @@ if not OPENAI_API_BASE:
 if not OPENAI_API_KEY:
     print("OPENAI_API_KEY not configured. Please set it in Settings or .env file.")
 
+# 视觉模型响应缓存：场景分析按 (模型, 提示词, 图片感知哈希) 近似复用，车牌识别按裁剪图内容精确复用；TTL 秒数为 0 时禁用
+vision_cache = VisionResponseCache(
+    os.path.join(app.instance_path, 'vision_cache.sqlite'),
+    ttl_sec=float(config.get("VISION_CACHE_TTL_SEC", str(7 * 24 * 3600))),
+    max_distance=int(config.get("VISION_CACHE_MAX_DISTANCE", "3")),
+)
+
+# 运行时指标：各阶段耗时直方图，由 /metrics 以 Prometheus 文本格式导出；METRICS_TOKEN 非空时需 Bearer 令牌
+metrics_registry.configure(enabled=config.get("METRICS_ENABLED", "true").lower() == "true")
+METRICS_TOKEN = config.get("METRICS_TOKEN", "")
+
 # 注入 AI 客户端到 agent_tools
-from agent_tools import set_client as set_agent_client
+from agent_tools import set_client as set_agent_client, set_vision_cache
 set_agent_client(ai_client, VISION_MODEL)
+set_vision_cache(vision_cache)
 
 # SAM 3 configuration
 SAM3_SERVICE_URL = config.get("SAM3_SERVICE_URL", "http://localhost:8100")
 SAM3_LOCAL = config.get("SAM3_LOCAL", "false").lower() == "true"
+# single_pass: 所有车辆提示词加入同一会话后只传播一次；per_prompt: 每个提示词单独传播
+SAM3_PROMPT_MODE = config.get("SAM3_PROMPT_MODE", "single_pass")
+
+# 默认推理参数（可被摄像头配置覆盖）：时间步长与缩放比例，用于以精度换吞吐
+SAM3_FRAME_STRIDE = int(config.get("SAM3_FRAME_STRIDE", "1"))
+SAM3_DOWNSCALE = float(config.get("SAM3_DOWNSCALE", "1.0"))
+
+# 长视频分块追踪：超过 SAM3_CHUNK_SEC 秒的视频按重叠分块逐段推理（0 为不分块），SAM3_CHUNK_WORKERS 个分块并行
+SAM3_CHUNK_SEC = float(config.get("SAM3_CHUNK_SEC", "0"))
+SAM3_CHUNK_WORKERS = int(config.get("SAM3_CHUNK_WORKERS", "1"))
 
 # Initialize SAM 3 predictor (mock mode when not local or CUDA unavailable)
-sam3_predictor = SAM3Predictor(use_mock=not SAM3_LOCAL)
+sam3_predictor = SAM3Predictor(use_mock=not SAM3_LOCAL, prompt_mode=SAM3_PROMPT_MODE,
+                               chunk_sec=SAM3_CHUNK_SEC, chunk_workers=SAM3_CHUNK_WORKERS)
+
+# 解码帧缓存容量（MB）
+frame_cache.configure(int(config.get("FRAME_CACHE_MB", "256")) * 1024 * 1024)
+
+# 解码进程池：裁剪/编码与运动分析的解码在子进程中执行；DECODE_WORKERS=0 时在请求线程内解码
+# 默认保留一个核心给 Web 进程（单核机器上即为 0）
+decode_pool.configure(
+    workers=int(config.get("DECODE_WORKERS", str(min(4, (os.cpu_count() or 1) - 1)))),
+    max_pending=int(config.get("DECODE_MAX_PENDING", "32")),
+)
 
 
 @app.route('/')
@@ -180,7 +245,7 @@ def run_inference():
 
     def event_stream():
         if not OPENAI_API_BASE or not OPENAI_API_KEY:
-            yield f"data: {json.dumps({'text': 'Error: API 未配置，请在设置中填写供应商地址和 API Key。'})}\\n\\n"
+            yield sse_event({'text': 'Error: API 未配置，请在设置中填写供应商地址和 API Key。'})
             return
 
         try:
@@ -188,25 +253,16 @@ def run_inference():
                 {"role": "user", "content": user_input}
             ]
 
-            yield f"data: {json.dumps({'status': 'generating_text', 'text': ''})}\\n\\n"
-
-            accumulated_text = ""
-            for chunk_text in ai_client.chat_stream(messages, model=use_model):
-                accumulated_text += chunk_text
-                formatted_response = {
-                    "output": {
-                        "choices": [
-                            {
-                                "message": {
-                                    "content": [
-                                        {"text": chunk_text}
-                                    ]
-                                }
-                            }
-                        ]
-                    }
-                }
-                yield f"data: {json.dumps(formatted_response)}\\n\\n"
+            yield sse_event({'status': 'generating_text', 'text': ''})
+
+            # 外层结构每个流只编码一次；细碎 token 按大小/时间阈值合并后发送
+            envelope = text_envelope()
+            accumulated = []
+            for chunk_text in coalesce(ai_client.chat_stream(messages, model=use_model),
+                                       SSE_COALESCE_CHARS, SSE_COALESCE_SEC):
+                accumulated.append(chunk_text)
+                yield envelope.encode(chunk_text)
+            accumulated_text = "".join(accumulated)
 
             # Save assistant message to Database after completely generated
             with app.app_context():
@@ -223,7 +279,7 @@ def run_inference():
 
         except Exception as e:
             print(f"ERROR: Chat inference failed: {e}")
-            yield f"data: {json.dumps({'text': f'Error: {str(e)}'})}\\n\\n"
+            yield sse_event({'text': f'Error: {str(e)}'})
 
     return Response(event_stream(), mimetype='text/event-stream')
 
@@ -259,6 +315,9 @@ def upload_media():
     # 保存文件
     filename = f"{session.get('user_id', 'anonymous')}_{file.filename}"
     filepath = os.path.join(UPLOAD_FOLDER, filename)
+    # 同名文件被覆盖时，关闭旧文件上的共享解码器并丢弃缓存帧
+    release_decoders(filepath)
+    frame_cache.invalidate(filepath)
     file.save(filepath)
     
     return jsonify({
@@ -268,121 +327,885 @@ def upload_media():
     })
 
 
+@app.route('/api/cache/frames', methods=['GET'])
+@login_required
+def frame_cache_stats():
+    """解码帧缓存命中统计"""
+    return jsonify(frame_cache.stats())
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus 抓取端点（不走登录会话，可用 METRICS_TOKEN 保护）"""
+    if METRICS_TOKEN and not secrets.compare_digest(request.headers.get('Authorization', ''),
+                                                    f"Bearer {METRICS_TOKEN}"):
+        return jsonify({'error': 'Unauthorized'}), 401
+    if not metrics_registry.enabled:
+        return jsonify({'error': '指标已禁用'}), 404
+    return Response(metrics_registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@app.route('/api/decode/pool', methods=['GET'])
+@login_required
+def decode_pool_stats():
+    """解码进程池的队列与各工作进程统计"""
+    return jsonify(decode_pool.stats())
+
+
+@app.route('/api/cache/sam3', methods=['GET', 'DELETE'])
+@login_required
+def sam3_cache_stats():
+    """SAM 3 结果缓存统计；DELETE 清空缓存"""
+    if request.method == 'DELETE':
+        sam3_cache.clear()
+    return jsonify(sam3_cache.stats())
+
+
+@app.route('/api/cache/vision', methods=['GET', 'DELETE'])
+@login_required
+def vision_cache_stats():
+    """视觉模型响应缓存统计；DELETE 清空缓存"""
+    if request.method == 'DELETE':
+        vision_cache.clear()
+    return jsonify(vision_cache.stats())
+
+
+# 远程服务配置指纹的探测结果 (时间, 配置或 None)，短时间内复用，避免每次查缓存都请求 /health
+_remote_sam3_config = {"checked_at": 0.0, "config": None}
+REMOTE_CONFIG_TTL_SEC = 30
+
+
+def _expected_sam3_config(options: dict) -> dict:
+    """
+    本次分析实际会使用的预测器配置指纹（缓存键的一部分）：
+    本地推理取本地预测器；远程服务取其 /health 返回的配置，服务不可用时会回退到本地 Mock，取 Mock 的配置。
+    """
+    local = sam3_predictor.config_fingerprint(**options)
+    if SAM3_LOCAL:
+        return local
+
+    now = time.time()
+    if now - _remote_sam3_config["checked_at"] > REMOTE_CONFIG_TTL_SEC:
+        import requests as req
+        remote = None
+        try:
+            health = req.get(f"{SAM3_SERVICE_URL}/health", timeout=5)
+            if health.status_code == 200:
+                remote = health.json().get("config")
+        except (req.ConnectionError, req.Timeout, ValueError):
+            pass
+        _remote_sam3_config.update(checked_at=now, config=remote)
+
+    remote = _remote_sam3_config["config"]
+    if remote is None:
+        return local
+    # 服务返回的是默认推理参数下的指纹，替换为本次请求的推理参数
+    return {**remote, **{k: local[k] for k in ("frame_stride", "downscale", "roi")}}
+
+
+@contextmanager
+def _lookup_sam3_cache(video_path: str, config: dict):
+    """with _lookup_sam3_cache(...) as cached: 命中时 cached 为缓存条目，with 块内其轨迹文件不会被淘汰"""
+    if not sam3_cache.enabled:
+        yield None
+        return
+    with sam3_cache.checkout(cache_key(file_sha256(video_path), config)) as cached:
+        yield cached
+
+
+def _store_sam3_cache(video_path: str, result: dict, tracks: dict = None):
+    """按结果中记录的实际配置写入缓存；旧版远程服务的结果没有 predictor_config，不缓存。"""
+    config = result.get("predictor_config")
+    if not sam3_cache.enabled or config is None:
+        return
+    sha256 = file_sha256(video_path)
+    sam3_cache.put(cache_key(sha256, config), sha256, config, result, tracks)
+
+
+def _publish_sam3_result(video_name: str, result: dict, tracks: dict = None, tracks_file: str = None):
+    """
+    写出 {video}_sam3.json 与轨迹 .npz，供 QVQ / 标注接口等后续步骤读取。
+    tracks_file 来自缓存条目时，调用方需在 _lookup_sam3_cache 的 with 块内调用。
+    """
+    if tracks is not None:
+        save_tracks(tracks_path(UPLOAD_FOLDER, video_name), tracks)
+    elif tracks_file is not None:
+        tmp_path = f"{tracks_path(UPLOAD_FOLDER, video_name)}.{threading.get_ident()}.tmp"
+        shutil.copyfile(tracks_file, tmp_path)
+        os.replace(tmp_path, tracks_path(UPLOAD_FOLDER, video_name))
+    elif os.path.exists(tracks_path(UPLOAD_FOLDER, video_name)):
+        # 本次结果没有轨迹：删除上一次分析留下的轨迹，避免后续步骤读到过期数据
+        os.remove(tracks_path(UPLOAD_FOLDER, video_name))
+    result_path = os.path.join(UPLOAD_FOLDER, f"{video_name}_sam3.json")
+    with open(result_path, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False)
+
+
+def _observe_sam3_timings(result: dict, engine: str):
+    """把预测器结果中的分阶段耗时（推理、轨迹后处理、违停判定等）计入指标"""
+    for stage, seconds in result.get("timings", {}).items():
+        SAM3_STAGE_SECONDS.observe(seconds, stage=stage, engine=engine)
+
+
+def _local_sam3_engine() -> str:
+    return "mock" if sam3_predictor.use_mock else "local"
+
+
+def _remote_sam3_segment(video_path: str, options: dict, emit) -> dict:
+    """
+    在远程 SAM3 服务上分析视频：按内容哈希握手，服务端已有该视频时跳过上传。
+    视频可能在上传与分析之间被服务端按存储容量清理（POST 返回 404），此时重新上传并重试一次；
+    其他非 2xx 响应（参数错误等）返回 {"error": ...}，不作为分析结果发布。
+    """
+    import requests as req
+    sha256 = file_sha256(video_path)
+
+    def upload():
+        emit({"type": "status", "status": "sam3_upload", "text": "[SAM3]: 正在上传视频到远程服务..."})
+        with open(video_path, 'rb') as f:
+            # 以文件对象作为请求体，requests 分块流式发送，不整体读入内存
+            req.put(f"{SAM3_SERVICE_URL}/videos/{sha256}", data=f, timeout=300).raise_for_status()
+
+    if req.head(f"{SAM3_SERVICE_URL}/videos/{sha256}", timeout=10).status_code != 200:
+        upload()
+    for attempt in range(2):
+        resp = req.post(f"{SAM3_SERVICE_URL}/segment-video/{sha256}", json=options,
+                        params={"include_tracks": "true"}, timeout=300)
+        if resp.status_code != 404 or attempt == 1:
+            break
+        upload()
+    if not resp.ok:
+        try:
+            detail = resp.json().get("detail", "")
+        except ValueError:
+            detail = resp.text[:200]
+        return {"error": f"SAM3 服务返回 {resp.status_code}: {detail}"}
+    return resp.json()
+
+
+def _run_sam3_job(job, emit) -> dict:
+    """在任务队列工作线程中执行 SAM 3 分析（本地推理或远程服务），成功后保存结果文件供后续步骤使用。"""
+    video_path = job.video_path
+    with _lookup_sam3_cache(video_path, _expected_sam3_config(job.options)) as cached:
+        if cached is not None:
+            emit({"type": "status", "status": "sam3_cached", "text": "[SAM3]: 命中结果缓存，跳过推理"})
+            _publish_sam3_result(job.video_name, cached["result"], tracks_file=cached["tracks_path"])
+            return cached["result"]
+
+    # 逐帧进度 -> 节流后的 progress 事件（含帧/秒与预计剩余时间）
+    on_progress = ProgressMeter(emit)
+
+    engine = "remote"
+
+    def fallback():
+        nonlocal engine
+        emit({"type": "status", "status": "sam3_fallback", "text": "[SAM3]: 远程服务不可用，使用本地 Mock 模式"})
+        engine = _local_sam3_engine()
+        return sam3_predictor.process_video(video_path, progress_callback=on_progress,
+                                            return_tracks=True, **job.options)
+
+    if SAM3_LOCAL:
+        engine = _local_sam3_engine()
+        result = sam3_predictor.process_video(video_path, progress_callback=on_progress,
+                                              return_tracks=True, **job.options)
+    else:
+        import requests as req
+        try:
+            health = req.get(f"{SAM3_SERVICE_URL}/health", timeout=5)
+            if health.status_code == 200:
+                result = _remote_sam3_segment(video_path, job.options, emit)
+            else:
+                result = fallback()
+        except (req.ConnectionError, req.Timeout):
+            result = fallback()
+
+    if "error" not in result:
+        _observe_sam3_timings(result, engine)
+        # 逐帧轨迹单独存为 .npz，结果 JSON 只保留每辆车的判定
+        tracks = result.pop("tracks", None)
+        _publish_sam3_result(job.video_name, result, tracks=tracks)
+        _store_sam3_cache(video_path, result, tracks)
+    return result
+
+
+sam3_jobs = SAM3JobQueue(
+    _run_sam3_job,
+    results_dir=os.path.join(UPLOAD_FOLDER, 'jobs'),
+    workers=int(config.get("SAM3_JOB_WORKERS", "1")),
+)
+
+# SAM 3 结果缓存：按视频内容哈希 + 预测器配置寻址，重复分析同一视频直接复用结果（容量 MB，0 为禁用）
+sam3_cache = SAM3ResultCache(
+    os.path.join(UPLOAD_FOLDER, 'sam3_cache'),
+    max_bytes=int(config.get("SAM3_CACHE_MB", "512")) * 1024 * 1024,
+)
+
+
+# 实时流分析：每路流占用一个工作线程，直到流结束（空闲超时）或被停止
+STREAM_WINDOW_SEC = float(config.get("STREAM_WINDOW_SEC", "2.0"))
+STREAM_IDLE_TIMEOUT_SEC = float(config.get("STREAM_IDLE_TIMEOUT_SEC", "10"))
+# 未结束（排队或运行中）流任务的停止信号 job_id -> threading.Event，提交时创建，任务结束时移除
+_stream_stops = {}
+
+# 流地址由服务器去连接，需防止被用来访问内网服务（SSRF）：只接受 RTSP / RTMP，且主机须在 STREAM_ALLOWED_HOSTS 中。
+# STREAM_ALLOWED_HOSTS 为逗号分隔的主机名、IP 或网段（如 "cam1.local,10.0.8.0/24"），"*" 表示任意主机；
+# 为空时不接受流地址，只能分析上传目录内的录像文件
+STREAM_ALLOWED_SCHEMES = ("rtsp", "rtsps", "rtmp", "rtmps")
+
+
+def _parse_stream_allowlist(value: str) -> tuple:
+    """逗号分隔的允许列表 -> (主机名集合, IP 网段列表)"""
+    hosts, networks = set(), []
+    for entry in value.split(","):
+        entry = entry.strip().lower()
+        if not entry:
+            continue
+        try:
+            networks.append(ipaddress.ip_network(entry, strict=False))
+        except ValueError:
+            hosts.add(entry)
+    return hosts, networks
+
+
+STREAM_ALLOWED_HOSTS, STREAM_ALLOWED_NETWORKS = _parse_stream_allowlist(config.get("STREAM_ALLOWED_HOSTS", ""))
+
+
+def _stream_url_error(url: str) -> str | None:
+    """流地址不允许时返回错误信息；IP 只匹配地址本身写成 IP 的 URL，主机名不做解析"""
+    parsed = urlsplit(url)
+    if parsed.scheme.lower() not in STREAM_ALLOWED_SCHEMES:
+        return f'不支持的流协议 {parsed.scheme}，仅支持 rtsp / rtmp'
+    host = (parsed.hostname or '').lower()
+    if not host:
+        return '流地址缺少主机名'
+    if '*' in STREAM_ALLOWED_HOSTS or host in STREAM_ALLOWED_HOSTS:
+        return None
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        address = None
+    if address is not None and any(address in network for network in STREAM_ALLOWED_NETWORKS):
+        return None
+    return f'流地址的主机 {host} 不在允许列表（STREAM_ALLOWED_HOSTS）中'
+
+
+def _run_stream_job(job, emit) -> dict:
+    """
+    在流任务工作线程中增量分析实时流（本地预测器；未启用本地推理时为 Mock 模式）。
+    违停事件一经判定立即追加到任务事件日志，结束时返回流概要与全部违停事件。
+    """
+    stop = _stream_stops.setdefault(job.id, threading.Event())
+    violations, windows, inference_sec = [], 0, 0.0
+    info = {}
+    try:
+        # 排队期间已被停止：不再打开流，直接返回空概要
+        events = () if stop.is_set() else sam3_predictor.process_stream(
+            job.video_path, stop_event=stop, idle_timeout_sec=STREAM_IDLE_TIMEOUT_SEC, **job.options)
+        for event in events:
+            kind = event["type"]
+            if kind == "error":
+                return {"error": event["error"]}
+            if kind == "stream_info":
+                info = event
+                emit(event)
+            elif kind == "window":
+                # 窗口事件只计入统计，不写入事件日志，避免长时间运行的流撑大日志
+                windows += 1
+                inference_sec += event["inference_sec"]
+                SAM3_STAGE_SECONDS.observe(event["inference_sec"], stage="stream_window",
+                                           engine=_local_sam3_engine())
+            elif kind == "violation":
+                violations.append(event)
+                emit(event)
+            elif kind == "end":
+                info = {**info, **event}
+    finally:
+        _stream_stops.pop(job.id, None)
+    return {
+        "source": job.video_name,
+        "fps": info.get("fps"),
+        "frames": info.get("frames", 0),
+        "duration_sec": info.get("duration_sec", 0),
+        "stopped": stop.is_set(),
+        "windows": windows,
+        "avg_window_inference_sec": round(inference_sec / windows, 4) if windows else 0.0,
+        "violations": violations,
+    }
+
+
+stream_jobs = SAM3JobQueue(
+    _run_stream_job,
+    results_dir=os.path.join(UPLOAD_FOLDER, 'streams'),
+    workers=int(config.get("STREAM_WORKERS", "2")),
+)
+
+
+def _sam3_summary_response(result: dict) -> dict:
+    """把 SAM 3 结果整理为前端使用的 Markdown 摘要响应"""
+    violations = [v for v in result["vehicles"] if v.get("is_violation")]
+    non_violations = [v for v in result["vehicles"] if not v.get("is_violation")]
+
+    summary_lines = [
+        f"## SAM 3 车辆追踪分析结果\\n",
+        f"- 视频时长: {result['duration_sec']}s ({result['total_frames']} 帧, {result['fps']:.1f} FPS)",
+        f"- 检测车辆数: {len(result['vehicles'])}",
+        f"- 违停车辆数: {len(violations)}\\n",
+    ]
+
+    if violations:
+        summary_lines.append("### 违停车辆\\n")
+        for v in violations:
+            summary_lines.append(
+                f"- **车辆 {v['track_id']}** (类型: {v['class']}): "
+                f"{v.get('violation_reason', '违停')}"
+            )
+
+    if non_violations:
+        summary_lines.append("\\n### 正常行驶车辆\\n")
+        for v in non_violations:
+            summary_lines.append(
+                f"- 车辆 {v['track_id']} (类型: {v['class']}): 正常行驶"
+            )
+
+    summary_text = "\\n".join(summary_lines)
+
+    return {
+        "output": {
+            "choices": [{
+                "message": {
+                    "content": [{"text": summary_text}]
+                }
+            }]
+        },
+        "sam3_data": result
+    }
+
+
+@app.route('/api/videos/<path:video_name>/annotations', methods=['GET'])
+@login_required
+def get_video_annotations(video_name):
+    """
+    按帧区间 [start, end) 读取已保存的 SAM 3 逐帧标注。
+    sample_fps 指定采样率（默认全部帧）；format=delta 时返回差分编码的批量格式（单个批次）。
+    """
+    columns = load_tracks(tracks_path(UPLOAD_FOLDER, video_name))
+    if columns is None:
+        return jsonify({'error': '该视频尚无 SAM 3 轨迹数据'}), 404
+
+    result_path = os.path.join(UPLOAD_FOLDER, f"{video_name}_sam3.json")
+    vehicles, fps = [], request.args.get('fps', 0, type=float)
+    if os.path.exists(result_path):
+        with open(result_path, 'r', encoding='utf-8') as f:
+            sam3_result = json.load(f)
+        vehicles, fps = sam3_result.get("vehicles", []), sam3_result.get("fps", fps)
+
+    start = request.args.get('start', 0, type=int)
+    end = request.args.get('end', None, type=int)
+    step = _annotation_step(fps, request.args.get('sample_fps', None, type=float))
+    if request.args.get('format') == 'delta':
+        frame_index = columns["frame_index"]
+        span_end = end if end is not None else (int(frame_index[-1]) + 1 if len(frame_index) else start)
+        batch = next(annotation_batches(columns, vehicles, fps, start, end, step,
+                                        window=max(1, span_end - start)), None)
+        if batch is None:
+            batch = {'fps': fps, 'start': start, 'end': end, 'quant': ANNOTATION_QUANT, 'tracks': {}, 'frames': []}
+        return jsonify({'video': video_name, 'format': 'delta', **batch})
+    frames = list(frame_annotations(sample_frames(slice_frames(columns, start, end), step), vehicles, fps))
+    return jsonify({'video': video_name, 'fps': fps, 'start': start, 'end': end, 'frames': frames})
+
+
+def _annotation_step(fps: float, sample_fps: float | None) -> int:
+    """客户端请求的标注采样率换算为帧步长"""
+    if not sample_fps or sample_fps <= 0 or not fps:
+        return 1
+    return max(1, int(round(fps / sample_fps)))
+
+
+def _parse_annotation_options(data: dict) -> tuple:
+    """
+    Agent 请求中的帧标注参数：annotation_format（batch / frame）、annotation_start / annotation_end（帧区间）、
+    annotation_fps（采样率）、annotation_window（每批帧数）。返回 (options, error)。
+    """
+    options = {'format': data.get('annotation_format', 'batch')}
+    if options['format'] not in ('batch', 'frame'):
+        return None, 'annotation_format 只能为 batch 或 frame'
+    try:
+        options['start'] = int(data.get('annotation_start', 0))
+        end = data.get('annotation_end')
+        options['end'] = int(end) if end is not None else None
+        sample_fps = data.get('annotation_fps')
+        options['fps'] = float(sample_fps) if sample_fps else None
+        options['window'] = int(data.get('annotation_window', ANNOTATION_WINDOW_FRAMES))
+    except (TypeError, ValueError):
+        return None, '帧标注参数格式错误'
+    if options['start'] < 0 or (options['end'] is not None and options['end'] <= options['start']):
+        return None, '帧标注区间无效'
+    if options['fps'] is not None and not options['fps'] > 0:
+        return None, 'annotation_fps 必须大于 0'
+    if options['window'] < 1:
+        return None, 'annotation_window 必须大于 0'
+    return options, None
+
+
+def _sam3_job_stream(job_id: str, since: int = 0):
+    """
+    将任务事件转换为 /api/analyze/sam3 的 SSE 格式。
+    每条消息带 job_id 和 seq，断线后可通过 /api/jobs/<job_id>/events?since=<seq+1> 继续订阅。
+    """
+    for event in sam3_jobs.iter_events(job_id, since=since):
+        if event is None:
+            yield ": keepalive\n\n"
+            continue
+
+        meta = {'job_id': job_id, 'seq': event['seq']}
+        kind = event["type"]
+        if kind == "queued":
+            yield sse_event({**meta, 'status': 'sam3_queued', 'text': f'[SAM3]: 任务已提交 ({job_id})'})
+        elif kind == "started":
+            yield sse_event({**meta, 'status': 'sam3_started', 'text': '[SAM3]: 开始推理'})
+        elif kind == "progress":
+            pct = event["percent"]
+            text = f'[SAM3]: 推理进度 {pct}%'
+            if event.get("prompt"):
+                text += f' [{event["prompt"]}]'
+            if event.get("fps"):
+                text += f' ({event["fps"]} 帧/秒'
+                text += f', 预计剩余 {event["eta_sec"]}s)' if event.get("eta_sec") is not None else ')'
+            progress_msg = {
+                **meta, 'status': 'sam3_progress', 'progress': pct, 'text': text,
+                'current': event.get('current'), 'total': event.get('total'), 'prompt': event.get('prompt'),
+                'fps': event.get('fps'), 'eta_sec': event.get('eta_sec'), 'elapsed_sec': event.get('elapsed_sec'),
+            }
+            yield sse_event(progress_msg)
+        elif kind == "status":
+            yield sse_event({**meta, 'status': event['status'], 'text': event['text']})
+        elif kind == "failed":
+            yield sse_event({**meta, 'error': event.get('error') or 'SAM 3 分析失败'})
+        elif kind == "done":
+            result = sam3_jobs.get(job_id).result
+            vehicle_count = len(result["vehicles"])
+            yield sse_event({**meta, 'status': 'sam3_tracking', 'text': f'[SAM3]: 追踪完成，检测到 {vehicle_count} 辆车辆'})
+            yield sse_event({**_sam3_summary_response(result), **meta})
+
+
+def _parse_camera_settings(data: dict) -> tuple:
+    """校验摄像头推理参数，返回 (settings, error)；只包含请求中出现的字段"""
+    settings = {}
+    try:
+        if 'frame_stride' in data:
+            settings['frame_stride'] = int(data['frame_stride'])
+            if settings['frame_stride'] < 1:
+                return None, 'frame_stride 必须 >= 1'
+        if 'downscale' in data:
+            settings['downscale'] = float(data['downscale'])
+            if not 0 < settings['downscale'] <= 1:
+                return None, 'downscale 必须在 (0, 1] 范围内'
+        if 'roi' in data:
+            roi = data['roi']
+            if roi is not None:
+                roi = [[float(x), float(y)] for x, y in roi]
+                if len(roi) < 3:
+                    return None, 'roi 多边形至少需要 3 个顶点'
+            settings['roi'] = roi
+    except (TypeError, ValueError):
+        return None, '摄像头参数格式错误'
+    return settings, None
+
+
+def _visible_camera(camera_id) -> CameraProfile | None:
+    """当前用户可见的摄像头配置：自己创建的，或没有所有者的旧配置（只读共享）"""
+    profile = db.session.get(CameraProfile, camera_id)
+    if profile is None or profile.user_id not in (session.get('user_id'), None):
+        return None
+    return profile
+
+
+def _resolve_sam3_options(data: dict) -> tuple:
+    """
+    确定一次分析的推理参数：.env 默认值 <- camera_id 对应的摄像头配置 <- 请求中显式给出的字段。
+    返回 (options, error)。
+    """
+    options = {'frame_stride': SAM3_FRAME_STRIDE, 'downscale': SAM3_DOWNSCALE, 'roi': None}
+    camera_id = data.get('camera_id')
+    if camera_id is not None:
+        profile = _visible_camera(camera_id)
+        if profile is None:
+            return None, f'摄像头配置不存在: {camera_id}'
+        options.update(profile.inference_options())
+    overrides, error = _parse_camera_settings(data)
+    if error:
+        return None, error
+    options.update(overrides)
+    return options, None
+
+
+# 任务优先级（越大越先执行）只允许在小范围内调整，避免个别用户把自己的任务排到所有人之前
+MAX_JOB_PRIORITY = int(config.get("MAX_JOB_PRIORITY", "10"))
+
+
+def _parse_priority(data: dict) -> tuple:
+    """解析请求中的 priority，截断到 [0, MAX_JOB_PRIORITY]；返回 (priority, error)"""
+    try:
+        priority = int(data.get('priority', 0))
+    except (TypeError, ValueError):
+        return None, 'priority 必须为整数'
+    return min(max(priority, 0), MAX_JOB_PRIORITY), None
+
+
+def _apply_camera_settings(profile: CameraProfile, settings: dict):
+    if 'frame_stride' in settings:
+        profile.frame_stride = settings['frame_stride']
+    if 'downscale' in settings:
+        profile.downscale = settings['downscale']
+    if 'roi' in settings:
+        profile.roi = json.dumps(settings['roi']) if settings['roi'] is not None else None
+
+
+@app.route('/api/cameras', methods=['GET', 'POST', 'OPTIONS'])
+@login_required
+def handle_cameras():
+    """列出（自己的与共享的）或创建摄像头推理配置"""
+    if request.method == 'OPTIONS':
+        return '', 204
+
+    user_id = session.get('user_id')
+    if request.method == 'GET':
+        profiles = CameraProfile.query.filter(
+            (CameraProfile.user_id == user_id) | CameraProfile.user_id.is_(None)
+        ).order_by(CameraProfile.name).all()
+        return jsonify([p.to_dict() for p in profiles])
+
+    data = request.get_json() or {}
+    name = (data.get('name') or '').strip()
+    if not name:
+        return jsonify({'error': '摄像头名称不能为空'}), 400
+    if CameraProfile.query.filter_by(user_id=user_id, name=name).first():
+        return jsonify({'error': f'摄像头名称已存在: {name}'}), 409
+    settings, error = _parse_camera_settings(data)
+    if error:
+        return jsonify({'error': error}), 400
+
+    profile = CameraProfile(user_id=user_id, name=name)
+    _apply_camera_settings(profile, settings)
+    db.session.add(profile)
+    db.session.commit()
+    return jsonify(profile.to_dict()), 201
+
+
+@app.route('/api/cameras/<int:camera_id>', methods=['GET', 'PUT', 'DELETE', 'OPTIONS'])
+@login_required
+def handle_camera(camera_id):
+    """获取、更新或删除单个摄像头推理配置（只能修改自己创建的配置）"""
+    if request.method == 'OPTIONS':
+        return '', 204
+
+    user_id = session.get('user_id')
+    profile = _visible_camera(camera_id)
+    if profile is None:
+        return jsonify({'error': 'Camera not found'}), 404
+
+    if request.method == 'GET':
+        return jsonify(profile.to_dict())
+    if profile.user_id != user_id:
+        return jsonify({'error': '共享的摄像头配置为只读'}), 403
+
+    if request.method == 'DELETE':
+        db.session.delete(profile)
+        db.session.commit()
+        return jsonify({'message': 'Camera deleted'}), 200
+
+    data = request.get_json() or {}
+    settings, error = _parse_camera_settings(data)
+    if error:
+        return jsonify({'error': error}), 400
+    name = (data.get('name') or '').strip()
+    if name and name != profile.name:
+        if CameraProfile.query.filter_by(user_id=user_id, name=name).first():
+            return jsonify({'error': f'摄像头名称已存在: {name}'}), 409
+        profile.name = name
+    _apply_camera_settings(profile, settings)
+    db.session.commit()
+    return jsonify(profile.to_dict())
+
+
 @app.route('/api/analyze/sam3', methods=['POST', 'OPTIONS'])
 @login_required
 def analyze_sam3():
-    """SAM 3 车辆分割追踪 + 违停判定"""
+    """SAM 3 车辆分割追踪 + 违停判定（通过任务队列执行，客户端断开不会中断推理）"""
     if request.method == 'OPTIONS':
         return '', 204
 
     data = request.get_json()
     video_name = data.get('video', '')
+    priority, priority_error = _parse_priority(data)
+    if priority_error:
+        return jsonify({'error': priority_error}), 400
+    options, error = _resolve_sam3_options(data)
+    user_id = session.get('user_id')
 
     print(f"DEBUG: SAM 3 analysis requested for video: {video_name}")
 
     def event_stream():
+        if error:
+            yield sse_event({'error': error})
+            return
+
         video_path = os.path.join(UPLOAD_FOLDER, video_name)
         if not os.path.exists(video_path):
-            yield f"data: {json.dumps({'error': f'视频文件不存在: {video_name}'})}\\n\\n"
+            yield sse_event({'error': f'视频文件不存在: {video_name}'})
             return
 
         info = get_video_info(video_path)
         if not info:
-            yield f"data: {json.dumps({'error': '无法读取视频文件'})}\\n\\n"
+            yield sse_event({'error': '无法读取视频文件'})
             return
 
         init_msg = f'[SAM3]: 正在初始化模型... 视频时长 {info["duration_sec"]}s, {info["total_frames"]} 帧'
-        yield f"data: {json.dumps({'status': 'sam3_init', 'text': init_msg})}\\n\\n"
+        yield sse_event({'status': 'sam3_init', 'text': init_msg})
+
+        # 同一视频 + 同一配置已分析过：直接返回缓存结果，不进入任务队列
+        with _lookup_sam3_cache(video_path, _expected_sam3_config(options)) as cached:
+            if cached is not None:
+                _publish_sam3_result(video_name, cached["result"], tracks_file=cached["tracks_path"])
+        if cached is not None:
+            result = cached["result"]
+            yield sse_event({'status': 'sam3_cached', 'text': '[SAM3]: 命中结果缓存，跳过推理'})
+            yield sse_event({'status': 'sam3_tracking', 'text': f'[SAM3]: 追踪完成，检测到 {len(result["vehicles"])} 辆车辆'})
+            yield sse_event({**_sam3_summary_response(result), 'cached': True})
+            return
 
-        progress_state = {"last_reported": 0}
-        progress_events = []
+        job = sam3_jobs.submit(video_name, video_path, priority=priority, options=options, owner=user_id)
+        yield from _sam3_job_stream(job.id)
 
-        def on_progress(current, total):
-            pct = int(current / total * 100) if total > 0 else 0
-            if pct - progress_state["last_reported"] >= 10:
-                progress_state["last_reported"] = pct
-                progress_events.append(pct)
+    return Response(event_stream(), mimetype='text/event-stream')
 
-        try:
-            if SAM3_LOCAL:
-                result = sam3_predictor.process_video(video_path, progress_callback=on_progress)
-            else:
-                import requests as req
-                try:
-                    health = req.get(f"{SAM3_SERVICE_URL}/health", timeout=5)
-                    if health.status_code == 200:
-                        with open(video_path, 'rb') as f:
-                            resp = req.post(
-                                f"{SAM3_SERVICE_URL}/segment-video",
-                                files={'video': (video_name, f)},
-                                timeout=300
-                            )
-                        result = resp.json()
-                    else:
-                        yield f"data: {json.dumps({'status': 'sam3_fallback', 'text': '[SAM3]: 远程服务不可用，使用本地 Mock 模式'})}\\n\\n"
-                        result = sam3_predictor.process_video(video_path, progress_callback=on_progress)
-                except (req.ConnectionError, req.Timeout):
-                    yield f"data: {json.dumps({'status': 'sam3_fallback', 'text': '[SAM3]: 远程服务不可用，使用本地 Mock 模式'})}\\n\\n"
-                    result = sam3_predictor.process_video(video_path, progress_callback=on_progress)
-
-            if "error" in result:
-                yield f"data: {json.dumps({'error': result['error']})}\\n\\n"
-                return
 
-            vehicle_count = len(result["vehicles"])
-            yield f"data: {json.dumps({'status': 'sam3_tracking', 'text': f'[SAM3]: 追踪完成，检测到 {vehicle_count} 辆车辆'})}\\n\\n"
+@app.route('/api/jobs/sam3', methods=['POST', 'OPTIONS'])
+@login_required
+def submit_sam3_job():
+    """提交 SAM 3 分析任务，立即返回任务 ID"""
+    if request.method == 'OPTIONS':
+        return '', 204
+
+    data = request.get_json() or {}
+    video_name = data.get('video', '')
+    video_path = os.path.join(UPLOAD_FOLDER, video_name)
+    if not video_name or not os.path.exists(video_path):
+        return jsonify({'error': f'视频文件不存在: {video_name}'}), 404
+    options, error = _resolve_sam3_options(data)
+    if error:
+        return jsonify({'error': error}), 400
+    priority, error = _parse_priority(data)
+    if error:
+        return jsonify({'error': error}), 400
+
+    job = sam3_jobs.submit(video_name, video_path, priority=priority, options=options,
+                           owner=session.get('user_id'))
+    return jsonify(job.to_dict(include_result=False)), 202
+
+
+@app.route('/api/jobs/metrics', methods=['GET'])
+@login_required
+def sam3_job_metrics():
+    """任务队列深度与等待/执行耗时统计"""
+    return jsonify(sam3_jobs.metrics())
 
-            # Build human-readable summary
-            violations = [v for v in result["vehicles"] if v.get("is_violation")]
-            non_violations = [v for v in result["vehicles"] if not v.get("is_violation")]
 
-            summary_lines = [
-                f"## SAM 3 车辆追踪分析结果\\n",
-                f"- 视频时长: {result['duration_sec']}s ({result['total_frames']} 帧, {result['fps']:.1f} FPS)",
-                f"- 检测车辆数: {len(result['vehicles'])}",
-                f"- 违停车辆数: {len(violations)}\\n",
-            ]
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+@login_required
+def get_sam3_job(job_id):
+    """轮询任务状态（完成后包含结果）"""
+    job = sam3_jobs.get(job_id, owner=session.get('user_id'))
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.to_dict(include_result=job.finished))
 
-            if violations:
-                summary_lines.append("### 违停车辆\\n")
-                for v in violations:
-                    summary_lines.append(
-                        f"- **车辆 {v['track_id']}** (类型: {v['class']}): "
-                        f"{v.get('violation_reason', '违停')}"
-                    )
 
-            if non_violations:
-                summary_lines.append("\\n### 正常行驶车辆\\n")
-                for v in non_violations:
-                    summary_lines.append(
-                        f"- 车辆 {v['track_id']} (类型: {v['class']}): 正常行驶"
-                    )
+@app.route('/api/jobs/<job_id>/events', methods=['GET'])
+@login_required
+def stream_sam3_job(job_id):
+    """订阅任务进度（SSE），since 为起始事件序号，用于断线重连"""
+    if sam3_jobs.get(job_id, owner=session.get('user_id')) is None:
+        return jsonify({'error': 'Job not found'}), 404
+    since = request.args.get('since', 0, type=int)
+    return Response(_sam3_job_stream(job_id, since), mimetype='text/event-stream')
+
+
+def _stream_job_events(job_id: str, since: int = 0):
+    """将流任务事件转换为 SSE；违停事件在判定后立即推送"""
+    for event in stream_jobs.iter_events(job_id, since=since):
+        if event is None:
+            yield ": keepalive\n\n"
+            continue
+
+        meta = {'job_id': job_id, 'seq': event['seq']}
+        kind = event["type"]
+        if kind == "queued":
+            yield sse_event({**meta, 'status': 'stream_queued', 'text': f'[Stream]: 任务已提交 ({job_id})'})
+        elif kind == "stream_info":
+            text = f'[Stream]: 已连接视频流 {event["width"]}x{event["height"]} @ {event["fps"]:.1f} FPS'
+            yield sse_event({**meta, 'status': 'stream_started', 'text': text})
+        elif kind == "violation":
+            text = f'[Stream]: 车辆 {event["track_id"]} (类型: {event["class"]}) 违停：{event["violation_reason"]}'
+            yield sse_event({**meta, 'status': 'stream_violation', 'text': text, 'violation': event})
+        elif kind == "failed":
+            yield sse_event({**meta, 'error': event.get('error') or '视频流分析失败'})
+        elif kind == "done":
+            result = stream_jobs.get(job_id).result
+            text = f'[Stream]: 视频流结束，共 {result["duration_sec"]}s，检测到 {len(result["violations"])} 起违停'
+            yield sse_event({**meta, 'status': 'stream_done', 'text': text, 'stream_data': result})
+
+
+@app.route('/api/streams', methods=['POST', 'OPTIONS'])
+@login_required
+def start_stream():
+    """
+    开始分析实时流：source 为流地址（rtsp:// 或 rtmp://，主机须在 STREAM_ALLOWED_HOSTS 中）
+    或上传目录中仍在写入的录像文件名（如 MPEG-TS）。
+    推理参数与 /api/analyze/sam3 相同（camera_id / frame_stride / downscale / roi），另可指定 window_sec。
+    """
+    if request.method == 'OPTIONS':
+        return '', 204
 
-            summary_text = "\\n".join(summary_lines)
+    data = request.get_json() or {}
+    source = str(data.get('source', '')).strip()
+    if not source:
+        return jsonify({'error': '缺少 source 参数'}), 400
+    if not is_stream_url(source):
+        # 本地文件只允许上传目录内的文件（文件可以尚未生成，打开时会等待）
+        path = os.path.realpath(os.path.join(UPLOAD_FOLDER, source))
+        if not path.startswith(os.path.realpath(UPLOAD_FOLDER) + os.sep):
+            return jsonify({'error': '无效的文件路径'}), 400
+        source_path = path
+    else:
+        error = _stream_url_error(source)
+        if error:
+            return jsonify({'error': error}), 400
+        source_path = source
+
+    options, error = _resolve_sam3_options(data)
+    if error:
+        return jsonify({'error': error}), 400
+    try:
+        options['window_sec'] = float(data.get('window_sec', STREAM_WINDOW_SEC))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'window_sec 格式错误'}), 400
+    if options['window_sec'] <= 0:
+        return jsonify({'error': 'window_sec 必须大于 0'}), 400
+    priority, error = _parse_priority(data)
+    if error:
+        return jsonify({'error': error}), 400
+
+    job = stream_jobs.submit(source, source_path, priority=priority, options=options,
+                             owner=session.get('user_id'))
+    # 停止信号随提交创建，排队中的流也能被停止（复用已有任务时沿用其信号）
+    _stream_stops.setdefault(job.id, threading.Event())
+    if job.finished:
+        _stream_stops.pop(job.id, None)
+    return jsonify(job.to_dict(include_result=False)), 202
+
+
+@app.route('/api/streams/<job_id>', methods=['GET'])
+@login_required
+def get_stream(job_id):
+    """流任务状态（结束后包含结果）"""
+    job = stream_jobs.get(job_id, owner=session.get('user_id'))
+    if job is None:
+        return jsonify({'error': 'Stream not found'}), 404
+    return jsonify(job.to_dict(include_result=job.finished))
 
-            # Stream the summary text
-            formatted_response = {
-                "output": {
-                    "choices": [{
-                        "message": {
-                            "content": [{"text": summary_text}]
-                        }
-                    }]
-                },
-                "sam3_data": result
-            }
-            yield f"data: {json.dumps(formatted_response)}\\n\\n"
 
-            # Save SAM 3 results to file for downstream steps
-            result_path = os.path.join(UPLOAD_FOLDER, f"{video_name}_sam3.json")
-            with open(result_path, 'w', encoding='utf-8') as f:
-                json.dump(result, f, ensure_ascii=False)
+@app.route('/api/streams/<job_id>/events', methods=['GET'])
+@login_required
+def stream_events(job_id):
+    """订阅流任务事件（SSE），since 为起始事件序号，用于断线重连"""
+    if stream_jobs.get(job_id, owner=session.get('user_id')) is None:
+        return jsonify({'error': 'Stream not found'}), 404
+    since = request.args.get('since', 0, type=int)
+    return Response(_stream_job_events(job_id, since), mimetype='text/event-stream')
+
+
+@app.route('/api/streams/<job_id>/stop', methods=['POST'])
+@login_required
+def stop_stream(job_id):
+    """停止排队中或正在运行的流任务（排队中的不再开始，运行中的在当前窗口处理完后结束）"""
+    stop = _stream_stops.get(job_id)
+    job = stream_jobs.get(job_id, owner=session.get('user_id'))
+    if stop is None or job is None or job.finished:
+        return jsonify({'error': '流任务未在运行'}), 404
+    stop.set()
+    return jsonify({'job_id': job_id, 'stopping': True})
+
+
+PLATE_UNREADABLE = "无法识别"
+PLATE_PROMPT = f"请识别这张图片中车辆的车牌号。只输出车牌号，如果无法识别请输出'{PLATE_UNREADABLE}'。"
+
+
+def _plate_cacheable(plate) -> bool:
+    """只缓存识别成功的车牌；失败或'无法识别'下次重新请求（换帧、换模型后可能识别出来）"""
+    return isinstance(plate, str) and bool(plate.strip()) and PLATE_UNREADABLE not in plate
 
+
+def _recognize_plate(img_base64: str) -> str:
+    messages = [{
+        "role": "user",
+        "content": [
+            {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{img_base64}"}},
+            {"type": "text", "text": PLATE_PROMPT}
+        ]
+    }]
+    return ai_client.vision_chat(messages, model=VISION_MODEL).strip()
+
+
+def _recognize_plate_batch(images: list) -> list:
+    """
+    识别一组裁剪图的车牌，返回与 images 等长的列表（车牌字符串或 Exception）。
+    视觉缓存按裁剪图内容精确匹配（content_key，不用感知哈希：车牌字符不影响 dHash），
+    命中的图片不再请求模型；其余图片多张时打包成一次多图请求，若模型输出行数与图片数不符，则退回逐张识别。
+    """
+    keys = [content_key(b64) for b64 in images]
+    results = [None] * len(images)
+    pending = []
+    for i, key in enumerate(keys):
+        cached = vision_cache.get_exact(VISION_MODEL, PLATE_PROMPT, key)
+        if cached is not None:
+            results[i] = cached
+        else:
+            pending.append(i)
+
+    for i, plate in zip(pending, _recognize_plates_uncached([images[i] for i in pending])):
+        results[i] = plate
+        if _plate_cacheable(plate):
+            vision_cache.put_exact(VISION_MODEL, PLATE_PROMPT, keys[i], plate)
+    return results
+
+
+def _recognize_plates_uncached(images: list) -> list:
+    if len(images) > 1:
+        content = [
+            {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{b64}"}}
+            for b64 in images
+        ]
+        content.append({"type": "text", "text": (
+            f"以上共 {len(images)} 张车辆图片。请按图片顺序识别每辆车的车牌号，"
+            f"每行只输出一个车牌号，共输出相同行数；无法识别的输出'{PLATE_UNREADABLE}'。"
+        )})
+        try:
+            text = ai_client.vision_chat([{"role": "user", "content": content}], model=VISION_MODEL)
+            lines = [re.sub(r'^\s*(?:图片?\s*)?\d+\s*[.、:：)]\s*', '', line).strip()
+                     for line in text.splitlines() if line.strip()]
+            if len(lines) == len(images):
+                return lines
         except Exception as e:
-            print(f"ERROR: SAM 3 analysis failed: {e}")
-            yield f"data: {json.dumps({'error': str(e)})}\\n\\n"
+            print(f"ERROR: Batched vision recognition failed, falling back to single requests: {e}")
 
-    return Response(event_stream(), mimetype='text/event-stream')
+    results = []
+    for b64 in images:
+        try:
+            results.append(_recognize_plate(b64))
+        except Exception as e:
+            results.append(e)
+    return results
 
 
 @app.route('/api/analyze/qvq', methods=['POST', 'OPTIONS'])
@@ -400,7 +1223,7 @@ def analyze_qvq():
 
     def event_stream():
         if not OPENAI_API_BASE or not OPENAI_API_KEY:
-            yield f"data: {json.dumps({'error': 'API 未配置，请在设置中填写供应商地址和 API Key。'})}\\n\\n"
+            yield sse_event({'error': 'API 未配置，请在设置中填写供应商地址和 API Key。'})
             return
 
         # Load SAM 3 results from file if not passed directly
@@ -412,7 +1235,7 @@ def analyze_qvq():
                     results = json.load(f)
 
         if not results or not results.get("vehicles"):
-            yield f"data: {json.dumps({'error': '未找到 SAM 3 分析结果，请先执行车辆追踪'})}\\n\\n"
+            yield sse_event({'error': '未找到 SAM 3 分析结果，请先执行车辆追踪'})
             return
 
         violations = [v for v in results["vehicles"] if v.get("is_violation")]
@@ -426,49 +1249,72 @@ def analyze_qvq():
                     }]
                 }
             }
-            yield f"data: {json.dumps(formatted_response)}\\n\\n"
+            yield sse_event(formatted_response)
             return
 
         video_path = os.path.join(UPLOAD_FOLDER, video_name)
-        all_plate_results = []
-
-        for v in violations:
-            track_id = v["track_id"]
-            frame_idx = v["best_frame_index"]
-            bbox = v["best_frame_bbox"]
+        plate_lines = {}
 
-            yield f"data: {json.dumps({'status': 'extracting', 'text': f'[Vision]: 正在提取车辆 {track_id} 的帧画面...'})}\\n\\n"
+        # 解码进程池一次顺序解码取出所有违停车辆的最佳帧，并在子进程内完成裁剪与 JPEG 编码
+        yield sse_event({'status': 'extracting', 'text': f'[Vision]: 正在提取 {len(violations)} 辆违停车辆的帧画面...'})
+        try:
+            encoded = decode_pool.crop_jpegs(video_path, [(v["best_frame_index"], v["best_frame_bbox"]) for v in violations])
+        except DecodePoolBusy:
+            yield sse_event({'error': '解码队列已满，请稍后重试'})
+            return
+        except BrokenProcessPool:
+            # 解码子进程连续崩溃（重试一次后仍失败），多半是视频本身无法解码
+            yield sse_event({'error': '解码进程异常退出，无法提取帧画面'})
+            return
 
-            frame = extract_frame(video_path, frame_idx)
-            if frame is None:
-                all_plate_results.append(f"- 车辆 {track_id}: 帧提取失败")
+        crops = []
+        for v, (status, b64, _) in zip(violations, encoded):
+            track_id = v["track_id"]
+            if status == "no_frame":
+                plate_lines[track_id] = f"- 车辆 {track_id}: 帧提取失败"
                 continue
-
-            cropped = crop_region(frame, bbox)
-            if cropped.size == 0:
-                all_plate_results.append(f"- 车辆 {track_id}: 裁剪区域无效")
+            if status == "empty":
+                plate_lines[track_id] = f"- 车辆 {track_id}: 裁剪区域无效"
                 continue
 
-            img_base64 = frame_to_base64(cropped)
+            crops.append((v, b64))
 
-            yield f"data: {json.dumps({'status': 'recognizing', 'text': f'[Vision]: 正在识别车辆 {track_id} 的车牌...'})}\\n\\n"
+        # 并发识别：每个任务是一张或多张（VISION_BATCH_SIZE）裁剪图，按完成顺序推送进度
+        batch_size = max(1, VISION_BATCH_SIZE)
+        batches = [crops[i:i + batch_size] for i in range(0, len(crops), batch_size)]
+        if batches:
+            yield sse_event({'status': 'recognizing', 'text': f'[Vision]: 正在并发识别 {len(crops)} 辆车辆的车牌...'})
 
+            pool = ThreadPoolExecutor(max_workers=max(1, min(VISION_CONCURRENCY, len(batches))))
             try:
-                messages = [{
-                    "role": "user",
-                    "content": [
-                        {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{img_base64}"}},
-                        {"type": "text", "text": "请识别这张图片中车辆的车牌号。只输出车牌号，如果无法识别请输出'无法识别'。"}
-                    ]
-                }]
-
-                plate_text = ai_client.vision_chat(messages, model=VISION_MODEL)
-
-                all_plate_results.append(f"- 车辆 {track_id} (类型: {v['class']}): {plate_text.strip()}")
-
-            except Exception as e:
-                print(f"ERROR: Vision recognition failed for track {track_id}: {e}")
-                all_plate_results.append(f"- 车辆 {track_id}: 识别出错 ({str(e)[:50]})")
+                futures = {
+                    pool.submit(_recognize_plate_batch, [b64 for _, b64 in batch]): batch
+                    for batch in batches
+                }
+                done_count = 0
+                for future in as_completed(futures):
+                    batch = futures[future]
+                    try:
+                        plates = future.result()
+                    except Exception as e:
+                        plates = [e] * len(batch)
+
+                    for (v, _), plate in zip(batch, plates):
+                        track_id = v["track_id"]
+                        done_count += 1
+                        if isinstance(plate, Exception):
+                            print(f"ERROR: Vision recognition failed for track {track_id}: {plate}")
+                            plate_lines[track_id] = f"- 车辆 {track_id}: 识别出错 ({str(plate)[:50]})"
+                            progress_text = f'[Vision]: 车辆 {track_id} 识别出错 ({done_count}/{len(crops)})'
+                        else:
+                            plate_lines[track_id] = f"- 车辆 {track_id} (类型: {v['class']}): {plate}"
+                            progress_text = f'[Vision]: 车辆 {track_id} 识别完成：{plate} ({done_count}/{len(crops)})'
+                        yield sse_event({'status': 'recognized', 'track_id': track_id, 'text': progress_text})
+            finally:
+                # 客户端断开时不再等待排队中的识别任务
+                pool.shutdown(wait=False, cancel_futures=True)
+
+        all_plate_results = [plate_lines[v["track_id"]] for v in violations if v["track_id"] in plate_lines]
 
         result_text = "## 车牌识别结果\\n\\n" + "\\n".join(all_plate_results)
         formatted_response = {
@@ -480,7 +1326,7 @@ def analyze_qvq():
                 }]
             }
         }
-        yield f"data: {json.dumps(formatted_response)}\\n\\n"
+        yield sse_event(formatted_response)
 
     return Response(event_stream(), mimetype='text/event-stream')
 
@@ -500,7 +1346,7 @@ def analyze_merge():
 
     def event_stream():
         if not OPENAI_API_BASE or not OPENAI_API_KEY:
-            yield f"data: {json.dumps({'error': 'API 未配置'})}\\n\\n"
+            yield sse_event({'error': 'API 未配置'})
             return
 
         try:
@@ -521,27 +1367,28 @@ def analyze_merge():
 
             messages = [{"role": "user", "content": prompt}]
 
-            for chunk_text in ai_client.chat_stream(messages, model=TEXT_MODEL):
-                formatted_response = {
-                    "output": {
-                        "choices": [{
-                            "message": {
-                                "content": [{"text": chunk_text}]
-                            }
-                        }]
-                    }
-                }
-                yield f"data: {json.dumps(formatted_response)}\\n\\n"
+            envelope = text_envelope()
+            for chunk_text in coalesce(ai_client.chat_stream(messages, model=TEXT_MODEL),
+                                       SSE_COALESCE_CHARS, SSE_COALESCE_SEC):
+                yield envelope.encode(chunk_text)
 
         except Exception as e:
             print(f"ERROR: Merge analysis failed: {e}")
-            yield f"data: {json.dumps({'error': str(e)})}\\n\\n"
+            yield sse_event({'error': str(e)})
 
     return Response(event_stream(), mimetype='text/event-stream')
 
 
-def _sse(event_dict: dict) -> str:
-    return f"data: {json.dumps(event_dict, ensure_ascii=False)}\\n\\n"
+def _run_agent_tool(tool_dispatch: dict, tool_name: str, video_path: str, tool_args: dict) -> tuple:
+    """执行单个 Agent 工具调用，返回 (tool_result, summary)，异常转为错误结果。"""
+    tool_fn = tool_dispatch.get(tool_name)
+    if not tool_fn:
+        return {"error": f"未知工具：{tool_name}"}, f"工具不存在：{tool_name}"
+    try:
+        with AGENT_TOOL_SECONDS.time(tool=tool_name):
+            return tool_fn(video_path, **tool_args)
+    except Exception as e:
+        return {"error": str(e)}, f"工具执行失败：{e}"
 
 
 @app.route('/api/analyze/agent', methods=['POST', 'OPTIONS'])
@@ -553,85 +1400,93 @@ def analyze_agent():
 
     data = request.get_json()
     video_name = data.get('video', '')
+    sam3_options, options_error = _resolve_sam3_options(data)
+    # 帧标注输出：batch（默认，分批 + 差分编码）或 frame（逐帧完整对象）；可指定帧区间与采样率
+    annotation, error = _parse_annotation_options(data)
+    if error:
+        return jsonify({'error': error}), 400
 
     def event_stream():
         from agent_tools import ALL_TOOLS, TOOL_DISPATCH
 
+        if options_error:
+            yield sse_event({"type": "error", "message": options_error})
+            return
+
         video_path = os.path.join(UPLOAD_FOLDER, video_name)
         if not os.path.exists(video_path):
-            yield _sse({"type": "error", "message": f"视频文件不存在: {video_name}"})
+            yield sse_event({"type": "error", "message": f"视频文件不存在: {video_name}"})
             return
 
         # ── Phase 0: 视频探针 ──────────────────────────────────────
-        yield _sse({"type": "phase", "phase": 0, "label": "视频探针", "status": "start"})
+        yield sse_event({"type": "phase", "phase": 0, "label": "视频探针", "status": "start"})
 
-        info = get_video_info(video_path)
+        info = get_video_info(video_path, keyframes=True)
         if not info:
-            yield _sse({"type": "error", "message": "无法读取视频文件"})
+            yield sse_event({"type": "error", "message": "无法读取视频文件"})
             return
 
         fps = info["fps"]
         total_frames = info["total_frames"]
-        probe_frames = [int(total_frames * r) for r in [0.1, 0.25, 0.5, 0.75, 0.9]]
+        # 探针帧对齐到关键帧之后的定位点：随机定位解码量固定，与关键帧间隔无关，场景分析取帧更快
+        probe_frames = sorted(set(
+            seek_aligned_frame(info["keyframes"], int(total_frames * r)) for r in [0.1, 0.25, 0.5, 0.75, 0.9]
+        ))
 
-        yield _sse({"type": "thought", "content":
+        yield sse_event({"type": "thought", "content":
             f"视频信息：时长 {info['duration_sec']}s，共 {total_frames} 帧，"
             f"{fps:.1f} FPS，分辨率 {info['width']}×{info['height']}。"
             f"将分析关键帧：{probe_frames}"})
-        yield _sse({"type": "phase", "phase": 0, "label": "视频探针", "status": "done"})
+        yield sse_event({"type": "phase", "phase": 0, "label": "视频探针", "status": "done"})
 
         # ── Phase 1: 车辆追踪 (SAM3) ──────────────────────────────
-        yield _sse({"type": "phase", "phase": 1, "label": "车辆追踪", "status": "start"})
-        yield _sse({"type": "thought", "content": "启动 SAM3 进行车辆分割追踪..."})
-
-        sam3_result = sam3_predictor.process_video(video_path)
+        yield sse_event({"type": "phase", "phase": 1, "label": "车辆追踪", "status": "start"})
+        yield sse_event({"type": "thought", "content": "启动 SAM3 进行车辆分割追踪..."})
+
+        # Agent 总是使用本地预测器，按本地配置查缓存
+        # 结果与轨迹一起发布，/api/videos/<video>/annotations 按区间读取时车辆判定与轨迹来自同一次分析
+        with _lookup_sam3_cache(video_path, sam3_predictor.config_fingerprint(**sam3_options)) as cached:
+            if cached is not None:
+                track_columns = load_tracks(cached["tracks_path"]) if cached["tracks_path"] else None
+                _publish_sam3_result(video_name, cached["result"], tracks_file=cached["tracks_path"])
+        if cached is not None:
+            sam3_result = cached["result"]
+            yield sse_event({"type": "thought", "content": "命中 SAM3 结果缓存，跳过推理。"})
+        else:
+            sam3_result = sam3_predictor.process_video(video_path, return_tracks=True, **sam3_options)
+            _observe_sam3_timings(sam3_result, _local_sam3_engine())
+            track_columns = sam3_result.pop("tracks", None)
+            _publish_sam3_result(video_name, sam3_result, tracks=track_columns)
+            _store_sam3_cache(video_path, sam3_result, track_columns)
         vehicles = sam3_result.get("vehicles", [])
 
-        # 流式输出每辆车的帧标注
-        for vehicle in vehicles:
-            # 从 predictor 原始 tracks 中获取 frames（vehicles 里没有 frames，需要重新处理）
-            pass
-
-        # 重新运行以获取带 frames 的原始 tracks，用于帧标注输出
-        # process_video 只返回 violations 结果，不含 frames；直接用 mock/real inference 获取 tracks
-        raw_tracks = _get_raw_tracks(video_path, sam3_result, fps, total_frames,
-                                     info["width"], info["height"])
-
-        for track in raw_tracks:
-            track_id = track["track_id"]
-            vehicle_info = next((v for v in vehicles if v["track_id"] == track_id), {})
-            is_violation = vehicle_info.get("is_violation", False)
-            label = f"车辆 #{track_id} ({vehicle_info.get('class', '未知')})"
-
-            for frame_data in track.get("frames", []):
-                yield _sse({"type": "frame_annotation", "data": {
-                    "frame_index": frame_data["frame_index"],
-                    "timestamp_sec": round(frame_data["frame_index"] / fps, 2),
-                    "fps": fps,
-                    "boxes": [{
-                        "track_id": track_id,
-                        "bbox": frame_data["bbox"],
-                        "label": label,
-                        "is_violation": is_violation,
-                        "confidence": frame_data.get("score", 0.9)
-                    }]
-                }})
+        # 逐帧标注直接来自推理产生的真实轨迹
+        if track_columns is not None:
+            step = _annotation_step(fps, annotation['fps'])
+            if annotation['format'] == 'frame':
+                selected = sample_frames(slice_frames(track_columns, annotation['start'], annotation['end']), step)
+                for annotation in frame_annotations(selected, vehicles, fps):
+                    yield sse_event({"type": "frame_annotation", "data": annotation})
+            else:
+                for batch in annotation_batches(track_columns, vehicles, fps, annotation['start'],
+                                                annotation['end'], step, annotation['window']):
+                    yield sse_event({"type": "frame_annotation_batch", "data": batch})
 
         violations = [v for v in vehicles if v.get("is_violation")]
-        yield _sse({"type": "thought", "content":
+        yield sse_event({"type": "thought", "content":
             f"追踪完成：检测到 {len(vehicles)} 辆车，"
             f"初步判定 {len(violations)} 辆疑似违停。"})
-        yield _sse({"type": "phase", "phase": 1, "label": "车辆追踪", "status": "done"})
+        yield sse_event({"type": "phase", "phase": 1, "label": "车辆追踪", "status": "done"})
 
         # ── Phase 2: Agent 决策循环 ───────────────────────────────
-        yield _sse({"type": "phase", "phase": 2, "label": "Agent 分析", "status": "start"})
+        yield sse_event({"type": "phase", "phase": 2, "label": "Agent 分析", "status": "start"})
 
         system_prompt = (
             "你是一个专业的违规停车检测 AI Agent，运行在 PRTS 分析核心中。\n"
             "你有以下工具可以调用：\n"
             "1. analyze_scene_frame：分析帧的场景语义（道路标线、禁停标志）\n"
             "2. recognize_license_plate：识别车牌号\n"
-            "3. analyze_motion_in_region：用 OpenCV 帧差法验证车辆是否静止\n\n"
+            "3. analyze_motion_in_region：用 OpenCV 帧差法验证车辆是否静止（可一次传入多个区域）\n\n"
             "你的任务：\n"
             "- 先分析至少一个关键帧，理解道路类型和禁停规则\n"
             "- 对每辆疑似违停车辆，识别车牌并验证静止状态\n"
@@ -659,7 +1514,7 @@ def analyze_agent():
             "请：\n"
             "1. 调用 analyze_scene_frame 分析至少一个关键帧，理解场景\n"
             "2. 对每辆疑似违停车辆，调用 recognize_license_plate 识别车牌\n"
-            "3. 如有必要，调用 analyze_motion_in_region 验证静止状态\n"
+            "3. 如有必要，调用 analyze_motion_in_region（bboxes 一次传入所有疑似车辆）验证静止状态\n"
             "4. 最终输出 JSON 数组格式的违规记录"
         )
 
@@ -678,7 +1533,7 @@ def analyze_agent():
                     model=TEXT_MODEL
                 )
             except Exception as e:
-                yield _sse({"type": "thought", "content": f"Agent 调用失败：{e}"})
+                yield sse_event({"type": "thought", "content": f"Agent 调用失败：{e}"})
                 break
 
             choice = response["choices"][0]
@@ -688,7 +1543,7 @@ def analyze_agent():
             # 流式输出思考内容
             msg_content = msg.get("content") or ""
             if msg_content:
-                yield _sse({"type": "thought", "content": msg_content})
+                yield sse_event({"type": "thought", "content": msg_content})
 
             tool_calls = msg.get("tool_calls")
 
@@ -716,22 +1571,29 @@ def analyze_agent():
                 ]
             messages.append(assistant_msg)
 
+            # 同一轮的工具调用互不依赖：并发执行，按完成顺序推送结果
+            calls = []
             for tc in tool_calls:
                 tool_name = tc["function"]["name"]
                 try:
                     tool_args = json.loads(tc["function"]["arguments"])
                 except Exception:
                     tool_args = {}
+                calls.append((tc, tool_name, tool_args))
+                yield sse_event({"type": "tool_call", "tool": tool_name, "args": tool_args, "call_id": tc["id"]})
 
-                yield _sse({"type": "tool_call", "tool": tool_name, "args": tool_args})
-
-                tool_fn = TOOL_DISPATCH.get(tool_name)
-                if tool_fn:
-                    try:
-                        tool_result, summary = tool_fn(video_path, **tool_args)
-                    except Exception as e:
-                        tool_result = {"error": str(e)}
-                        summary = f"工具执行失败：{e}"
+            tool_outputs = {}
+            pool = ThreadPoolExecutor(max_workers=max(1, min(AGENT_TOOL_CONCURRENCY, len(calls))))
+            try:
+                futures = {
+                    pool.submit(_run_agent_tool, TOOL_DISPATCH, tool_name, video_path, tool_args): i
+                    for i, (_, tool_name, tool_args) in enumerate(calls)
+                }
+                for future in as_completed(futures):
+                    i = futures[future]
+                    _, tool_name, tool_args = calls[i]
+                    tool_result, summary = future.result()
+                    tool_outputs[i] = tool_result
 
                     # 车牌识别完成后更新帧标注（标记为违停）
                     if tool_name == "recognize_license_plate" and "plate" in tool_result:
@@ -741,7 +1603,7 @@ def analyze_agent():
                         # 找到对应车辆
                         for v in violations:
                             if v.get("best_frame_index") == fi:
-                                yield _sse({"type": "frame_annotation", "data": {
+                                yield sse_event({"type": "frame_annotation", "data": {
                                     "frame_index": fi,
                                     "timestamp_sec": round(fi / fps, 2),
                                     "fps": fps,
@@ -753,22 +1615,24 @@ def analyze_agent():
                                         "confidence": 0.95
                                     }]
                                 }})
-                else:
-                    tool_result = {"error": f"未知工具：{tool_name}"}
-                    summary = f"工具不存在：{tool_name}"
 
-                yield _sse({"type": "tool_result", "tool": tool_name, "summary": summary})
+                    yield sse_event({"type": "tool_result", "tool": tool_name, "summary": summary,
+                                "call_id": calls[i][0]["id"]})
+            finally:
+                pool.shutdown(wait=False, cancel_futures=True)
 
+            # tool 消息必须与 assistant 消息中的 tool_calls 顺序一致
+            for i, (tc, _, _) in enumerate(calls):
                 messages.append({
                     "role": "tool",
                     "tool_call_id": tc["id"],
-                    "content": json.dumps(tool_result, ensure_ascii=False)
+                    "content": json.dumps(tool_outputs[i], ensure_ascii=False)
                 })
 
-        yield _sse({"type": "phase", "phase": 2, "label": "Agent 分析", "status": "done"})
+        yield sse_event({"type": "phase", "phase": 2, "label": "Agent 分析", "status": "done"})
 
         # ── Phase 3: 报告生成 ─────────────────────────────────────
-        yield _sse({"type": "phase", "phase": 3, "label": "报告生成", "status": "start"})
+        yield sse_event({"type": "phase", "phase": 3, "label": "报告生成", "status": "start"})
 
         # 合并 SAM3 数据和 Agent 分析结果
         violation_records = []
@@ -817,66 +1681,14 @@ def analyze_agent():
 
         markdown_report = "\n".join(lines)
 
-        yield _sse({"type": "final_report",
+        yield sse_event({"type": "final_report",
                     "violations": violation_records,
                     "markdown": markdown_report})
-        yield _sse({"type": "phase", "phase": 3, "label": "报告生成", "status": "done"})
+        yield sse_event({"type": "phase", "phase": 3, "label": "报告生成", "status": "done"})
 
     return Response(event_stream(), mimetype='text/event-stream')
 
 
-def _get_raw_tracks(video_path: str, sam3_result: dict, fps: float,
-                    total_frames: int, width: int, height: int) -> list:
-    """
-    从 SAM3 结果中重建带 frames 字段的原始轨迹列表。
-    process_video 返回的 vehicles 不含 frames，需要重新生成 mock 轨迹用于帧标注。
-    """
-    import math
-    import random
-    from sam3_service.predictor import VEHICLE_PROMPTS
-
-    vehicles = sam3_result.get("vehicles", [])
-    tracks = []
-
-    for v in vehicles:
-        track_id = v["track_id"]
-        best_frame = v.get("best_frame_index", 0)
-        best_bbox = v.get("best_frame_bbox", [width * 0.3, height * 0.3,
-                                               width * 0.5, height * 0.5])
-        is_violation = v.get("is_violation", False)
-
-        # 重建帧序列：以 best_frame_bbox 为基准，向前后各延伸
-        frames = []
-        sample_interval = max(1, int(fps))
-        bx1, by1, bx2, by2 = best_bbox
-
-        for fi in range(0, total_frames, sample_interval):
-            if is_violation:
-                jx = random.uniform(-2, 2)
-                jy = random.uniform(-2, 2)
-            else:
-                elapsed = (fi - best_frame) / fps
-                jx = elapsed * random.uniform(15, 30)
-                jy = random.uniform(-3, 3)
-
-            frames.append({
-                "frame_index": fi,
-                "bbox": [
-                    round(bx1 + jx, 1), round(by1 + jy, 1),
-                    round(bx2 + jx, 1), round(by2 + jy, 1)
-                ],
-                "score": round(random.uniform(0.85, 0.98), 3),
-            })
-
-        tracks.append({
-            "track_id": track_id,
-            "class": v.get("class", "car"),
-            "frames": frames,
-        })
-
-    return tracks
-
-
 # ==================== 设置与模型列表 API ====================
 
 def _mask_key(key: str) -> str:
@@ -982,4 +1794,9 @@ def handle_models():
 
 
 if __name__ == '__main__':
+    # 解码子进程会重新导入主模块，作为主模块运行时本文件的初始化会在每个子进程里重复执行；
+    # 此时改在请求线程内解码，需要解码进程池请用 python run.py 启动
+    if decode_pool.workers:
+        print("Started as `python app.py`: decode pool disabled, use `python run.py` for decode workers.")
+        decode_pool.configure(workers=0)
     app.run(debug=True, port=5001, host='0.0.0.0')
@@ -0,0 +1,83 @@
+"""
+Parity check + benchmark: columnar analyze_violations vs. the per-frame reference.
+
+Usage (from backend/):
+    python benchmarks/bench_analyze_violations.py [--tracks 40] [--hours 2] [--fps 30]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sam3_service.predictor import _analyze_violations_scalar, analyze_violations  # noqa: E402
+
+
+def make_tracks(num_tracks: int, num_frames: int, seed: int = 0) -> list:
+    """Synthetic tracks mixing parked, moving and stop-and-go vehicles."""
+    rng = random.Random(seed)
+    tracks = []
+    for t in range(num_tracks):
+        x, y = rng.uniform(100, 1500), rng.uniform(100, 900)
+        frames = []
+        for fi in range(num_frames):
+            if rng.random() < 0.002:
+                x += rng.uniform(20, 200)  # occasional jump ends a stationary run
+            elif t % 3:
+                x += rng.uniform(0.0, 1.5)
+            frames.append({
+                "frame_index": fi,
+                "bbox": [round(x, 1), round(y, 1), round(x + 120, 1), round(y + 80, 1)],
+                "score": round(rng.uniform(0.85, 0.98), 3),
+            })
+        tracks.append({"track_id": t + 1, "class": "car", "frames": frames})
+    # Edge cases: single-frame track and duplicated frame indices
+    tracks.append({"track_id": num_tracks + 1, "class": "van",
+                   "frames": [{"frame_index": 0, "bbox": [0, 0, 10, 10], "score": 0.9}]})
+    dup = [{"frame_index": fi // 2, "bbox": [5, 5, 50, 50], "score": 0.9} for fi in range(200)]
+    tracks.append({"track_id": num_tracks + 2, "class": "bus", "frames": dup})
+    return tracks
+
+
+def best_of(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tracks", type=int, default=40)
+    parser.add_argument("--hours", type=float, default=0.5)
+    parser.add_argument("--fps", type=float, default=30.0)
+    parser.add_argument("--stride", type=int, default=5, help="sample every N-th frame")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    num_frames = int(args.hours * 3600 * args.fps / args.stride)
+    tracks = make_tracks(args.tracks, num_frames)
+    fps = args.fps / args.stride
+
+    expected = _analyze_violations_scalar(tracks, fps)
+    actual = analyze_violations(tracks, fps)
+    if expected != actual:
+        for e, a in zip(expected, actual):
+            if e != a:
+                print(f"MISMATCH track {e['track_id']}:\n  scalar   {e}\n  columnar {a}")
+        sys.exit(1)
+    print(f"parity ok: {len(tracks)} tracks x {num_frames} frames")
+
+    scalar = best_of(lambda: _analyze_violations_scalar(tracks, fps), args.repeat)
+    columnar = best_of(lambda: analyze_violations(tracks, fps), args.repeat)
+    print(f"scalar   {scalar * 1000:9.1f} ms")
+    print(f"columnar {columnar * 1000:9.1f} ms  ({scalar / columnar:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
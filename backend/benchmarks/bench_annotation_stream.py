@@ -0,0 +1,139 @@
+"""
+Wire size and serialization time of the agent endpoint's frame annotations.
+
+Synthesizes --tracks vehicle tracks over --minutes of --fps video (a mix of parked
+and moving vehicles, every track present on every frame) and serializes them as
+SSE the three ways the endpoint has produced them:
+
+  per track/frame  one frame_annotation per track per frame (original behaviour)
+  per frame        one frame_annotation per frame carrying every box
+  batched delta    frame_annotation_batch windows with delta-encoded boxes
+
+plus the batched stream downsampled to 5 fps. Also checks that the batched stream decodes back to the stored boxes.
+
+Usage (from backend/):
+    python benchmarks/bench_annotation_stream.py [--minutes 5] [--fps 30] [--tracks 20]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from track_store import annotation_batches, frame_annotations, slice_frames  # noqa: E402
+
+
+def _sse(event: dict) -> str:
+    return f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+
+def synth_columns(frames: int, tracks: int, seed: int = 0) -> tuple:
+    rng = np.random.default_rng(seed)
+    frame_index = np.repeat(np.arange(frames, dtype=np.int32), tracks)
+    track_id = np.tile(np.arange(1, tracks + 1, dtype=np.int32), frames)
+    base = rng.uniform(50, 1500, size=(tracks, 2))
+    size = rng.uniform(60, 200, size=(tracks, 2))
+    speed = np.where(np.arange(tracks) % 3 == 0, 0.0, rng.uniform(0.5, 3.0, size=tracks))
+    t = frame_index.astype(np.float64)
+    x1 = base[track_id - 1, 0] + speed[track_id - 1] * t + rng.normal(0, 0.3, size=t.shape)
+    y1 = base[track_id - 1, 1] + rng.normal(0, 0.3, size=t.shape)
+    bbox = np.column_stack((x1, y1, x1 + size[track_id - 1, 0], y1 + size[track_id - 1, 1])).astype(np.float32)
+    columns = {
+        "track_id": track_id,
+        "frame_index": frame_index,
+        "bbox": bbox,
+        "score": rng.uniform(0.85, 0.98, size=t.shape).astype(np.float32),
+        "interpolated": np.zeros(t.shape, dtype=bool),
+    }
+    vehicles = [{"track_id": i, "class": "car", "is_violation": bool(speed[i - 1] == 0)}
+                for i in range(1, tracks + 1)]
+    return columns, vehicles
+
+
+def legacy_events(columns: dict, vehicles: list, fps: float):
+    by_id = {v["track_id"]: v for v in vehicles}
+    for track_id in np.unique(columns["track_id"]).tolist():
+        rows = np.flatnonzero(columns["track_id"] == track_id)
+        v = by_id[track_id]
+        label = f"车辆 #{track_id} ({v['class']})"
+        for i in rows.tolist():
+            yield {"type": "frame_annotation", "data": {
+                "frame_index": int(columns["frame_index"][i]),
+                "timestamp_sec": round(int(columns["frame_index"][i]) / fps, 2),
+                "fps": fps,
+                "boxes": [{
+                    "track_id": track_id,
+                    "bbox": [round(float(x), 1) for x in columns["bbox"][i]],
+                    "label": label,
+                    "is_violation": v["is_violation"],
+                    "confidence": round(float(columns["score"][i]), 3),
+                }],
+            }}
+
+
+def measure(events) -> tuple:
+    start = time.perf_counter()
+    count = 0
+    size = 0
+    for event in events:
+        size += len(_sse(event).encode("utf-8"))
+        count += 1
+    return count, size, time.perf_counter() - start
+
+
+def decode(batches: list) -> dict:
+    boxes = {}
+    for batch in batches:
+        previous = {}
+        for frame_index, rows in batch["frames"]:
+            for track_id, *coords, _ in rows:
+                prev = previous.get(track_id)
+                q = [p + d for p, d in zip(prev, coords)] if prev else coords
+                previous[track_id] = q
+                boxes[(frame_index, track_id)] = [v / batch["quant"] for v in q]
+    return boxes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--minutes", type=float, default=5)
+    parser.add_argument("--fps", type=float, default=30)
+    parser.add_argument("--tracks", type=int, default=20)
+    args = parser.parse_args()
+
+    frames = int(args.minutes * 60 * args.fps)
+    columns, vehicles = synth_columns(frames, args.tracks)
+    print(f"{frames} frames x {args.tracks} tracks = {len(columns['frame_index'])} boxes")
+
+    modes = [
+        ("per track/frame", lambda: legacy_events(columns, vehicles, args.fps)),
+        ("per frame", lambda: ({"type": "frame_annotation", "data": a}
+                               for a in frame_annotations(columns, vehicles, args.fps))),
+        ("batched delta", lambda: ({"type": "frame_annotation_batch", "data": b}
+                                   for b in annotation_batches(columns, vehicles, args.fps))),
+        ("batched delta 5fps", lambda: ({"type": "frame_annotation_batch", "data": b}
+                                        for b in annotation_batches(columns, vehicles, args.fps,
+                                                                    step=int(args.fps // 5)))),
+    ]
+    baseline = None
+    for name, make_events in modes:
+        count, size, elapsed = measure(make_events())
+        baseline = baseline or (size, elapsed)
+        print(f"{name:20s} {count:8d} events  {size / 1e6:8.2f} MB ({baseline[0] / size:5.1f}x smaller)  "
+              f"{elapsed:6.2f}s ({baseline[1] / elapsed:5.1f}x faster)")
+
+    decoded = decode(list(annotation_batches(columns, vehicles, args.fps)))
+    sample = slice_frames(columns, 0, min(frames, 3000))
+    for fi, tid, bbox in zip(sample["frame_index"].tolist(), sample["track_id"].tolist(), sample["bbox"]):
+        assert np.allclose(decoded[(fi, tid)], bbox, atol=0.051), (fi, tid)
+    assert len(decoded) == len(columns["frame_index"])
+    print("ok")
+
+
+if __name__ == "__main__":
+    main()
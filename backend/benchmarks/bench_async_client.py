@@ -0,0 +1,68 @@
+"""
+Throughput benchmark: AsyncOpenAIClient vs. OpenAIClient on a thread pool.
+
+Both clients issue the same number of vision-style chat calls against the local
+fake OpenAI server, which sleeps --latency seconds per request to mimic a slow
+model. The sync client is limited by its worker threads; the async client
+multiplexes up to --concurrency calls on one event loop thread.
+
+Usage (from backend/):
+    python benchmarks/bench_async_client.py [--calls 200] [--latency 0.2] [--threads 8]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_openai_server import FakeOpenAIServer  # noqa: E402
+from openai_client import AsyncOpenAIClient, OpenAIClient  # noqa: E402
+
+MESSAGES = [{"role": "user", "content": [{"type": "text", "text": "plate?"}]}]
+
+
+def run_sync(base_url: str, calls: int, threads: int) -> float:
+    client = OpenAIClient(base_url, "key", "m", pool_size=threads)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(lambda _: client.vision_chat(MESSAGES), range(calls)))
+    elapsed = time.perf_counter() - start
+    client.close()
+    return elapsed
+
+
+async def run_async(base_url: str, calls: int, concurrency: int) -> float:
+    async with AsyncOpenAIClient(base_url, "key", "m", max_concurrency=concurrency) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(client.vision_chat(MESSAGES) for _ in range(calls)))
+        stream = [chunk async for chunk in client.chat_stream(MESSAGES)]
+        assert stream, "empty stream"
+        return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--threads", type=int, default=8, help="sync client worker threads")
+    parser.add_argument("--concurrency", type=int, default=64, help="async client in-flight limit")
+    args = parser.parse_args()
+
+    with FakeOpenAIServer(latency=args.latency) as server:
+        sync_elapsed = run_sync(server.base_url, args.calls, args.threads)
+        threads_before = threading.active_count()
+        async_elapsed = asyncio.run(run_async(server.base_url, args.calls, args.concurrency))
+
+    print(f"sync  ({args.threads} threads):     {args.calls / sync_elapsed:8.1f} calls/s  ({sync_elapsed:.2f}s)")
+    print(f"async (1 thread, {args.concurrency} in flight): "
+          f"{args.calls / async_elapsed:8.1f} calls/s  ({async_elapsed:.2f}s, "
+          f"threads in process: {threads_before})")
+
+
+if __name__ == "__main__":
+    main()
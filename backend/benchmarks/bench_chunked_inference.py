@@ -0,0 +1,98 @@
+"""
+Peak memory vs. chunk length of SAM3Predictor's chunked tracking (chunk_sec).
+
+Runs the predictor against the fake SAM3 model (benchmarks/fake_sam3_model.py) with
+load_frames=True: like SAM 3, a session holds every frame of the clip it tracks, so
+memory grows with the length of what one session sees. For each --chunks length
+(0 = one session for the whole video) it reports the tracemalloc peak, wall time and
+number of chunks, sequentially and with --workers concurrent chunks.
+
+Checks that chunked results match the single-session run: same vehicles with the same
+(stable) track ids and verdicts, offline and online=True. Also checks the same on the
+mock engine, whose simulated run is sliced into chunks, with a fixed random seed.
+
+Usage (from backend/):
+    python benchmarks/bench_chunked_inference.py [--seconds 60] [--chunks 0 30 15 5] [--stride 5] [--downscale 0.5] [--workers 2]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_sam3_model import FakeSAM3Model, make_synthetic_clip  # noqa: E402
+from sam3_service.predictor import CHUNK_OVERLAP_SEC, SAM3Predictor, _chunk_ranges  # noqa: E402
+
+
+def verdicts(result: dict) -> list:
+    return [(v["track_id"], v["class"], v["is_violation"], v["stationary_duration_sec"]) for v in result["vehicles"]]
+
+
+def check_mock(video_path: str):
+    for online in (False, True):
+        random.seed(7)
+        single = SAM3Predictor(use_mock=True).process_video(video_path, online=online)
+        for workers in (1, 3):
+            random.seed(7)
+            chunked = SAM3Predictor(use_mock=True, chunk_sec=5, chunk_workers=workers).process_video(
+                video_path, online=online)
+            assert verdicts(chunked) == verdicts(single), (verdicts(chunked), verdicts(single))
+    print(f"mock engine: chunked verdicts and track ids match ({len(single['vehicles'])} vehicles)")
+
+
+def run(video_path: str, chunk_sec: float, workers: int, args, online: bool = False) -> tuple:
+    predictor = SAM3Predictor(use_mock=True, chunk_sec=chunk_sec, chunk_workers=workers)
+    predictor.use_mock = False
+    predictor.model = FakeSAM3Model(load_frames=True)
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = predictor.process_video(video_path, frame_stride=args.stride, downscale=args.downscale, online=online)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=int, default=60)
+    parser.add_argument("--chunks", type=float, nargs="+", default=[0, 30, 15, 5])
+    parser.add_argument("--stride", type=int, default=5)
+    parser.add_argument("--downscale", type=float, default=0.5)
+    parser.add_argument("--workers", type=int, default=2)
+    args = parser.parse_args()
+
+    video_path = f"/tmp/bench_sam3_synthetic_{args.seconds}s.mp4"
+    if not os.path.exists(video_path):
+        make_synthetic_clip(video_path, seconds=args.seconds)
+    check_mock(video_path)
+
+    fps = 25
+    print(f"{args.seconds}s clip, stride {args.stride}, downscale {args.downscale}, overlap {CHUNK_OVERLAP_SEC}s")
+    print(f"{'chunk':>7s} {'chunks':>7s} {'peak (1 worker)':>16s} {'wall':>7s} "
+          f"{f'peak ({args.workers} workers)':>17s} {'wall':>7s}")
+    baseline = None
+    for chunk_sec in args.chunks:
+        count = len(_chunk_ranges(args.seconds * fps, fps, args.stride, chunk_sec, CHUNK_OVERLAP_SEC))
+        result, elapsed, peak = run(video_path, chunk_sec, 1, args)
+        parallel, parallel_elapsed, parallel_peak = run(video_path, chunk_sec, args.workers, args)
+        label = f"{chunk_sec:.0f}s" if chunk_sec else "whole"
+        print(f"{label:>7s} {count:7d} {peak / 1e6:13.1f} MB {elapsed:6.2f}s "
+              f"{parallel_peak / 1e6:14.1f} MB {parallel_elapsed:6.2f}s")
+
+        baseline = baseline or verdicts(result)
+        assert verdicts(result) == baseline, (chunk_sec, verdicts(result), baseline)
+        assert verdicts(parallel) == baseline, (chunk_sec, verdicts(parallel), baseline)
+        if chunk_sec:
+            online, _, _ = run(video_path, chunk_sec, args.workers, args, online=True)
+            assert sorted(verdicts(online)) == sorted(baseline), (chunk_sec, verdicts(online), baseline)
+    print(f"vehicles: {baseline}")
+    print("ok")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Seek + decode latency of video_utils.extract_frames decode options.
+
+Generates a textured 1080p clip with OpenCV. For each option it measures:
+
+  - random access: --samples frame indices in random order, one call at a time, the
+    access pattern of the agent's tools scrubbing through a clip;
+  - a sequential pass: one call for every frame of the clip, the access pattern of
+    motion analysis and thumbnails;
+  - the bytes each decoded frame holds in frame_cache.
+
+frame_cache is disabled and decoders are reopened before each run. Options:
+
+  bgr, walk to target   full BGR, forward gaps up to SEEK_GAP_FRAMES walked with grab() (previous policy)
+  bgr                   full BGR, seeking only when the keyframe positions say it decodes fewer frames
+  gray                  single channel from the decoder's Y plane
+  480w                  downscaled to 480 px wide
+  gray 480w             both
+  keyframe aligned      indices snapped back to the cheapest seek target after a keyframe
+
+Checks that keyframe-aware seeking returns the same frames as a sequential read,
+that gray frames match cvtColor(BGR2GRAY) (small differences only at sharp colour
+edges, where the Y plane is not chroma-subsampled), and that keyframe-aligned
+results are seek-aligned frames.
+
+Usage (from backend/):
+    python benchmarks/bench_decode_options.py [--seconds 20] [--samples 40] [--repeat 3]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import video_utils  # noqa: E402
+from video_utils import extract_frames, frame_cache, get_video_info, release_decoders  # noqa: E402
+
+SIZE = (1920, 1080)
+
+
+def make_clip(path: str, seconds: int, fps: int = 25) -> str:
+    rng = np.random.default_rng(0)
+    base = cv2.resize(rng.uniform(0, 255, (27, 48, 3)), SIZE, interpolation=cv2.INTER_CUBIC)
+    base = np.clip(base, 0, 255).astype(np.uint8)
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, SIZE)
+    for i in range(seconds * fps):
+        frame = np.roll(base, 2 * i, axis=1)
+        cv2.rectangle(frame, (200 + 3 * i % 1500, 600), (420 + 3 * i % 1500, 760), (0, 0, 255), -1)
+        writer.write(frame)
+    writer.release()
+    return path
+
+
+def timed(video_path: str, indices: list, repeat: int, walk: bool = False, **options) -> tuple:
+    best = float("inf")
+    for _ in range(repeat):
+        release_decoders()
+        frames = {}
+        start = time.perf_counter()
+        for fi in indices:
+            if walk:
+                # Emulate the previous policy: no keyframe list, so only gaps > SEEK_GAP_FRAMES seek
+                video_utils._get_decoder(video_path, options.get("grayscale", False)).keyframes = []
+            frames.update(extract_frames(video_path, [fi], **options))
+        best = min(best, (time.perf_counter() - start) / len(indices))
+    return best, frames
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=int, default=20)
+    parser.add_argument("--samples", type=int, default=40)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    video_path = f"/tmp/bench_decode_{args.seconds}s.mp4"
+    if not os.path.exists(video_path):
+        make_clip(video_path, args.seconds)
+    info = get_video_info(video_path, keyframes=True)
+    keyframes = info["keyframes"]
+    print(f"{info['width']}x{info['height']}, {info['total_frames']} frames, {len(keyframes)} keyframes "
+          f"(every {np.median(np.diff(keyframes)):.0f} frames)")
+
+    rng = np.random.default_rng(1)
+    # Shuffled, so most requests need a seek (scrubbing rather than a forward walk)
+    indices = rng.choice(info["total_frames"], size=args.samples, replace=False).tolist()
+    frame_cache.configure(0)
+
+    runs = {
+        "bgr, walk to target": dict(walk=True),
+        "bgr": {},
+        "gray": dict(grayscale=True),
+        "480w": dict(size=(480, 0)),
+        "gray 480w": dict(grayscale=True, size=(480, 0)),
+        "keyframe aligned": dict(keyframe_aligned=True),
+    }
+    results = {}
+    for name, options in runs.items():
+        latency, frames = timed(video_path, indices, args.repeat, **options)
+        results[name] = frames
+        sample = next(iter(frames.values()))
+        line = f"{name:20s} random {latency * 1000:7.2f} ms/frame"
+        if "walk" not in options and "keyframe_aligned" not in options:
+            everything = list(range(info["total_frames"]))
+            release_decoders()
+            start = time.perf_counter()
+            extract_frames(video_path, everything, **options)
+            line += f"  sequential {(time.perf_counter() - start) * 1000 / len(everything):6.2f} ms/frame"
+        print(f"{line:70s} {str(sample.shape):16s} {sample.nbytes / 1e6:6.2f} MB")
+
+    cap = cv2.VideoCapture(video_path)
+    sequential = {}
+    for fi in range(max(indices) + 1):
+        ok, frame = cap.read()
+        if fi in indices:
+            sequential[fi] = frame
+    cap.release()
+    for fi in indices:
+        assert np.array_equal(results["bgr"][fi], sequential[fi]), fi
+        assert np.array_equal(results["bgr, walk to target"][fi], sequential[fi]), fi
+        gray = cv2.cvtColor(sequential[fi], cv2.COLOR_BGR2GRAY).astype(np.int16)
+        error = np.abs(results["gray"][fi].astype(np.int16) - gray)
+        assert error.mean() < 2 and np.percentile(error, 99.9) <= 4, fi
+    assert set(results["keyframe aligned"]) == {video_utils.seek_aligned_frame(keyframes, fi) for fi in indices}
+    print("ok")
+
+
+if __name__ == "__main__":
+    main()
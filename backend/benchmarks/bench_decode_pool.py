@@ -0,0 +1,152 @@
+"""
+Concurrent decode work in request threads vs. the decode process pool.
+
+Generates a synthetic clip with OpenCV (benchmarks/fake_sam3_model.py), then runs
+--concurrency threads, each doing what concurrent agent sessions do: a
+multi-region motion analysis (decoded ROI stacks handed back through shared memory)
+and plate crops (JPEG-encoded in the worker). Meanwhile a heartbeat thread sleeps
+5 ms in a loop and records how late it wakes up, a proxy for how responsive the
+Flask process stays to other requests.
+
+  in-thread     DecodePool(workers=0): decoding runs in the request threads
+  pool          DecodePool(workers=--workers)
+
+Checks that pooled results match in-thread results exactly, that no shared-memory
+block outlives its task, and that a full queue rejects with DecodePoolBusy after
+submit_timeout.
+
+The pool only pays off with spare cores: on a single CPU the workers compete with the
+request threads and the handoff adds a copy per task.
+
+Usage (from backend/):
+    python benchmarks/bench_decode_pool.py [--seconds 60] [--concurrency 4] [--workers 2] [--rounds 3]
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import agent_tools  # noqa: E402
+from benchmarks.bench_motion_analysis import suspect_boxes  # noqa: E402
+from benchmarks.fake_sam3_model import VEHICLES, make_synthetic_clip  # noqa: E402
+from decode_pool import DecodePool, DecodePoolBusy  # noqa: E402
+from video_utils import frame_cache, release_decoders  # noqa: E402
+
+
+class Heartbeat(threading.Thread):
+    def __init__(self, interval: float = 0.005):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.lateness = []
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.is_set():
+            start = time.perf_counter()
+            time.sleep(self.interval)
+            self.lateness.append(time.perf_counter() - start - self.interval)
+
+    def stop(self):
+        self._done.set()
+        self.join()
+
+
+def session(video_path: str, end_frame: int, boxes: list, latencies: list, results: list):
+    start = time.perf_counter()
+    motion, _ = agent_tools.tool_analyze_motion_in_region(video_path, 0, end_frame, bboxes=boxes, samples=100)
+    crops = agent_tools.decode_pool.crop_jpegs(video_path, [(25 * i, list(VEHICLES["red"][1])) for i in range(5)])
+    latencies.append(time.perf_counter() - start)
+    results.append((motion, crops))
+
+
+def run(pool: DecodePool, video_path: str, end_frame: int, boxes: list, concurrency: int, rounds: int) -> dict:
+    agent_tools.decode_pool = pool
+    latencies, results = [], []
+    heartbeat = Heartbeat()
+    heartbeat.start()
+    start = time.perf_counter()
+    for _ in range(rounds):
+        release_decoders()
+        threads = [threading.Thread(target=session, args=(video_path, end_frame, boxes, latencies, results))
+                   for _ in range(concurrency)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    wall = time.perf_counter() - start
+    heartbeat.stop()
+    return {
+        "wall": wall,
+        "p95": float(np.percentile(latencies, 95)),
+        "stall_p99": float(np.percentile(heartbeat.lateness, 99)),
+        "stall_max": max(heartbeat.lateness),
+        "results": results,
+    }
+
+
+def shm_blocks() -> set:
+    return {name for name in os.listdir("/dev/shm") if name.startswith("psm_")}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=int, default=60)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    video_path = f"/tmp/bench_motion_{args.seconds}s.mp4"
+    if not os.path.exists(video_path):
+        make_synthetic_clip(video_path, seconds=args.seconds)
+    end_frame = args.seconds * 25 - 1
+    boxes = suspect_boxes(10)
+    # Every session re-decodes, as different videos would
+    frame_cache.configure(0)
+    shm_before = shm_blocks()
+
+    inline = run(DecodePool(workers=0), video_path, end_frame, boxes, args.concurrency, args.rounds)
+    pool = DecodePool(workers=args.workers, worker_frame_cache_bytes=0)
+    pool.crop_jpegs(video_path, [(0, None)])  # start the workers outside the timed run
+    pooled = run(pool, video_path, end_frame, boxes, args.concurrency, args.rounds)
+
+    sessions = args.concurrency * args.rounds
+    print(f"{sessions} sessions, {args.concurrency} concurrent, {os.cpu_count()} CPUs")
+    for name, r in (("in-thread", inline), (f"pool ({args.workers} workers)", pooled)):
+        print(f"{name:20s} wall {r['wall']:6.2f}s  session p95 {r['p95'] * 1000:7.1f} ms  "
+              f"heartbeat lateness p99 {r['stall_p99'] * 1000:6.1f} ms max {r['stall_max'] * 1000:6.1f} ms")
+    print(pool.stats())
+
+    for (motion_a, crops_a), (motion_b, crops_b) in zip(inline["results"], pooled["results"]):
+        assert motion_a == motion_b
+        assert crops_a == crops_b
+    assert shm_blocks() == shm_before, "leaked shared memory"
+
+    busy = DecodePool(workers=1, max_pending=1, submit_timeout=0.05)
+    rejected = []
+
+    def submit():
+        try:
+            busy.region_stacks(video_path, range(0, end_frame, 2), boxes)
+        except DecodePoolBusy:
+            rejected.append(True)
+
+    threads = [threading.Thread(target=submit) for _ in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert rejected and busy.stats()["rejected"] == len(rejected)
+    for p in (pool, busy):
+        p.shutdown()
+    print("ok")
+
+
+if __name__ == "__main__":
+    main()
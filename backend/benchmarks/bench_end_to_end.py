@@ -0,0 +1,304 @@
+"""
+End-to-end throughput of the analysis endpoints against the mock predictor and a fake model.
+
+Generates --clips seeded synthetic clips (benchmarks/load_generator.py), serves the Flask
+app in-process over HTTP, with the mock SAM 3 engine seeded the same way and every
+model call going to the local fake OpenAI server (--latency seconds per call). It then
+runs the pipeline stage by stage, --concurrency clients at a time, --rounds requests
+per clip and stage:
+
+  sam3    POST /api/analyze/sam3    job queue, mock tracking, result files
+  qvq     POST /api/analyze/qvq     crops of the violations + plate recognition calls
+  agent   POST /api/analyze/agent   probe, tracking, frame annotations, tool-calling loop
+
+Per stage it reports latency (whole SSE response) and time to first event as
+p50/p95/p99, events/sec over the stage's wall time, failures (error events or HTTP
+errors), and peak RSS sampled every 10 ms. RSS is that of this one process: app, fake
+server and clients; decode-pool workers are separate processes.
+
+The result and vision caches are disabled unless --cache is given, so every request
+does the full work. Uploads, job results and caches go to a temporary directory.
+
+After the stages it reads GET /metrics and prints where the time went: count, total
+and mean of every timing series the app recorded (decoding, SAM 3 stages, model calls,
+agent tools, DB commits), also stored in the report under "metrics".
+
+Results are written as JSON to --output. With --baseline, a previous result file, it
+prints the change per stage and exits with status 1 if any stage's p95 latency or
+events/sec got worse by more than --tolerance.
+
+Usage (from backend/):
+    python benchmarks/bench_end_to_end.py [--clips 4] [--seconds 20] [--size 1280x720] [--vehicles 3]
+        [--seed 0] [--rounds 2] [--concurrency 4] [--latency 0.05] [--stages sam3 qvq agent]
+        [--output /tmp/bench_end_to_end.json] [--baseline previous.json] [--tolerance 0.2] [--cache]
+"""
+
+import argparse
+import contextlib
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+from werkzeug.serving import make_server
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_openai_server import FakeOpenAIServer  # noqa: E402
+from benchmarks.load_generator import make_clip, mock_predictor  # noqa: E402
+
+ROUTES = {
+    "sam3": "/api/analyze/sam3",
+    "qvq": "/api/analyze/qvq",
+    "agent": "/api/analyze/agent",
+}
+FAKE_MODEL = "fake-model"
+
+
+class RSSSampler(threading.Thread):
+    """Peak resident set size of this process while running."""
+
+    def __init__(self, interval: float = 0.01):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak = self.rss()
+        self._done = threading.Event()
+
+    @staticmethod
+    def rss() -> int:
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except OSError:
+            import resource
+            # No /proc: lifetime peak instead (kilobytes on Linux, bytes on macOS)
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            return peak if sys.platform == "darwin" else peak * 1024
+
+    def run(self):
+        while not self._done.wait(self.interval):
+            self.peak = max(self.peak, self.rss())
+
+    def stop(self) -> int:
+        self._done.set()
+        self.join()
+        return max(self.peak, self.rss())
+
+
+_sessions = threading.local()
+
+
+def sse_request(url: str, cookies: dict, body: dict) -> dict:
+    """POST body and read the SSE response to the end; one keep-alive session per client thread."""
+    session = getattr(_sessions, "session", None)
+    if session is None:
+        session = _sessions.session = requests.Session()
+    start = time.perf_counter()
+    first_event = None
+    events = 0
+    failed = False
+    try:
+        with session.post(url, json=body, cookies=cookies, stream=True, timeout=600) as response:
+            failed = response.status_code != 200
+            for line in response.iter_lines():
+                if not line.startswith(b"data:"):
+                    continue
+                events += 1
+                if first_event is None:
+                    first_event = time.perf_counter() - start
+                event = json.loads(line[5:])
+                failed |= isinstance(event, dict) and ("error" in event or event.get("type") == "error")
+    except requests.RequestException:
+        failed = True
+    return {"latency": time.perf_counter() - start, "first_event": first_event, "events": events, "failed": failed}
+
+
+def percentiles(values: list) -> dict:
+    if not values:
+        return {}
+    return {
+        "p50": round(float(np.percentile(values, 50)), 4),
+        "p95": round(float(np.percentile(values, 95)), 4),
+        "p99": round(float(np.percentile(values, 99)), 4),
+        "mean": round(float(np.mean(values)), 4),
+        "max": round(float(np.max(values)), 4),
+    }
+
+
+def run_stage(url: str, cookies: dict, clips: list, rounds: int, concurrency: int) -> dict:
+    bodies = [{"video": name} for _ in range(rounds) for name in clips]
+    sampler = RSSSampler()
+    rss_before = sampler.peak
+    sampler.start()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda body: sse_request(url, cookies, body), bodies))
+    wall = time.perf_counter() - start
+    peak = sampler.stop()
+    events = sum(r["events"] for r in results)
+    return {
+        "requests": len(results),
+        "failures": sum(r["failed"] for r in results),
+        "wall_sec": round(wall, 4),
+        "requests_per_sec": round(len(results) / wall, 3),
+        "latency_sec": percentiles([r["latency"] for r in results]),
+        "first_event_sec": percentiles([r["first_event"] for r in results if r["first_event"] is not None]),
+        "events": events,
+        "events_per_sec": round(events / wall, 2),
+        "rss_before_mb": round(rss_before / 1e6, 1),
+        "peak_rss_mb": round(peak / 1e6, 1),
+    }
+
+
+def configure_app(app_module, root: str, fake_url: str, args):
+    """Point the imported app at the temporary directory, the fake server and the seeded mock engine."""
+    from agent_tools import set_client
+    from openai_client import OpenAIClient
+
+    uploads = os.path.join(root, "uploads")
+    os.makedirs(os.path.join(uploads, "jobs"), exist_ok=True)
+    app_module.UPLOAD_FOLDER = uploads
+    app_module.sam3_jobs.results_dir = os.path.join(uploads, "jobs")
+    app_module.SAM3_LOCAL = True
+    app_module.OPENAI_API_BASE = fake_url
+    app_module.OPENAI_API_KEY = "bench"
+    app_module.CHAT_MODEL = app_module.VISION_MODEL = app_module.TEXT_MODEL = FAKE_MODEL
+    app_module.ai_client = OpenAIClient(fake_url, "bench", FAKE_MODEL, pool_size=max(16, args.concurrency * 2))
+    set_client(app_module.ai_client, FAKE_MODEL)
+    if not args.cache:
+        app_module.sam3_cache.max_bytes = 0
+        app_module.vision_cache.ttl_sec = 0
+    mock_predictor(app_module.sam3_predictor, args.seed, args.vehicles)
+    return uploads
+
+
+def timing_breakdown(base_url: str, cookies: dict) -> dict:
+    """Count and total seconds of every *_seconds series on /metrics."""
+    text = requests.get(base_url + "/metrics", cookies=cookies, timeout=10).text
+    series = {}
+    for line in text.splitlines():
+        name, _, value = line.rpartition(" ")
+        for suffix in ("_seconds_sum", "_seconds_count"):
+            family, found, labels = name.partition(suffix)
+            if found:
+                entry = series.setdefault(family + "_seconds" + labels, {})
+                entry["sum" if suffix.endswith("sum") else "count"] = float(value)
+    return {key: {"count": int(v["count"]), "total_sec": round(v["sum"], 4),
+                  "mean_sec": round(v["sum"] / v["count"], 5) if v["count"] else 0.0}
+            for key, v in sorted(series.items())}
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> bool:
+    """Print per-stage changes against baseline; True if no stage regressed beyond tolerance."""
+    ok = True
+    print(f"\nvs. baseline {baseline.get('git_revision') or ''} ({baseline.get('timestamp', '?')}):")
+    for stage, current in report["stages"].items():
+        previous = baseline.get("stages", {}).get(stage)
+        if not previous or not previous["latency_sec"] or not current["latency_sec"]:
+            continue
+        p95 = current["latency_sec"]["p95"] / previous["latency_sec"]["p95"] - 1
+        rate = current["events_per_sec"] / previous["events_per_sec"] - 1 if previous["events_per_sec"] else 0.0
+        regressed = p95 > tolerance or rate < -tolerance
+        ok &= not regressed
+        print(f"  {stage:6s} p95 {p95:+7.1%}  events/s {rate:+7.1%}{'  REGRESSION' if regressed else ''}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clips", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--size", default="1280x720")
+    parser.add_argument("--vehicles", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--rounds", type=int, default=2)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.05, help="fake model latency per call, seconds")
+    parser.add_argument("--stages", nargs="+", choices=list(ROUTES), default=list(ROUTES))
+    parser.add_argument("--output", default="/tmp/bench_end_to_end.json")
+    parser.add_argument("--baseline", default=None)
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--cache", action="store_true", help="keep the SAM3 result and vision caches enabled")
+    args = parser.parse_args()
+    size = tuple(int(v) for v in args.size.lower().split("x"))
+
+    with tempfile.TemporaryDirectory() as root, FakeOpenAIServer(latency=args.latency) as fake:
+        # The app prints per-request debug lines; keep them out of the report
+        with contextlib.redirect_stdout(open(os.devnull, "w")):
+            import app as app_module
+            uploads = configure_app(app_module, root, fake.base_url, args)
+        clips = []
+        for i in range(args.clips):
+            name = f"bench_clip_{i}.mp4"
+            make_clip(os.path.join(uploads, name), args.seconds, size, args.vehicles, args.seed + i)
+            clips.append(name)
+
+        flask_app = app_module.app
+        logging.getLogger("werkzeug").setLevel(logging.ERROR)
+        server = make_server("127.0.0.1", 0, flask_app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = f"http://127.0.0.1:{server.server_port}"
+        # login_required only checks the session for a user id
+        cookie = flask_app.session_interface.get_signing_serializer(flask_app).dumps({"user_id": 0})
+        cookies = {flask_app.config["SESSION_COOKIE_NAME"]: cookie}
+
+        stages = {}
+        print(f"{args.clips} clips of {args.seconds:g}s at {size[0]}x{size[1]}, {args.vehicles} vehicles, "
+              f"{args.rounds} rounds, concurrency {args.concurrency}, model latency {args.latency * 1000:.0f} ms")
+        print(f"{'stage':6s} {'reqs':>5s} {'fail':>5s} {'p50':>8s} {'p95':>8s} {'p99':>8s} "
+              f"{'first p50':>10s} {'events/s':>9s} {'peak RSS':>10s}")
+        for stage in args.stages:
+            fake.reset_counters()
+            with contextlib.redirect_stdout(open(os.devnull, "w")):
+                result = run_stage(base_url + ROUTES[stage], cookies, clips, args.rounds, args.concurrency)
+            result["model_calls"] = fake.requests
+            stages[stage] = result
+            latency, first = result["latency_sec"], result["first_event_sec"]
+            print(f"{stage:6s} {result['requests']:5d} {result['failures']:5d} {latency['p50']:7.3f}s "
+                  f"{latency['p95']:7.3f}s {latency['p99']:7.3f}s {first.get('p50', 0):9.3f}s "
+                  f"{result['events_per_sec']:9.1f} {result['peak_rss_mb']:7.1f} MB")
+        breakdown = timing_breakdown(base_url, cookies)
+        server.shutdown()
+
+    print(f"\n{'timing series':78s} {'count':>7s} {'total':>9s} {'mean':>9s}")
+    for key, entry in breakdown.items():
+        print(f"{key:78s} {entry['count']:7d} {entry['total_sec']:8.2f}s {entry['mean_sec'] * 1000:7.1f}ms")
+
+    report = {
+        "benchmark": "end_to_end",
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "git_revision": git_revision(),
+        "environment": {"python": platform.python_version(), "platform": platform.platform(),
+                        "cpus": os.cpu_count()},
+        "config": {**vars(args), "size": list(size)},
+        "stages": stages,
+        "metrics": breakdown,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"wrote {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            if not compare(report, json.load(f), args.tolerance):
+                sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Throughput vs. accuracy of SAM3Predictor's frame_stride / downscale / roi options.
+
+Runs the predictor against the fake SAM3 model (benchmarks/fake_sam3_model.py),
+which segments coloured "vehicles" from the reduced clip the predictor prepares
+and charges --frame-cost seconds per propagated megapixel-frame. For each
+setting it reports wall time, frames propagated and the speedup over full-rate,
+full-resolution tracking, and checks that the violation verdicts still match.
+
+Usage (from backend/):
+    python benchmarks/bench_inference_options.py [--frame-cost 0.03]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_sam3_model import CLIP_SIZE, FakeSAM3Model, make_synthetic_clip  # noqa: E402
+from sam3_service.predictor import SAM3Predictor  # noqa: E402
+
+CLIP_PATH = "/tmp/bench_sam3_synthetic.mp4"
+# Lower half of the frame: the curb lane in the synthetic clip
+CURB_ROI = [[0, CLIP_SIZE[1] // 2], [CLIP_SIZE[0], CLIP_SIZE[1] // 2], [CLIP_SIZE[0], CLIP_SIZE[1]], [0, CLIP_SIZE[1]]]
+
+SETTINGS = [
+    ("full rate, full res", {}),
+    ("stride 5", {"frame_stride": 5}),
+    ("downscale 0.5", {"downscale": 0.5}),
+    ("curb ROI", {"roi": CURB_ROI}),
+    ("stride 5 + 0.5 + ROI", {"frame_stride": 5, "downscale": 0.5, "roi": CURB_ROI}),
+]
+
+
+def run(video_path: str, frame_cost: float, options: dict) -> tuple:
+    predictor = SAM3Predictor(use_mock=True)
+    predictor.use_mock = False
+    predictor.model = FakeSAM3Model(frame_cost)
+    start = time.perf_counter()
+    result = predictor.process_video(video_path, **options)
+    return result, time.perf_counter() - start, predictor.model.frames_propagated
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--video", default=None, help="defaults to a generated 12s synthetic clip")
+    parser.add_argument("--frame-cost", type=float, default=0.03, help="seconds per propagated megapixel-frame")
+    args = parser.parse_args()
+
+    video_path = args.video or CLIP_PATH
+    if not os.path.exists(video_path):
+        make_synthetic_clip(video_path)
+
+    baseline_time = None
+    baseline = None
+    for name, options in SETTINGS:
+        result, elapsed, frames = run(video_path, args.frame_cost, options)
+        verdicts = sorted((v["class"], v["is_violation"], v["stationary_duration_sec"]) for v in result["vehicles"])
+        if baseline_time is None:
+            baseline_time, baseline = elapsed, verdicts
+        print(f"{name:22s} {elapsed:6.2f}s  {frames:5d} frames  {baseline_time / elapsed:5.1f}x  "
+              f"prepare {result['timings']['prepare']:.2f}s  vehicles {verdicts}")
+
+        expected = [v for v in baseline if "roi" not in options or v[0] != "bus"]
+        assert [v[:2] for v in verdicts] == [v[:2] for v in expected], (name, verdicts)
+        for got, want in zip(verdicts, expected):
+            if not want[1]:
+                continue
+            # Sampling every Nth frame can shift a violation's boundaries by up to one stride
+            tolerance = options.get("frame_stride", 1) / result["fps"] + 0.05
+            assert abs(got[2] - want[2]) <= tolerance, (name, got, want)
+    print("ok")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+Overhead and correctness of the timing histograms in metrics.py.
+
+Three parts:
+
+  overhead  cost per timed block (Histogram.time as a context manager and as a decorator)
+            and per observe(), against an untimed block and with the registry disabled;
+            then the same with --threads threads recording into one series at once.
+  format    renders a registry in Prometheus text format and checks it: cumulative
+            buckets, +Inf bucket equal to _count, escaped label values. Also parses it
+            with prometheus_client when that is installed.
+  client    OpenAIClient against the local fake server (benchmarks/fake_openai_server.py)
+            with 429s injected: every chat / vision_chat / chat_with_tools / chat_stream
+            call lands in openai_request_seconds once under its own method, a stream closed
+            early is recorded as "cancelled", and retries are counted.
+
+Usage (from backend/):
+    python benchmarks/bench_metrics.py [--calls 200000] [--threads 8]
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_openai_server import FakeOpenAIServer  # noqa: E402
+from metrics import (  # noqa: E402
+    MetricsRegistry, OPENAI_FIRST_CHUNK_SECONDS, OPENAI_REQUEST_SECONDS, OPENAI_RETRIES,
+)
+from openai_client import OpenAIClient  # noqa: E402
+
+MESSAGES = [{"role": "user", "content": "hi"}]
+
+
+def per_call_ns(fn, calls: int) -> float:
+    start = time.perf_counter()
+    fn(calls)
+    return (time.perf_counter() - start) / calls * 1e9
+
+
+def check_overhead(calls: int, threads: int):
+    registry = MetricsRegistry()
+    histogram = registry.histogram("bench_seconds", "Benchmark.")
+
+    def bare(n):
+        for _ in range(n):
+            pass
+
+    def timed(n):
+        for _ in range(n):
+            with histogram.time(stage="x"):
+                pass
+
+    @histogram.time(stage="y")
+    def decorated():
+        pass
+
+    def decorated_calls(n):
+        for _ in range(n):
+            decorated()
+
+    def observed(n):
+        for _ in range(n):
+            histogram.observe(0.01, stage="z")
+
+    base = per_call_ns(bare, calls)
+    print(f"overhead per call ({calls} calls):")
+    for label, fn in (("with histogram.time()", timed), ("@histogram.time()", decorated_calls),
+                      ("histogram.observe()", observed)):
+        print(f"  {label:24s} {per_call_ns(fn, calls) - base:7.0f} ns")
+    registry.configure(enabled=False)
+    print(f"  {'disabled time()':24s} {per_call_ns(timed, calls) - base:7.0f} ns")
+    registry.configure(enabled=True)
+
+    workers = [threading.Thread(target=timed, args=(calls // threads,)) for _ in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+    print(f"  {threads} threads, one series    {elapsed / (calls // threads * threads) * 1e9:7.0f} ns wall per call")
+
+    counts = {key: series["count"] for key, series in histogram.snapshot().items()}
+    assert counts[(("outcome", "ok"), ("stage", "x"))] == calls + calls // threads * threads, counts
+    assert counts[(("outcome", "ok"), ("stage", "y"))] == calls, counts
+
+
+def check_format():
+    registry = MetricsRegistry()
+    histogram = registry.histogram("demo_seconds", "Demo histogram.", buckets=(0.1, 1.0))
+    for seconds in (0.05, 0.5, 0.5, 5.0):
+        histogram.observe(seconds, stage='quo"te\\d')
+    try:
+        with histogram.time(stage="fails"):
+            raise RuntimeError
+    except RuntimeError:
+        pass
+    registry.counter("demo_total", "Demo counter.").inc(3, reason="429")
+    text = registry.render()
+
+    lines = text.splitlines()
+    assert 'demo_seconds_bucket{stage="quo\\"te\\\\d",le="0.1"} 1' in lines, text
+    assert 'demo_seconds_bucket{stage="quo\\"te\\\\d",le="1"} 3' in lines, text
+    assert 'demo_seconds_bucket{stage="quo\\"te\\\\d",le="+Inf"} 4' in lines, text
+    assert 'demo_seconds_count{stage="quo\\"te\\\\d"} 4' in lines, text
+    assert 'demo_seconds_count{outcome="error",stage="fails"} 1' in lines, text
+    assert 'demo_total{reason="429"} 3' in lines, text
+    assert text.endswith("\n")
+
+    try:
+        from prometheus_client.parser import text_string_to_metric_families
+    except ImportError:
+        print("format: ok (prometheus_client not installed, parser check skipped)")
+        return
+    families = {family.name: family for family in text_string_to_metric_families(text)}
+    assert families["demo_seconds"].type == "histogram"
+    assert families["demo"].type == "counter"
+    print("format: ok (parsed by prometheus_client)")
+
+
+def check_client():
+    with FakeOpenAIServer(stream_chunks=5, fail_first=2) as server:
+        client = OpenAIClient(server.base_url, "bench", "fake-model", backoff_base=0.001)
+        retries_before = sum(OPENAI_RETRIES.snapshot().values())
+        client.chat(MESSAGES)
+        client.vision_chat(MESSAGES)
+        client.chat_with_tools(MESSAGES, tools=[])
+        assert len("".join(client.chat_stream(MESSAGES))) > 0
+        stream = client.chat_stream(MESSAGES)
+        next(stream)
+        stream.close()
+
+        by_outcome = {(dict(key)["method"], dict(key)["outcome"]): series["count"]
+                      for key, series in OPENAI_REQUEST_SECONDS.snapshot().items()}
+        expected = {("chat", "ok"): 1, ("vision_chat", "ok"): 1, ("chat_with_tools", "ok"): 1,
+                    ("chat_stream", "ok"): 1, ("chat_stream", "cancelled"): 1}
+        assert by_outcome == expected, by_outcome
+        first_chunks = sum(series["count"] for series in OPENAI_FIRST_CHUNK_SECONDS.snapshot().values())
+        assert first_chunks == 2, first_chunks
+        retries = sum(OPENAI_RETRIES.snapshot().values()) - retries_before
+        assert retries == 2, retries
+        client.close()
+    print(f"client: one series per call and method {sorted(by_outcome)}, {retries} retries counted")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=200000)
+    parser.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args()
+
+    check_overhead(args.calls, args.threads)
+    check_format()
+    check_client()
+    print("ok")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Multi-region motion analysis vs. the original per-bbox seek loop.
+
+Generates a synthetic clip with OpenCV (benchmarks/fake_sam3_model.py: two parked
+cars and one moving car), then validates --suspects regions over the whole clip:
+
+  per-bbox seek   one tool call per region, seeking the capture for every sample (original)
+  one pass        a single tool call with all regions in bboxes
+
+Checks that both give identical motion scores and stationary verdicts, and that the
+motion curve covers the sampled intervals.
+
+Usage (from backend/):
+    python benchmarks/bench_motion_analysis.py [--seconds 60] [--suspects 10] [--repeat 3]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agent_tools import tool_analyze_motion_in_region  # noqa: E402
+from benchmarks.fake_sam3_model import CLIP_SIZE, VEHICLES, make_synthetic_clip  # noqa: E402
+from video_utils import release_decoders  # noqa: E402
+
+
+def legacy_motion(video_path: str, bbox: list, start_frame: int, end_frame: int) -> dict:
+    x1, y1, x2, y2 = [int(v) for v in bbox]
+    cap = cv2.VideoCapture(video_path)
+    prev_gray = None
+    motion_scores = []
+    sample_step = max(1, (end_frame - start_frame) // 20)
+    for fi in range(start_frame, min(end_frame + 1, start_frame + 200 * sample_step), sample_step):
+        cap.set(cv2.CAP_PROP_POS_FRAMES, fi)
+        ret, frame = cap.read()
+        if not ret:
+            break
+        roi = frame[y1:y2, x1:x2]
+        if roi.size == 0:
+            continue
+        gray = cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY)
+        if prev_gray is not None and prev_gray.shape == gray.shape:
+            motion_scores.append(float(np.mean(cv2.absdiff(prev_gray, gray))))
+        prev_gray = gray
+    cap.release()
+    avg_motion = float(np.mean(motion_scores)) if motion_scores else 0.0
+    return {"avg_motion_score": round(avg_motion, 3), "is_stationary": avg_motion < 3.0,
+            "frames_analyzed": len(motion_scores)}
+
+
+def suspect_boxes(count: int) -> list:
+    """The three vehicles' starting boxes, then random boxes elsewhere in the frame."""
+    boxes = [list(v[1]) for v in VEHICLES.values()]
+    rng = np.random.default_rng(0)
+    w, h = CLIP_SIZE
+    while len(boxes) < count:
+        x, y = int(rng.integers(0, w - 120)), int(rng.integers(0, h - 80))
+        boxes.append([x, y, x + 120, y + 80])
+    return boxes[:count]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=int, default=60)
+    parser.add_argument("--suspects", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    video_path = f"/tmp/bench_motion_{args.seconds}s.mp4"
+    if not os.path.exists(video_path):
+        make_synthetic_clip(video_path, seconds=args.seconds)
+    end_frame = args.seconds * 25 - 1
+    boxes = suspect_boxes(args.suspects)
+
+    best = {}
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        legacy = [legacy_motion(video_path, box, 0, end_frame) for box in boxes]
+        best["legacy"] = min(best.get("legacy", float("inf")), time.perf_counter() - start)
+
+        release_decoders()
+        start = time.perf_counter()
+        result, summary = tool_analyze_motion_in_region(video_path, 0, end_frame, bboxes=boxes)
+        best["one pass"] = min(best.get("one pass", float("inf")), time.perf_counter() - start)
+
+    print(f"{args.suspects} regions over {end_frame + 1} frames")
+    print(f"per-bbox seek  {best['legacy'] * 1000:8.1f} ms")
+    print(f"one pass       {best['one pass'] * 1000:8.1f} ms ({best['legacy'] / best['one pass']:.1f}x faster)")
+
+    regions = result["regions"]
+    for old, new in zip(legacy, regions):
+        assert old["avg_motion_score"] == new["avg_motion_score"], (old, new)
+        assert old["is_stationary"] == new["is_stationary"]
+        assert old["frames_analyzed"] == new["frames_analyzed"] == len(new["motion_curve"])
+    assert [r["is_stationary"] for r in regions[:3]] == [True, False, True]
+    single, _ = tool_analyze_motion_in_region(video_path, 0, end_frame, bbox=boxes[1])
+    assert single["avg_motion_score"] == regions[1]["avg_motion_score"]
+    print(f"moving car curve: {regions[1]['motion_curve'][:3]} ...")
+    print("ok")
+
+
+if __name__ == "__main__":
+    main()
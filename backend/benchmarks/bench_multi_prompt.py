@@ -0,0 +1,57 @@
+"""
+Single-pass vs. per-prompt SAM3 inference against a fake video predictor.
+
+The fake model (benchmarks/fake_sam3_model.py) mimics the SAM3 session API and
+charges --frame-cost seconds per propagated megapixel-frame. One vehicle is
+detected under both "car" and "van", so both modes must de-duplicate it by IoU. Checks that single_pass propagates the video exactly
+once, that both modes produce the same vehicles, and prints stage timings.
+
+Usage (from backend/):
+    python benchmarks/bench_multi_prompt.py [--frame-cost 0.03]
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_sam3_model import FakeSAM3Model, make_synthetic_clip  # noqa: E402
+from sam3_service.predictor import SAM3Predictor  # noqa: E402
+
+CLIP_PATH = "/tmp/bench_sam3_synthetic.mp4"
+
+
+def run(video_path: str, mode: str, frame_cost: float) -> tuple:
+    predictor = SAM3Predictor(use_mock=True, prompt_mode=mode)
+    predictor.use_mock = False
+    predictor.model = FakeSAM3Model(frame_cost)
+    result = predictor.process_video(video_path)
+    return result, predictor.model.propagations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--video", default=None, help="defaults to a generated 12s synthetic clip")
+    parser.add_argument("--frame-cost", type=float, default=0.03, help="seconds per propagated megapixel-frame")
+    args = parser.parse_args()
+
+    video_path = args.video or CLIP_PATH
+    if not os.path.exists(video_path):
+        make_synthetic_clip(video_path)
+    single, single_props = run(video_path, "single_pass", args.frame_cost)
+    multi, multi_props = run(video_path, "per_prompt", args.frame_cost)
+
+    for name, result, props in (("single_pass", single, single_props), ("per_prompt", multi, multi_props)):
+        print(f"{name:12s} propagations={props} vehicles={len(result['vehicles'])} timings={result['timings']}")
+
+    assert single_props == 1, f"single_pass propagated {single_props} times"
+    assert multi_props == 4
+    summary = lambda r: [(v["class"], v["is_violation"]) for v in r["vehicles"]]  # noqa: E731
+    assert summary(single) == summary(multi) == [("car", True), ("car", False), ("bus", True)], summary(single)
+    print(f"speedup: {multi['timings']['total'] / single['timings']['total']:.1f}x")
+    print("ok")
+
+
+if __name__ == "__main__":
+    main()
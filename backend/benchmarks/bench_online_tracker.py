@@ -0,0 +1,105 @@
+"""
+Memory and parity of StationaryRunTracker (online) vs. analyze_violations (batch).
+
+Two parts:
+
+  parity   bench_analyze_violations.make_tracks observations are fed to the tracker in
+           frame order, with a snapshot -> JSON -> from_snapshot round trip halfway.
+           Every verdict must match analyze_violations (is_violation, duration, reason);
+           best frames must lie within the longest run, near its middle.
+  memory   process_video with the fake SAM3 model (benchmarks/fake_sam3_model.py) on
+           synthetic clips of increasing length, offline vs. online=True. Reports the
+           tracemalloc peak of each run and checks the verdicts agree.
+
+The offline peak grows with the clip (every tracked box is kept until the end); the
+online peak is the prepared clip plus O(tracks) state.
+
+Usage (from backend/):
+    python benchmarks/bench_online_tracker.py [--tracks 40] [--frames 20000] [--seconds 12 48 120] [--downscale 0.25]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_analyze_violations import make_tracks  # noqa: E402
+from benchmarks.fake_sam3_model import FakeSAM3Model, make_synthetic_clip  # noqa: E402
+from sam3_service.predictor import SAM3Predictor, StationaryRunTracker, analyze_violations  # noqa: E402
+
+
+def check_parity(num_tracks: int, num_frames: int, fps: float = 30.0):
+    tracks = make_tracks(num_tracks, num_frames)
+    start = time.perf_counter()
+    reference = analyze_violations(tracks, fps)
+    batch_time = time.perf_counter() - start
+
+    observations = sorted((f["frame_index"], t["track_id"], t["class"], f) for t in tracks for f in t["frames"])
+    tracker = StationaryRunTracker(fps)
+    start = time.perf_counter()
+    for i, (fi, track_id, vehicle_class, frame) in enumerate(observations):
+        if i == len(observations) // 2:
+            tracker = StationaryRunTracker.from_snapshot(json.loads(json.dumps(tracker.snapshot())))
+        tracker.update(track_id, vehicle_class, fi, frame["bbox"], frame["score"])
+    online_time = time.perf_counter() - start
+    print(f"parity: {len(observations)} observations, batch {batch_time:.2f}s, "
+          f"online {online_time:.2f}s ({online_time / len(observations) * 1e6:.1f} us/observation)")
+
+    worst = 0.0
+    for expected in reference:
+        got = tracker.query(expected["track_id"])
+        for key in ("is_violation", "stationary_duration_sec", "violation_reason"):
+            assert got.get(key) == expected.get(key), (expected["track_id"], key, got.get(key), expected.get(key))
+        if expected["is_violation"]:
+            # Same run (the reason carries its bounds), so the middle is expected["best_frame_index"]
+            run_frames = expected["stationary_duration_sec"] * fps
+            worst = max(worst, abs(got["best_frame_index"] - expected["best_frame_index"]) / run_frames)
+    assert worst <= 1 / StationaryRunTracker.RUN_SAMPLES, worst
+    print(f"        verdicts match; best frame off the middle by at most {worst:.1%} of the run")
+
+
+def run(video_path: str, downscale: float, online: bool) -> tuple:
+    predictor = SAM3Predictor(use_mock=True)
+    predictor.use_mock = False
+    predictor.model = FakeSAM3Model(0.0)
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = predictor.process_video(video_path, downscale=downscale, online=online)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tracks", type=int, default=40)
+    parser.add_argument("--frames", type=int, default=20000)
+    parser.add_argument("--seconds", type=int, nargs="+", default=[12, 48, 120])
+    parser.add_argument("--downscale", type=float, default=0.25)
+    args = parser.parse_args()
+
+    check_parity(args.tracks, args.frames)
+
+    print(f"{'clip':>6s} {'offline peak':>14s} {'online peak':>13s} {'offline':>9s} {'online':>9s}")
+    for seconds in args.seconds:
+        video_path = f"/tmp/bench_sam3_synthetic_{seconds}s.mp4"
+        if not os.path.exists(video_path):
+            make_synthetic_clip(video_path, seconds=seconds)
+        offline, offline_time, offline_peak = run(video_path, args.downscale, online=False)
+        online, online_time, online_peak = run(video_path, args.downscale, online=True)
+        print(f"{seconds:5d}s {offline_peak / 1e6:11.1f} MB {online_peak / 1e6:10.1f} MB "
+              f"{offline_time:8.2f}s {online_time:8.2f}s")
+
+        def verdicts(result):
+            return sorted((v["class"], v["is_violation"], v["stationary_duration_sec"]) for v in result["vehicles"])
+        assert verdicts(offline) == verdicts(online), (verdicts(offline), verdicts(online))
+    print("ok")
+
+
+if __name__ == "__main__":
+    main()
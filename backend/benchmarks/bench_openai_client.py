@@ -0,0 +1,69 @@
+"""
+Connection reuse and retry check for OpenAIClient against a local fake server.
+
+Compares the pooled client with one-off requests.post calls (the old behaviour),
+counting TCP connections opened on the server side, then verifies that 429
+responses with Retry-After are retried transparently.
+
+Usage (from backend/):
+    python benchmarks/bench_openai_client.py [--calls 50]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_openai_server import FakeOpenAIServer  # noqa: E402
+from openai_client import OpenAIClient  # noqa: E402
+
+MESSAGES = [{"role": "user", "content": "hi"}]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=50)
+    args = parser.parse_args()
+
+    with FakeOpenAIServer() as server:
+        start = time.perf_counter()
+        for _ in range(args.calls):
+            requests.post(f"{server.base_url}/chat/completions",
+                          json={"model": "m", "messages": MESSAGES}, timeout=10).json()
+        naive = time.perf_counter() - start
+        naive_conns = len(server.connections)
+
+        server.reset_counters()
+        client = OpenAIClient(server.base_url, "key", "m")
+        start = time.perf_counter()
+        for i in range(args.calls):
+            if i % 2:
+                client.chat(MESSAGES)
+            else:
+                "".join(client.chat_stream(MESSAGES))
+        client.list_models()
+        pooled = time.perf_counter() - start
+        pooled_conns = len(server.connections)
+        client.close()
+
+    print(f"requests.post: {args.calls} calls, {naive_conns} connections, {naive * 1000:.1f} ms")
+    print(f"OpenAIClient:  {args.calls + 1} calls, {pooled_conns} connections, {pooled * 1000:.1f} ms")
+    assert pooled_conns == 1, f"expected a single reused connection, got {pooled_conns}"
+
+    with FakeOpenAIServer(fail_first=2, retry_after="0.2") as server:
+        client = OpenAIClient(server.base_url, "key", "m", backoff_base=0.01)
+        start = time.perf_counter()
+        text = client.chat(MESSAGES)
+        elapsed = time.perf_counter() - start
+        print(f"retry: {server.requests} requests for one call, waited {elapsed:.2f}s, got {text!r}")
+        assert server.requests == 3 and elapsed >= 0.4
+
+    print("ok")
+
+
+if __name__ == "__main__":
+    main()
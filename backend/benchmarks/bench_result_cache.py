@@ -0,0 +1,96 @@
+"""
+Cold vs. cached SAM3 analysis through the content-addressed result cache.
+
+Runs SAM3Predictor with the fake video predictor (benchmarks/fake_sam3_model.py,
+--frame-cost seconds per propagated megapixel-frame) on a synthetic clip, stores the
+result in a SAM3ResultCache keyed by the clip's sha256 and the predictor's config
+fingerprint, then times lookups. Checks that changing an inference option misses,
+that the cached result and tracks match the original, and that the cache evicts
+least-recently-used entries once it exceeds its size limit.
+
+Usage (from backend/):
+    python benchmarks/bench_result_cache.py [--frame-cost 0.03] [--lookups 100]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_sam3_model import FakeSAM3Model, make_synthetic_clip  # noqa: E402
+from sam3_cache import SAM3ResultCache, cache_key  # noqa: E402
+from sam3_service.predictor import SAM3Predictor  # noqa: E402
+from track_store import load_tracks  # noqa: E402
+from video_utils import file_sha256  # noqa: E402
+
+CLIP_PATH = "/tmp/bench_sam3_synthetic.mp4"
+
+
+def make_predictor(frame_cost: float) -> SAM3Predictor:
+    predictor = SAM3Predictor(use_mock=True)
+    predictor.use_mock = False
+    predictor.model = FakeSAM3Model(frame_cost)
+    return predictor
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--video", default=None, help="defaults to a generated 12s synthetic clip")
+    parser.add_argument("--frame-cost", type=float, default=0.03, help="seconds per propagated megapixel-frame")
+    parser.add_argument("--lookups", type=int, default=100)
+    args = parser.parse_args()
+
+    video_path = args.video or CLIP_PATH
+    if not os.path.exists(video_path):
+        make_synthetic_clip(video_path)
+    predictor = make_predictor(args.frame_cost)
+
+    with tempfile.TemporaryDirectory() as root:
+        cache = SAM3ResultCache(root, max_bytes=64 * 1024 * 1024)
+
+        start = time.perf_counter()
+        sha256 = file_sha256(video_path)
+        config = predictor.config_fingerprint()
+        key = cache_key(sha256, config)
+        assert cache.get(key) is None
+        result = predictor.process_video(video_path, return_tracks=True)
+        tracks = result.pop("tracks")
+        cache.put(key, sha256, result["predictor_config"], result, tracks)
+        cold = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for _ in range(args.lookups):
+            hit = cache.get(cache_key(file_sha256(video_path), predictor.config_fingerprint()))
+            cached_tracks = load_tracks(hit["tracks_path"])
+        warm = (time.perf_counter() - start) / args.lookups
+
+        print(f"cold analysis  {cold * 1000:9.1f} ms")
+        print(f"cached lookup  {warm * 1000:9.3f} ms ({cold / warm:.0f}x faster)")
+
+        assert result["predictor_config"] == config
+        assert hit["result"]["vehicles"] == result["vehicles"]
+        for name, column in tracks.items():
+            assert np.array_equal(cached_tracks[name], column), name
+        assert cache.get(cache_key(sha256, predictor.config_fingerprint(frame_stride=2))) is None
+
+        # Eviction: shrink the limit to about two entries, then add three more under fake keys
+        cache.max_bytes = cache.stats()["bytes"] * 2 + 1
+        for i in range(3):
+            cache.put(f"evict-{i}", sha256, config, result, tracks)
+            time.sleep(0.01)
+        stats = cache.stats()
+        print(f"after eviction {stats}")
+        assert stats["entries"] == 2 and stats["bytes"] <= cache.max_bytes
+        assert cache.get(key) is None and cache.get("evict-2") is not None
+        assert sorted(os.listdir(root)) == sorted(
+            ["index.sqlite"] + [f"evict-{i}{suffix}" for i in (1, 2) for suffix in (".json", "_tracks.npz")])
+    print("ok")
+
+
+if __name__ == "__main__":
+    main()
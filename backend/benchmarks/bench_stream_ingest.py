@@ -0,0 +1,130 @@
+"""
+End-to-end violation detection latency of SAM3Predictor.process_stream.
+
+A fake live camera writes the synthetic clip of benchmarks/fake_sam3_model.py, in real
+time (--speed times faster with --speed), to a growing MPEG-TS file. The predictor
+follows that file with the fake SAM3 model (--frame-cost seconds per propagated
+megapixel-frame) for each --windows window length. Latencies are measured for the frame
+at which a parked car had been stationary for VIOLATION_DURATION_SEC:
+
+  pipeline   from the predictor reading that frame to the violation event
+  camera     from the camera writing that frame; also includes the muxer's write
+             buffering and the reader's polling
+
+Checks that both parked cars, and only they, are reported, exactly once each, at the
+frame where the threshold is crossed. Stable ids across windows are therefore required:
+a car whose id changed between windows would restart its stationary run. Also checks
+that the verdicts match process_video on the finished recording.
+
+Tracking runs at --stride: at full frame rate the stationary threshold
+(STATIONARY_THRESHOLD_PX per second) is under half a pixel per frame, so 1 px of box
+jitter from compression noise ends a run.
+
+Usage (from backend/):
+    python benchmarks/bench_stream_ingest.py [--seconds 12] [--windows 1 2 4] [--speed 1] [--stride 5] [--frame-cost 0.01]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_sam3_model import CLIP_SIZE, FakeSAM3Model, synthetic_frame  # noqa: E402
+from sam3_service.predictor import VIOLATION_DURATION_SEC, SAM3Predictor  # noqa: E402
+
+FPS = 25
+
+
+class FakeCamera(threading.Thread):
+    """
+    Writes the synthetic clip to an MPEG-TS file frame by frame, paced like a live camera.
+    Frames carry sensor noise: flat synthetic frames encode to a few hundred bytes and
+    would sit in the muxer's write buffer for seconds.
+    """
+
+    def __init__(self, path: str, seconds: int, speed: float):
+        super().__init__(daemon=True)
+        self.path = path
+        self.frames = seconds * FPS
+        self.interval = 1 / (FPS * speed)
+        self.written_at = {}
+
+    def run(self):
+        writer = cv2.VideoWriter(self.path, cv2.VideoWriter_fourcc(*"mp4v"), FPS, CLIP_SIZE)
+        rng = np.random.default_rng(0)
+        start = time.monotonic()
+        for fi in range(self.frames):
+            time.sleep(max(0.0, start + fi * self.interval - time.monotonic()))
+            noise = rng.integers(-24, 25, size=(CLIP_SIZE[1], CLIP_SIZE[0], 3), dtype=np.int16)
+            writer.write(np.clip(synthetic_frame(fi, FPS) + noise, 0, 255).astype(np.uint8))
+            self.written_at[fi] = time.monotonic()
+        writer.release()
+
+
+def make_predictor(frame_cost: float) -> SAM3Predictor:
+    predictor = SAM3Predictor(use_mock=True)
+    predictor.use_mock = False
+    predictor.model = FakeSAM3Model(frame_cost)
+    return predictor
+
+
+def run(args, window_sec: float, root: str) -> dict:
+    path = os.path.join(root, f"camera_{window_sec}.ts")
+    camera = FakeCamera(path, args.seconds, args.speed)
+    camera.start()
+    violations, windows = [], []
+    for event in make_predictor(args.frame_cost).process_stream(
+            path, window_sec=window_sec, frame_stride=args.stride, idle_timeout_sec=2.0):
+        if event["type"] == "violation":
+            event["camera_latency_sec"] = time.monotonic() - camera.written_at[event["frame_index"]]
+            violations.append(event)
+        elif event["type"] == "window":
+            windows.append(event)
+        elif event["type"] == "error":
+            raise RuntimeError(event["error"])
+    camera.join()
+    return {"path": path, "violations": violations, "windows": windows}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=int, default=12)
+    parser.add_argument("--windows", type=float, nargs="+", default=[1.0, 2.0, 4.0])
+    parser.add_argument("--speed", type=float, default=1.0)
+    parser.add_argument("--stride", type=int, default=5)
+    parser.add_argument("--frame-cost", type=float, default=0.01)
+    args = parser.parse_args()
+
+    trigger = int(VIOLATION_DURATION_SEC * FPS)
+    assert trigger % args.stride == 0, "--stride must divide the trigger frame"
+    with tempfile.TemporaryDirectory() as root:
+        print(f"{args.seconds}s camera at {args.speed}x real time; violations complete at frame {trigger}")
+        print(f"{'window':>8s} {'pipeline latency':>18s} {'camera latency':>16s} {'inference/window':>18s}")
+        for window_sec in args.windows:
+            result = run(args, window_sec, root)
+            violations = result["violations"]
+            pipeline = [v["latency_sec"] for v in violations]
+            camera = [v["camera_latency_sec"] for v in violations]
+            inference = np.mean([w["inference_sec"] for w in result["windows"]])
+            print(f"{window_sec:7.1f}s {np.mean(pipeline) * 1000:15.0f} ms {np.mean(camera) * 1000:13.0f} ms "
+                  f"{inference * 1000:15.0f} ms")
+
+            # Red and blue are parked from frame 0; green drives past
+            assert len(violations) == 2, violations
+            assert len({v["track_id"] for v in violations}) == 2
+            assert all(v["frame_index"] == trigger and v["stationary_start_frame"] == 0 for v in violations), violations
+
+            batch = make_predictor(args.frame_cost).process_video(result["path"], frame_stride=args.stride)
+            assert sum(v["is_violation"] for v in batch["vehicles"]) == 2
+    print("ok")
+
+
+if __name__ == "__main__":
+    main()
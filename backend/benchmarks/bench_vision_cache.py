@@ -0,0 +1,125 @@
+"""
+Vision-model calls saved by the response cache.
+
+Runs the agent's plate-recognition tool on the parked vehicles of a synthetic clip
+(benchmarks/fake_sam3_model.py) against a local fake OpenAI server with --latency
+seconds per request. It samples several frames per vehicle and runs twice, first
+with an empty cache and then with a warm one. Checks that:
+
+  - plate crops are matched on exact content: byte-identical crops are served from
+    the cache, and the warm run makes no model call;
+  - a near-identical crop (re-encoded, with sensor noise) hits the perceptual-hash
+    lookup used for scene analysis, but never the exact plate lookup;
+  - a different car and a different prompt still miss;
+  - unreadable plates ("N/A") are not cached.
+
+Usage (from backend/):
+    python benchmarks/bench_vision_cache.py [--latency 0.5] [--frames 10]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import agent_tools  # noqa: E402
+from benchmarks.fake_openai_server import FakeOpenAIServer  # noqa: E402
+from benchmarks.fake_sam3_model import VEHICLES, make_synthetic_clip  # noqa: E402
+from openai_client import OpenAIClient  # noqa: E402
+from video_utils import frame_to_base64  # noqa: E402
+from vision_cache import VisionResponseCache, content_key, image_key  # noqa: E402
+
+CLIP_PATH = "/tmp/bench_sam3_synthetic.mp4"
+
+
+def textured_crop(seed: int) -> np.ndarray:
+    """A vehicle-sized crop with smooth texture and a plate-like label."""
+    rng = np.random.default_rng(seed)
+    texture = cv2.resize(rng.uniform(0, 255, (6, 8, 3)), (160, 120), interpolation=cv2.INTER_CUBIC)
+    crop = np.clip(texture, 0, 255).astype(np.uint8)
+    cv2.rectangle(crop, (40, 80), (120, 105), (255, 255, 255), thickness=-1)
+    cv2.putText(crop, f"A{seed}2345", (44, 100), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 0), 2)
+    return crop
+
+
+def run(video_path: str, frames: list) -> float:
+    start = time.perf_counter()
+    for name in ("red", "blue"):
+        bbox = list(VEHICLES[name][1])
+        for frame_index in frames:
+            agent_tools.tool_recognize_license_plate(video_path, frame_index, bbox)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--video", default=None, help="defaults to a generated 12s synthetic clip")
+    parser.add_argument("--latency", type=float, default=0.5, help="seconds per fake model request")
+    parser.add_argument("--frames", type=int, default=10, help="frames sampled per parked vehicle")
+    args = parser.parse_args()
+
+    video_path = args.video or CLIP_PATH
+    if not os.path.exists(video_path):
+        make_synthetic_clip(video_path)
+    frames = [i * 25 for i in range(args.frames)]
+
+    with FakeOpenAIServer(latency=args.latency) as server, tempfile.TemporaryDirectory() as root:
+        agent_tools.set_client(OpenAIClient(server.base_url, "key", "m"), "vision-m")
+
+        agent_tools.set_vision_cache(None)
+        uncached = run(video_path, frames)
+        uncached_requests = server.requests
+
+        cache = VisionResponseCache(os.path.join(root, "vision.sqlite"), ttl_sec=3600)
+        agent_tools.set_vision_cache(cache)
+        server.reset_counters()
+        cold = run(video_path, frames)
+        cold_requests = server.requests
+        server.reset_counters()
+        warm = run(video_path, frames)
+        warm_requests = server.requests
+
+        print(f"no cache    {uncached_requests:3d} requests {uncached:6.2f}s")
+        print(f"cold cache  {cold_requests:3d} requests {cold:6.2f}s")
+        print(f"warm cache  {warm_requests:3d} requests {warm:6.3f}s ({uncached / warm:.0f}x faster)")
+        print(cache.stats())
+        # Frames of a parked car that decode to the same pixels share one request
+        assert uncached_requests == 2 * len(frames)
+        assert cold_requests <= uncached_requests and warm_requests == 0
+
+        # Tolerance checks on textured crops (flat synthetic rectangles carry no gradient to hash)
+        crop = textured_crop(seed=1)
+        _, jpeg = cv2.imencode(".jpg", crop, [cv2.IMWRITE_JPEG_QUALITY, 60])
+        noisy = cv2.imdecode(jpeg, cv2.IMREAD_COLOR).astype(np.float64)
+        noisy = np.clip(noisy + np.random.default_rng(0).normal(0, 3, noisy.shape), 0, 255).astype(np.uint8)
+        distance = bin(image_key(crop)[0] ^ image_key(noisy)[0]).count("1")
+        print(f"re-encoded + noisy crop: hamming distance {distance}")
+        cache.put("vision-m", "scene", image_key(crop), "{}")
+        assert cache.get("vision-m", "scene", image_key(noisy)) == "{}"
+        assert cache.get("vision-m", "other", image_key(noisy)) is None
+        assert cache.get("vision-m", "scene", image_key(textured_crop(seed=2))) is None
+
+        crop_b64 = frame_to_base64(crop)
+        cache.put_exact("vision-m", "plate", content_key(crop_b64), "A12345")
+        assert cache.get_exact("vision-m", "plate", content_key(crop_b64)) == "A12345"
+        assert cache.get_exact("vision-m", "plate", content_key(frame_to_base64(noisy))) is None
+        assert cache.get_exact("vision-m", "plate", content_key(frame_to_base64(textured_crop(seed=2)))) is None
+
+        # Unreadable answers are asked again next time
+        cache.clear()
+        server.reset_counters()
+        server.reply = "N/A"
+        for _ in range(2):
+            agent_tools.tool_recognize_license_plate(video_path, frames[0], list(VEHICLES["red"][1]))
+        assert server.requests == 2, server.requests
+    print("ok")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+Minimal local OpenAI-compatible server for benchmarks.
+
+Serves POST /chat/completions (streaming and non-streaming, tool calls optional)
+and GET /models over HTTP/1.1 keep-alive, with configurable latency and
+injectable 429 responses. Counts distinct client connections so callers can
+check connection reuse.
+
+Usage as a script (from backend/):
+    python benchmarks/fake_openai_server.py --port 8900 --latency 0.2
+"""
+
+import argparse
+import json
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # The default backlog of 5 resets connections when many clients connect at once
+    request_queue_size = 256
+
+
+class FakeOpenAIServer:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0,
+                 stream_chunks: int = 20, fail_first: int = 0, retry_after: str = "0"):
+        self.latency = latency
+        self.stream_chunks = stream_chunks
+        self.fail_first = fail_first
+        self.retry_after = retry_after
+        # Text of non-streamed, non-tool replies
+        self.reply = "京A12345"
+        self.requests = 0
+        self.connections = set()
+        self._lock = threading.Lock()
+        self._httpd = _Server((host, port), self._make_handler())
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeOpenAIServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def reset_counters(self):
+        with self._lock:
+            self.requests = 0
+            self.connections = set()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                # Headers and body are written separately; without NODELAY keep-alive
+                # connections stall on Nagle + delayed ACK
+                self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            def log_message(self, *args):
+                pass
+
+            def _count(self) -> int:
+                with server._lock:
+                    server.connections.add(self.client_address)
+                    server.requests += 1
+                    return server.requests
+
+            def _send_json(self, status: int, body: dict, headers: dict = None):
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for k, v in (headers or {}).items():
+                    self.send_header(k, v)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                self._count()
+                if self.path.rstrip("/").endswith("/models"):
+                    self._send_json(200, {"data": [{"id": "fake-model", "owned_by": "bench"}]})
+                else:
+                    self._send_json(404, {"error": "not found"})
+
+            def do_POST(self):
+                n = self._count()
+                length = int(self.headers.get("Content-Length", 0))
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                if n <= server.fail_first:
+                    self._send_json(429, {"error": "rate limited"}, {"Retry-After": server.retry_after})
+                    return
+                if server.latency:
+                    time.sleep(server.latency)
+
+                if payload.get("stream"):
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/event-stream")
+                    self.send_header("Transfer-Encoding", "chunked")
+                    self.end_headers()
+                    for i in range(server.stream_chunks):
+                        chunk = {"choices": [{"delta": {"content": f"tok{i} "}}]}
+                        self._write_chunk(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                    self._write_chunk(b"data: [DONE]\n\n")
+                    self._write_chunk(b"")
+                    return
+
+                message = {"role": "assistant", "content": server.reply}
+                finish_reason = "stop"
+                if payload.get("tools") and not any(m.get("role") == "tool" for m in payload.get("messages", [])):
+                    message = {"role": "assistant", "content": "", "tool_calls": [{
+                        "id": "call_0", "type": "function",
+                        "function": {"name": "analyze_scene_frame", "arguments": json.dumps({"frame_index": 0})},
+                    }]}
+                    finish_reason = "tool_calls"
+                elif payload.get("tools"):
+                    message["content"] = "[]"
+                self._send_json(200, {"choices": [{"message": message, "finish_reason": finish_reason}]})
+
+            def _write_chunk(self, data: bytes):
+                self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+                self.wfile.flush()
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency", type=float, default=0.2)
+    args = parser.parse_args()
+    server = FakeOpenAIServer(args.host, args.port, latency=args.latency)
+    print(f"fake OpenAI server on {server.base_url}")
+    server._httpd.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
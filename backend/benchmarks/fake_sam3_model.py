@@ -0,0 +1,121 @@
+"""
+Fake SAM 3 video predictor for benchmarks.
+
+Implements the session API SAM3Predictor uses (start_session / add_prompt /
+reset_session / propagate_in_video / close_session). "Vehicles" are solid
+coloured rectangles drawn by make_synthetic_clip; each text prompt maps to the
+colours it detects, and the fake segments them by colour on the frames of the
+clip it is given. It therefore sees exactly what a real model would after
+stride, downscale and ROI masking. Each propagated frame additionally costs
+frame_cost seconds per megapixel to stand in for GPU time.
+
+Sessions are independent, so chunks can be tracked concurrently. With
+load_frames=True start_session decodes the whole clip into memory, as SAM 3's
+session does with its frame tensor; memory then grows with the clip's length.
+"""
+
+import itertools
+import threading
+import time
+
+import cv2
+import numpy as np
+
+# name -> (BGR colour, (x1, y1, x2, y2) at t=0, horizontal speed px/s)
+VEHICLES = {
+    "red": ((0, 0, 255), (100, 250, 180, 300), 0.0),     # parked at the curb
+    "green": ((0, 255, 0), (20, 200, 100, 240), 25.0),   # driving past
+    "blue": ((255, 0, 0), (420, 40, 540, 120), 0.0),     # parked far from the curb
+}
+# prompt -> vehicles it detects; "van" re-detects the red car to exercise de-duplication
+PROMPT_COLORS = {"car": ["red", "green"], "van": ["red"], "truck": [], "bus": ["blue"]}
+CLIP_SIZE = (640, 360)
+COLOR_TOLERANCE = 60
+
+
+def synthetic_frame(frame_idx: int, fps: int = 25) -> np.ndarray:
+    w, h = CLIP_SIZE
+    frame = np.full((h, w, 3), 40, dtype=np.uint8)
+    for color, (x1, y1, x2, y2), speed in VEHICLES.values():
+        dx = int(speed * frame_idx / fps)
+        cv2.rectangle(frame, (x1 + dx, y1), (x2 + dx, y2), color, thickness=-1)
+    return frame
+
+
+def make_synthetic_clip(path: str, seconds: int = 12, fps: int = 25) -> str:
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, CLIP_SIZE)
+    for frame_idx in range(seconds * fps):
+        writer.write(synthetic_frame(frame_idx, fps))
+    writer.release()
+    return path
+
+
+class FakeSAM3Model:
+    def __init__(self, frame_cost: float = 0.0, load_frames: bool = False):
+        self.frame_cost = frame_cost
+        self.load_frames = load_frames
+        self.propagations = 0
+        self.frames_propagated = 0
+        self.sessions = {}
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+
+    def handle_request(self, request: dict) -> dict:
+        kind = request["type"]
+        if kind == "start_session":
+            session_id = f"s{next(self._ids)}"
+            path = request["resource_path"]
+            self.sessions[session_id] = {"path": path, "active": {},
+                                         "frames": list(self._read(path)) if self.load_frames else None}
+            return {"session_id": session_id}
+        session = self.sessions[request["session_id"]]
+        if kind == "reset_session":
+            session["active"] = {}
+        elif kind == "add_prompt":
+            found = {f"{request['text']}:{name}": name for name in PROMPT_COLORS[request["text"]]}
+            session["active"].update(found)
+            frame = next(iter(session["frames"] or self._read(session["path"])), None)
+            outputs = self._detect(frame, found) if frame is not None else {}
+            return {"frame_index": 0, "outputs": outputs}
+        elif kind == "close_session":
+            del self.sessions[request["session_id"]]
+        return {}
+
+    def handle_stream_request(self, request: dict):
+        assert request["type"] == "propagate_in_video"
+        session = self.sessions[request["session_id"]]
+        with self._lock:
+            self.propagations += 1
+        frames = session["frames"] if session["frames"] is not None else self._read(session["path"])
+        for frame_idx, frame in enumerate(frames):
+            if self.frame_cost:
+                time.sleep(self.frame_cost * frame.shape[0] * frame.shape[1] / 1e6)
+            with self._lock:
+                self.frames_propagated += 1
+            yield {"frame_index": frame_idx, "outputs": self._detect(frame, session["active"])}
+
+    @staticmethod
+    def _read(path: str):
+        cap = cv2.VideoCapture(path)
+        try:
+            while True:
+                ok, frame = cap.read()
+                if not ok:
+                    break
+                yield frame
+        finally:
+            cap.release()
+
+    @staticmethod
+    def _detect(frame: np.ndarray, objects: dict) -> dict:
+        outputs = {}
+        for obj_id, name in objects.items():
+            color = np.array(VEHICLES[name][0], dtype=np.int16)
+            lower = np.clip(color - COLOR_TOLERANCE, 0, 255).astype(np.uint8)
+            upper = np.clip(color + COLOR_TOLERANCE, 0, 255).astype(np.uint8)
+            points = cv2.findNonZero(cv2.inRange(frame, lower, upper))
+            if points is None:
+                continue
+            x, y, w, h = cv2.boundingRect(points)
+            outputs[obj_id] = {"boxes": np.array([[x, y, x + w, y + h]], dtype=np.float64), "scores": [0.9]}
+        return outputs
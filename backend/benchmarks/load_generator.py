@@ -0,0 +1,56 @@
+"""
+Seeded synthetic load for end-to-end benchmarks (see bench_end_to_end.py).
+
+make_clip writes a clip of the given length, resolution and vehicle count: a
+textured background with solid "vehicles", the first parked and the others
+driving across. Everything is drawn from a seeded RNG, so the same arguments
+always give the same file.
+
+The mock engine of SAM3Predictor does not look at pixels. mock_predictor
+configures it with the same seed and vehicle count, so that every run of a
+benchmark sees the same tracks and verdicts.
+"""
+
+import os
+import sys
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sam3_service.predictor import SAM3Predictor  # noqa: E402
+
+
+def make_clip(path: str, seconds: float = 20, size: tuple = (1280, 720), vehicles: int = 3,
+              seed: int = 0, fps: int = 25) -> str:
+    rng = np.random.default_rng(seed)
+    w, h = size
+    # Low-frequency texture: compresses like a real scene rather than a flat colour
+    background = cv2.resize(rng.uniform(30, 120, (max(1, h // 40), max(1, w // 40), 3)), size,
+                            interpolation=cv2.INTER_CUBIC)
+    background = np.clip(background, 0, 255).astype(np.uint8)
+    cars = []
+    for i in range(vehicles):
+        vw, vh = int(rng.integers(w // 16, w // 8)), int(rng.integers(h // 16, h // 8))
+        x, y = int(rng.integers(0, w - vw)), int(rng.integers(h // 4, h - vh))
+        speed = 0.0 if i == 0 else float(rng.uniform(0.02, 0.05) * w)
+        color = tuple(int(c) for c in rng.integers(128, 256, 3))
+        cars.append((x, y, vw, vh, speed, color))
+
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, size)
+    for fi in range(int(seconds * fps)):
+        frame = background.copy()
+        for x, y, vw, vh, speed, color in cars:
+            x1 = int(x + speed * fi / fps) % w
+            cv2.rectangle(frame, (x1, y), (x1 + vw, y + vh), color, thickness=-1)
+        writer.write(frame)
+    writer.release()
+    return path
+
+
+def mock_predictor(predictor: SAM3Predictor, seed: int, vehicles: int) -> SAM3Predictor:
+    """Make predictor's mock engine deterministic with a fixed vehicle count."""
+    predictor.mock_seed = seed
+    predictor.mock_vehicles = (vehicles, vehicles)
+    return predictor
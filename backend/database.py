@@ -1,7 +1,59 @@
 import os
+import time
+
+from sqlalchemy import event, inspect, text
+from sqlalchemy.orm import Session
+
+from metrics import DB_COMMIT_SECONDS
 from models import db
 
 
+def _commit_started(session):
+    session.info["commit_started"] = time.perf_counter()
+
+
+def _commit_finished(session, outcome: str):
+    start = session.info.pop("commit_started", None)
+    if start is not None:
+        DB_COMMIT_SECONDS.observe(time.perf_counter() - start, outcome=outcome)
+
+
+def _commit_ok(session):
+    _commit_finished(session, "ok")
+
+
+def _commit_failed(session):
+    # 只有提交过程中的回滚才计入（普通 rollback 没有 commit_started）
+    _commit_finished(session, "error")
+
+
+def _instrument_commits():
+    """commit 耗时（含 flush）计入 db_commit_seconds；before_commit 在 flush 之前触发"""
+    if event.contains(Session, "before_commit", _commit_started):
+        return
+    event.listen(Session, "before_commit", _commit_started)
+    event.listen(Session, "after_commit", _commit_ok)
+    event.listen(Session, "after_rollback", _commit_failed)
+
+
+def _migrate_camera_profiles():
+    """
+    camera_profiles created before profiles had owners: add user_id, and make names unique
+    per owner instead of globally (create_all never alters an existing table).
+    """
+    inspector = inspect(db.engine)
+    if "camera_profiles" not in inspector.get_table_names():
+        return
+    if "user_id" in {column["name"] for column in inspector.get_columns("camera_profiles")}:
+        return
+    with db.engine.begin() as conn:
+        conn.execute(text("ALTER TABLE camera_profiles ADD COLUMN user_id INTEGER REFERENCES users (id)"))
+        conn.execute(text("DROP INDEX IF EXISTS ix_camera_profiles_name"))
+        conn.execute(text("CREATE INDEX ix_camera_profiles_name ON camera_profiles (name)"))
+        conn.execute(text("CREATE INDEX ix_camera_profiles_user_id ON camera_profiles (user_id)"))
+        conn.execute(text("CREATE UNIQUE INDEX uq_camera_profiles_user_name ON camera_profiles (user_id, name)"))
+
+
 def init_db(app):
     """Initialize the database"""
     # Configure database
@@ -18,10 +70,12 @@ def init_db(app):
 
     # Initialize SQLAlchemy with app
     db.init_app(app)
+    _instrument_commits()
 
     # Create tables
     with app.app_context():
         db.create_all()
+        _migrate_camera_profiles()
         print(f"Database initialized at {db_path}")
 
 
@@ -0,0 +1,347 @@
+"""
+Process pool for video decode / crop / encode work.
+
+OpenCV decoding releases the GIL only partly, and a long decode in a request thread
+holds up everything else the worker serves. DecodePool moves that work into a few
+dedicated processes:
+
+- Large results (frames, ROI stacks) come back through one shared-memory block per
+  task. Only a small layout description is pickled, never the ndarrays themselves.
+- Submissions are bounded. When max_pending tasks are in flight, callers block for up
+  to submit_timeout seconds and then get DecodePoolBusy.
+- Every result carries the worker's pid, busy time and frame count, aggregated
+  per worker in stats().
+- A worker that dies (OOM kill, crash inside the decoder) breaks the whole executor.
+  The broken pool is discarded and the task retried once on a fresh one; a second
+  failure is raised, so an input that crashes the decoder never runs in the caller.
+
+With workers=0 the same tasks run inline in the calling thread.
+
+Workers are spawned, so each one imports the parent's __main__ module again. Start
+the web app through a side-effect-free entry module (run.py), not `python app.py`.
+"""
+
+import atexit
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from metrics import DECODE_POOL_TASK_SECONDS
+from video_utils import (
+    extract_frames, extract_region_stacks, crop_region, frame_to_base64, frame_cache, release_decoders
+)
+from vision_cache import image_key
+
+
+DEFAULT_MAX_PENDING = 32
+DEFAULT_SUBMIT_TIMEOUT_SEC = 30.0
+# Decoded-frame cache budget of each worker process
+WORKER_FRAME_CACHE_BYTES = 64 * 1024 * 1024
+
+
+class DecodePoolBusy(RuntimeError):
+    """Raised when the submission queue stays full for longer than submit_timeout."""
+
+
+# ── Tasks (run in worker processes, or inline) ─────────────────────────────
+# Each returns (result, frames_decoded); ndarrays anywhere in result are handed off via shared memory.
+
+def _task_crop_jpegs(video_path: str, items: list) -> tuple:
+    """
+    items: [(frame_index, bbox or None)]. For each item returns ("ok", jpeg_base64, image_key),
+    ("no_frame", None, None) or ("empty", None, None); bbox None encodes the whole frame.
+    """
+    frames = extract_frames(video_path, [fi for fi, _ in items])
+    results = []
+    for frame_index, bbox in items:
+        frame = frames.get(int(frame_index))
+        if frame is None:
+            results.append(("no_frame", None, None))
+            continue
+        image = crop_region(frame, bbox) if bbox is not None else frame
+        if image.size == 0:
+            results.append(("empty", None, None))
+            continue
+        results.append(("ok", frame_to_base64(image), image_key(image)))
+    return results, len(frames)
+
+
+def _task_region_stacks(video_path: str, frame_indices: list, bboxes: list) -> tuple:
+    decoded, stacks = extract_region_stacks(video_path, frame_indices, bboxes)
+    return (decoded, stacks), len(decoded)
+
+
+def _task_frames(video_path: str, frame_indices: list, size: tuple, grayscale: bool) -> tuple:
+    frames = extract_frames(video_path, frame_indices, size=size, grayscale=grayscale)
+    # The frames may be read-only views into this worker's frame cache; _pack copies them into
+    # shared memory, so the caller always gets plain writable arrays of its own
+    return frames, len(frames)
+
+
+_TASKS = {
+    "crop_jpegs": _task_crop_jpegs,
+    "region_stacks": _task_region_stacks,
+    "frames": _task_frames,
+}
+
+
+# ── Shared-memory handoff ─────────────────────────────────────────────────
+
+class _ArrayRef:
+    """Placeholder for an ndarray stored in the task's shared-memory block."""
+
+    __slots__ = ("offset", "shape", "dtype")
+
+    def __init__(self, offset: int, shape: tuple, dtype: str):
+        self.offset = offset
+        self.shape = shape
+        self.dtype = dtype
+
+
+def _collect_arrays(obj, out: list):
+    if isinstance(obj, np.ndarray):
+        out.append(obj)
+    elif isinstance(obj, (list, tuple)):
+        for item in obj:
+            _collect_arrays(item, out)
+    elif isinstance(obj, dict):
+        for item in obj.values():
+            _collect_arrays(item, out)
+
+
+def _replace(obj, fn):
+    if isinstance(obj, (np.ndarray, _ArrayRef)):
+        return fn(obj)
+    if isinstance(obj, list):
+        return [_replace(item, fn) for item in obj]
+    if isinstance(obj, tuple):
+        return tuple(_replace(item, fn) for item in obj)
+    if isinstance(obj, dict):
+        return {key: _replace(value, fn) for key, value in obj.items()}
+    return obj
+
+
+def _pack(result) -> tuple:
+    """Copy every ndarray in result into one new shared-memory block; returns (result with refs, name, bytes)."""
+    arrays = []
+    _collect_arrays(result, arrays)
+    total = sum(a.nbytes for a in arrays)
+    if total == 0:
+        return result, None, 0
+
+    shm = shared_memory.SharedMemory(create=True, size=total)
+    offsets = {}
+    offset = 0
+    for array in arrays:
+        view = np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf, offset=offset)
+        view[...] = array
+        offsets[id(array)] = offset
+        offset += array.nbytes
+    del view
+    packed = _replace(result, lambda a: _ArrayRef(offsets[id(a)], a.shape, a.dtype.str))
+    shm.close()
+    return packed, shm.name, total
+
+
+def _unpack(packed, shm_name: str):
+    """Materialize the refs as arrays owned by this process, then release the block."""
+    if shm_name is None:
+        return packed
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        return _replace(packed, lambda ref: np.ndarray(
+            ref.shape, dtype=np.dtype(ref.dtype), buffer=shm.buf, offset=ref.offset).copy())
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+# (mtime_ns, size) of each video a worker has decoded, to notice files replaced by an upload
+_seen_files = {}
+
+
+def _init_worker(frame_cache_bytes: int):
+    frame_cache.configure(frame_cache_bytes)
+
+
+def _refresh_file(video_path: str):
+    """Drop this worker's decoder and cached frames when the file changed since it was last read."""
+    try:
+        st = os.stat(video_path)
+    except OSError:
+        return
+    identity = (st.st_mtime_ns, st.st_size)
+    previous = _seen_files.get(video_path)
+    if previous is not None and previous != identity:
+        release_decoders(video_path)
+        frame_cache.invalidate(video_path)
+    _seen_files[video_path] = identity
+
+
+def _run_in_worker(task: str, args: tuple) -> tuple:
+    start = time.perf_counter()
+    _refresh_file(args[0])
+    result, frames = _TASKS[task](*args)
+    packed, shm_name, nbytes = _pack(result)
+    return os.getpid(), time.perf_counter() - start, frames, nbytes, packed, shm_name
+
+
+# ── Pool ─────────────────────────────────────────────────────────────────
+
+class DecodePool:
+    """Bounded process pool for decode work; processes start on first use."""
+
+    def __init__(self, workers: int = 0, max_pending: int = DEFAULT_MAX_PENDING,
+                 submit_timeout: float = DEFAULT_SUBMIT_TIMEOUT_SEC,
+                 worker_frame_cache_bytes: int = WORKER_FRAME_CACHE_BYTES):
+        self._lock = threading.Lock()
+        self._executor = None
+        self.workers = 0
+        self.configure(workers, max_pending, submit_timeout, worker_frame_cache_bytes)
+        atexit.register(self.shutdown)
+
+    def configure(self, workers: int, max_pending: int = DEFAULT_MAX_PENDING,
+                  submit_timeout: float = DEFAULT_SUBMIT_TIMEOUT_SEC,
+                  worker_frame_cache_bytes: int = WORKER_FRAME_CACHE_BYTES):
+        self.shutdown()
+        with self._lock:
+            self.workers = max(0, int(workers))
+            self.max_pending = max(1, int(max_pending))
+            self.submit_timeout = submit_timeout
+            self.worker_frame_cache_bytes = worker_frame_cache_bytes
+            self._slots = threading.BoundedSemaphore(self.max_pending)
+            self._pending = 0
+            self.submitted = 0
+            self.completed = 0
+            self.failed = 0
+            self.rejected = 0
+            self.waited = 0
+            self.wait_sec = 0.0
+            self.restarts = 0
+            self._worker_stats = {}
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # spawn: forking a threaded Flask process can deadlock on locks held by other threads
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(self.worker_frame_cache_bytes,),
+                )
+            return self._executor
+
+    def _discard_executor(self, executor: ProcessPoolExecutor):
+        """Drop a broken executor; concurrent callers that saw the same breakage leave a fresh pool alone."""
+        with self._lock:
+            if self._executor is not executor:
+                return
+            self._executor = None
+            self.restarts += 1
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _submit(self, task: str, args: tuple) -> tuple:
+        executor = self._get_executor()
+        try:
+            return executor.submit(_run_in_worker, task, args).result()
+        except BrokenProcessPool:
+            self._discard_executor(executor)
+            raise
+
+    def _record(self, pid: int, busy: float, frames: int, nbytes: int):
+        with self._lock:
+            stats = self._worker_stats.setdefault(pid, {"tasks": 0, "busy_sec": 0.0, "frames": 0, "shm_bytes": 0})
+            stats["tasks"] += 1
+            stats["busy_sec"] += busy
+            stats["frames"] += frames
+            stats["shm_bytes"] += nbytes
+            self.completed += 1
+
+    def _call(self, task: str, *args):
+        with DECODE_POOL_TASK_SECONDS.time(task=task):
+            return self._dispatch(task, *args)
+
+    def _dispatch(self, task: str, *args):
+        if self.workers == 0:
+            start = time.perf_counter()
+            result, frames = _TASKS[task](*args)
+            self._record(os.getpid(), time.perf_counter() - start, frames, 0)
+            return result
+
+        start = time.perf_counter()
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.waited += 1
+            if not self._slots.acquire(timeout=self.submit_timeout):
+                with self._lock:
+                    self.rejected += 1
+                raise DecodePoolBusy(f"decode pool queue full ({self.max_pending} pending)")
+        waited = time.perf_counter() - start
+        with self._lock:
+            self.submitted += 1
+            self._pending += 1
+            self.wait_sec += waited
+        try:
+            try:
+                pid, busy, frames, nbytes, packed, shm_name = self._submit(task, args)
+            except BrokenProcessPool:
+                # Usually another task killed the worker; retry once on a fresh pool
+                pid, busy, frames, nbytes, packed, shm_name = self._submit(task, args)
+        except Exception:
+            with self._lock:
+                self.failed += 1
+            raise
+        finally:
+            with self._lock:
+                self._pending -= 1
+            self._slots.release()
+        self._record(pid, busy, frames, nbytes)
+        return _unpack(packed, shm_name)
+
+    # ── Public API ────────────────────────────────────────────────────
+
+    def crop_jpegs(self, video_path: str, items: list) -> list:
+        """JPEG-encode crops: items [(frame_index, bbox or None)] -> [(status, base64, image_key)]."""
+        return self._call("crop_jpegs", video_path, [(int(fi), bbox) for fi, bbox in items])
+
+    def region_stacks(self, video_path: str, frame_indices, bboxes: list) -> tuple:
+        """Same as video_utils.extract_region_stacks, decoded in a worker."""
+        return self._call("region_stacks", video_path, [int(i) for i in frame_indices], list(bboxes))
+
+    def extract_frames(self, video_path: str, frame_indices, size: tuple = None, grayscale: bool = False) -> dict:
+        """Same as video_utils.extract_frames (without keyframe alignment), decoded in a worker."""
+        return self._call("frames", video_path, [int(i) for i in frame_indices], size, grayscale)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "pending": self._pending,
+                "max_pending": self.max_pending,
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "waited": self.waited,
+                "wait_sec": round(self.wait_sec, 3),
+                "restarts": self.restarts,
+                "per_worker": {
+                    str(pid): {**s, "busy_sec": round(s["busy_sec"], 3)} for pid, s in self._worker_stats.items()
+                },
+            }
+
+
+decode_pool = DecodePool()
@@ -0,0 +1,205 @@
+"""
+运行时指标：耗时直方图与计数器，以 Prometheus 文本格式（0.0.4）由 /metrics 导出
+- Histogram.time(**labels)：上下文管理器 / 装饰器，记录代码块耗时（秒），并附加 outcome="ok" 或 "error"
+- Histogram.observe(seconds, **labels)：记录已测得的耗时（如预测器结果中的分阶段 timings）
+- Counter.inc(**labels)：计数
+
+桶边界固定，每次记录只是一次二分查找加一次加锁累加（几微秒，被计时的解码、推理、模型调用和提交都在毫秒以上），
+可在生产环境常开；configure(enabled=False) 后计时器不再读时钟。
+指标只在本进程内累计：多 worker 部署时每个进程各自导出；解码进程池的任务耗时在主进程按任务记录。
+标签值应来自有限集合（阶段名、工具名、模型名），不要放视频名等无界取值。
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ContextDecorator
+
+
+# 秒；覆盖从毫秒级的帧解码到分钟级的模型推理
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0,
+                   300.0)
+
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: tuple, extra: tuple = ()) -> str:
+    pairs = key + extra
+    if not pairs:
+        return ""
+    escaped = (v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Timer(ContextDecorator):
+    def __init__(self, histogram: "Histogram", ok_key: tuple, error_key: tuple):
+        self.histogram = histogram
+        # 标签在创建时排好序，每次记录不再重复处理
+        self._ok_key = ok_key
+        self._error_key = error_key
+        self._start = None
+
+    def _recreate_cm(self):
+        # 作为装饰器时每次调用用新的计时器，并发调用互不覆盖起点
+        return _Timer(self.histogram, self._ok_key, self._error_key)
+
+    def __enter__(self):
+        if self.histogram.registry.enabled:
+            self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._start is not None:
+            self.histogram._observe_key(time.perf_counter() - self._start,
+                                        self._ok_key if exc_type is None else self._error_key)
+        return False
+
+
+class Histogram:
+    def __init__(self, registry: "MetricsRegistry", name: str, documentation: str, buckets: tuple):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(sorted(buckets))
+        # 标签 -> [各桶计数（非累计，最后一格为 +Inf）, 总和]
+        self._series = {}
+        # time() 的入参标签 -> (ok 标签, error 标签)，热点路径上省去排序与转换
+        self._timer_keys = {}
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float, **labels):
+        if self.registry.enabled:
+            self._observe_key(seconds, _label_key(labels))
+
+    def _observe_key(self, seconds: float, key: tuple):
+        index = bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += seconds
+
+    def time(self, **labels) -> _Timer:
+        """with histogram.time(stage="x"): ... 或 @histogram.time(stage="x")"""
+        keys = self._timer_keys.get(tuple(labels.items()))
+        if keys is None:
+            keys = self._timer_keys[tuple(labels.items())] = (_label_key({**labels, "outcome": "ok"}),
+                                                              _label_key({**labels, "outcome": "error"}))
+        return _Timer(self, *keys)
+
+    def snapshot(self) -> dict:
+        """标签元组 -> {"count", "sum", "buckets": [(上界, 累计计数)]}"""
+        with self._lock:
+            series = {key: (list(counts), total) for key, (counts, total) in self._series.items()}
+        result = {}
+        for key, (counts, total) in series.items():
+            cumulative, running = [], 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                running += count
+                cumulative.append((bound, running))
+            result[key] = {"count": running, "sum": total, "buckets": cumulative}
+        return result
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for key, series in sorted(self.snapshot().items()):
+            for bound, count in series["buckets"]:
+                lines.append(f"{self.name}_bucket{_format_labels(key, (('le', _format_value(bound)),))} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {series['sum']:.6f}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {series['count']}")
+        return lines
+
+
+class Counter:
+    def __init__(self, registry: "MetricsRegistry", name: str, documentation: str):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        if not self.registry.enabled:
+            return
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self._values)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self.snapshot().items()):
+            lines.append(f"{self.name}{_format_labels(key)} {_format_value(value)}")
+        return lines
+
+
+class MetricsRegistry:
+    """进程内指标注册表；同名指标重复声明时返回同一个对象。"""
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def configure(self, enabled: bool):
+        self.enabled = enabled
+
+    def _get_or_create(self, name: str, factory):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = factory()
+            return metric
+
+    def histogram(self, name: str, documentation: str, buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(name, lambda: Histogram(self, name, documentation, buckets))
+
+    def counter(self, name: str, documentation: str) -> Counter:
+        return self._get_or_create(name, lambda: Counter(self, name, documentation))
+
+    def get(self, name: str):
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = sorted(self._metrics.items())
+        lines = []
+        for _, metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+# ── 各模块共用的指标 ─────────────────────────────────────────────────
+
+VIDEO_PROBE_SECONDS = registry.histogram(
+    "video_probe_seconds", "Time to read video metadata (and keyframe positions).")
+VIDEO_DECODE_SECONDS = registry.histogram(
+    "video_decode_seconds", "Time to decode frames in this process, by operation.")
+DECODE_POOL_TASK_SECONDS = registry.histogram(
+    "decode_pool_task_seconds", "Decode pool task latency as seen by the caller, including queueing and handoff.")
+SAM3_STAGE_SECONDS = registry.histogram(
+    "sam3_stage_seconds", "SAM3 analysis time per pipeline stage (prepare, propagation, violation_analysis, ...).")
+OPENAI_REQUEST_SECONDS = registry.histogram(
+    "openai_request_seconds", "Model API call latency, by client method and model; streams until the last chunk.")
+OPENAI_FIRST_CHUNK_SECONDS = registry.histogram(
+    "openai_first_chunk_seconds", "Time from request to the first streamed text chunk.")
+OPENAI_RETRIES = registry.counter(
+    "openai_retries_total", "Model API requests retried, by reason.")
+AGENT_TOOL_SECONDS = registry.histogram(
+    "agent_tool_seconds", "Agent tool execution time, by tool.")
+DB_COMMIT_SECONDS = registry.histogram(
+    "db_commit_seconds", "Database session commit time, including the flush.")
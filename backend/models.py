@@ -1,3 +1,4 @@
+import json
 from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
@@ -84,3 +85,40 @@ class Message(db.Model):
             'video_path': self.video_path,
             'created_at': self.created_at.isoformat()
         }
+
+
+class CameraProfile(db.Model):
+    """
+    Per-camera SAM 3 inference settings (throughput vs. accuracy trade-off).
+    Owned by the user who created it; profiles without an owner (created before
+    ownership existed) are shared read-only.
+    """
+    __tablename__ = 'camera_profiles'
+    __table_args__ = (db.Index('uq_camera_profiles_user_name', 'user_id', 'name', unique=True),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True, index=True)
+    name = db.Column(db.String(120), nullable=False, index=True)
+    frame_stride = db.Column(db.Integer, default=1, nullable=False)
+    downscale = db.Column(db.Float, default=1.0, nullable=False)
+    roi = db.Column(db.Text, nullable=True)  # JSON polygon [[x, y], ...] in source pixels
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+    def inference_options(self):
+        """Keyword arguments for SAM3Predictor.process_video"""
+        return {
+            'frame_stride': self.frame_stride,
+            'downscale': self.downscale,
+            'roi': json.loads(self.roi) if self.roi else None
+        }
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'user_id': self.user_id,
+            'name': self.name,
+            **self.inference_options(),
+            'created_at': self.created_at.isoformat(),
+            'updated_at': self.updated_at.isoformat()
+        }
@@ -3,17 +3,43 @@
 通过 newapi 网关代理调用各种模型供应商，使用 OpenAI Chat Completions 格式。
 """
 
+import asyncio
 import json
+import random
+import time
+from email.utils import parsedate_to_datetime
+
 import requests
+from requests.adapters import HTTPAdapter
 
+from metrics import OPENAI_FIRST_CHUNK_SECONDS, OPENAI_REQUEST_SECONDS, OPENAI_RETRIES
 
-class OpenAIClient:
-    """OpenAI 兼容 API 客户端，支持流式对话、视觉识别、工具调用和模型列表。"""
+try:
+    import aiohttp
+except ImportError:  # 仅 AsyncOpenAIClient 需要
+    aiohttp = None
+
+
+# 网关返回这些状态码时按指数退避重试
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+# Retry-After 最多等待的秒数，避免单次请求被挂起过久
+RETRY_AFTER_MAX_SEC = 60.0
 
-    def __init__(self, base_url: str = "", api_key: str = "", default_model: str = ""):
+
+class _BaseOpenAIClient:
+    """同步 / 异步客户端共用的配置、校验与退避逻辑。"""
+
+    def __init__(self, base_url: str = "", api_key: str = "", default_model: str = "",
+                 max_retries: int = 3, backoff_base: float = 0.5, backoff_max: float = 8.0,
+                 connect_timeout: float = 5.0, read_timeout: float = 120.0):
         self.base_url = base_url.rstrip("/") if base_url else ""
         self.api_key = api_key or ""
         self.default_model = default_model or ""
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
 
     def update_config(self, base_url: str = None, api_key: str = None, default_model: str = None):
         """运行时动态更新配置"""
@@ -42,6 +68,81 @@ class OpenAIClient:
             raise ValueError("未指定模型，请在设置中配置默认模型或在请求中指定模型。")
         return resolved
 
+    def _backoff_delay(self, attempt: int, resp=None) -> float:
+        """优先遵循 Retry-After，否则使用带 full jitter 的指数退避。"""
+        retry_after = resp.headers.get("Retry-After") if resp is not None else None
+        if retry_after:
+            try:
+                delay = float(retry_after)
+            except ValueError:
+                try:
+                    delay = parsedate_to_datetime(retry_after).timestamp() - time.time()
+                except (TypeError, ValueError):
+                    delay = None
+            if delay is not None:
+                return min(max(0.0, delay), RETRY_AFTER_MAX_SEC)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+
+def _parse_stream_line(line: str) -> tuple:
+    """解析一行 SSE 流数据，返回 (is_done, content)。"""
+    if not line or not line.startswith("data: "):
+        return False, None
+    data_str = line[6:]
+    if data_str.strip() == "[DONE]":
+        return True, None
+    try:
+        data = json.loads(data_str)
+        delta = data.get("choices", [{}])[0].get("delta", {})
+        return False, delta.get("content")
+    except (json.JSONDecodeError, IndexError, KeyError, AttributeError):
+        return False, None
+
+
+class OpenAIClient(_BaseOpenAIClient):
+    """OpenAI 兼容 API 客户端，支持流式对话、视觉识别、工具调用和模型列表。"""
+
+    def __init__(self, base_url: str = "", api_key: str = "", default_model: str = "",
+                 pool_size: int = 16, **kwargs):
+        super().__init__(base_url, api_key, default_model, **kwargs)
+
+        # 复用 keep-alive 连接，避免每次调用重新进行 TCP + TLS 握手
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+
+    def close(self):
+        """关闭连接池"""
+        self._session.close()
+
+    def _request(self, method: str, path: str, read_timeout: float = None, **kwargs) -> requests.Response:
+        """
+        通过连接池发送请求，对连接失败和 429/5xx 进行重试，最终仍失败时抛出 requests 异常。
+        读超时不重试（模型可能已在处理该请求）。
+        """
+        url = f"{self.base_url}{path}"
+        timeout = (self.connect_timeout, read_timeout or self.read_timeout)
+        for attempt in range(self.max_retries + 1):
+            try:
+                resp = self._session.request(method, url, headers=self._headers(), timeout=timeout, **kwargs)
+            except requests.exceptions.ConnectionError:
+                if attempt >= self.max_retries:
+                    raise
+                OPENAI_RETRIES.inc(reason="connection")
+                time.sleep(self._backoff_delay(attempt))
+                continue
+
+            if resp.status_code in RETRY_STATUS_CODES and attempt < self.max_retries:
+                OPENAI_RETRIES.inc(reason=str(resp.status_code))
+                delay = self._backoff_delay(attempt, resp)
+                resp.close()
+                time.sleep(delay)
+                continue
+
+            resp.raise_for_status()
+            return resp
+
     # ── 流式对话 ────────────────────────────────────────────────────
 
     def chat_stream(self, messages: list, model: str = None):
@@ -51,29 +152,39 @@ class OpenAIClient:
         """
         self._check_config()
         resolved_model = self._resolve_model(model)
+        # 总耗时记到流读完（或调用方提前关闭）为止，另记首个文本块的等待时间
+        start = time.perf_counter()
+        outcome = "error"
+        first = True
+        try:
+            for content in self._stream(messages, resolved_model):
+                if first:
+                    OPENAI_FIRST_CHUNK_SECONDS.observe(time.perf_counter() - start, model=resolved_model)
+                    first = False
+                yield content
+            outcome = "ok"
+        except GeneratorExit:
+            outcome = "cancelled"
+            raise
+        finally:
+            OPENAI_REQUEST_SECONDS.observe(time.perf_counter() - start, method="chat_stream",
+                                           model=resolved_model, outcome=outcome)
 
+    def _stream(self, messages: list, resolved_model: str):
         payload = {
             "model": resolved_model,
             "messages": messages,
             "stream": True,
         }
 
-        url = f"{self.base_url}/chat/completions"
         try:
-            resp = requests.post(
-                url,
-                headers=self._headers(),
-                json=payload,
-                stream=True,
-                timeout=120,
-            )
-            resp.raise_for_status()
+            resp = self._request("POST", "/chat/completions", json=payload, stream=True)
         except requests.exceptions.ConnectionError:
             raise ConnectionError(f"无法连接到 API 服务器: {self.base_url}")
         except requests.exceptions.Timeout:
             raise TimeoutError("API 请求超时，请检查网络连接。")
         except requests.exceptions.HTTPError as e:
-            status = e.response.status_code if e.response else "unknown"
+            status = e.response.status_code if e.response is not None else "unknown"
             if status == 401:
                 raise PermissionError("API Key 无效或已过期，请检查设置。")
             elif status == 404:
@@ -83,26 +194,26 @@ class OpenAIClient:
             else:
                 raise RuntimeError(f"API 请求失败 (HTTP {status}): {e}")
 
-        for line in resp.iter_lines(decode_unicode=True):
-            if not line:
-                continue
-            if line.startswith("data: "):
-                data_str = line[6:]
-                if data_str.strip() == "[DONE]":
+        try:
+            for line in resp.iter_lines(decode_unicode=True):
+                done, content = _parse_stream_line(line)
+                if done:
+                    # 读完结束分块，连接才能回到连接池
+                    for _ in resp.iter_content(chunk_size=None):
+                        pass
                     break
-                try:
-                    data = json.loads(data_str)
-                    delta = data.get("choices", [{}])[0].get("delta", {})
-                    content = delta.get("content")
-                    if content:
-                        yield content
-                except (json.JSONDecodeError, IndexError, KeyError):
-                    continue
+                if content:
+                    yield content
+        finally:
+            resp.close()
 
     # ── 非流式对话 ──────────────────────────────────────────────────
 
     def chat(self, messages: list, model: str = None) -> str:
         """非流式对话，返回完整响应文本。"""
+        return self._complete(messages, model, "chat")
+
+    def _complete(self, messages: list, model: str, method: str) -> str:
         self._check_config()
         resolved_model = self._resolve_model(model)
 
@@ -112,23 +223,17 @@ class OpenAIClient:
             "stream": False,
         }
 
-        url = f"{self.base_url}/chat/completions"
         try:
-            resp = requests.post(
-                url,
-                headers=self._headers(),
-                json=payload,
-                timeout=120,
-            )
-            resp.raise_for_status()
-            data = resp.json()
+            with OPENAI_REQUEST_SECONDS.time(method=method, model=resolved_model):
+                resp = self._request("POST", "/chat/completions", json=payload)
+                data = resp.json()
             return data["choices"][0]["message"]["content"]
         except requests.exceptions.ConnectionError:
             raise ConnectionError(f"无法连接到 API 服务器: {self.base_url}")
         except requests.exceptions.Timeout:
             raise TimeoutError("API 请求超时。")
         except requests.exceptions.HTTPError as e:
-            status = e.response.status_code if e.response else "unknown"
+            status = e.response.status_code if e.response is not None else "unknown"
             raise RuntimeError(f"API 请求失败 (HTTP {status})")
 
     # ── 工具调用 ────────────────────────────────────────────────────
@@ -149,22 +254,16 @@ class OpenAIClient:
             "stream": False,
         }
 
-        url = f"{self.base_url}/chat/completions"
         try:
-            resp = requests.post(
-                url,
-                headers=self._headers(),
-                json=payload,
-                timeout=120,
-            )
-            resp.raise_for_status()
-            return resp.json()
+            with OPENAI_REQUEST_SECONDS.time(method="chat_with_tools", model=resolved_model):
+                resp = self._request("POST", "/chat/completions", json=payload)
+                return resp.json()
         except requests.exceptions.ConnectionError:
             raise ConnectionError(f"无法连接到 API 服务器: {self.base_url}")
         except requests.exceptions.Timeout:
             raise TimeoutError("API 请求超时。")
         except requests.exceptions.HTTPError as e:
-            status = e.response.status_code if e.response else "unknown"
+            status = e.response.status_code if e.response is not None else "unknown"
             raise RuntimeError(f"API 请求失败 (HTTP {status})")
 
     # ── 视觉对话 ────────────────────────────────────────────────────
@@ -178,7 +277,7 @@ class OpenAIClient:
             {"type": "text", "text": "请识别..."}
         ]
         """
-        return self.chat(messages, model=model)
+        return self._complete(messages, model, "vision_chat")
 
     # ── 模型列表 ────────────────────────────────────────────────────
 
@@ -186,15 +285,10 @@ class OpenAIClient:
         """获取可用模型列表，返回 [{"id": "...", "owned_by": "..."}]"""
         self._check_config()
 
-        url = f"{self.base_url}/models"
         try:
-            resp = requests.get(
-                url,
-                headers=self._headers(),
-                timeout=30,
-            )
-            resp.raise_for_status()
-            data = resp.json()
+            with OPENAI_REQUEST_SECONDS.time(method="list_models", model=""):
+                resp = self._request("GET", "/models", read_timeout=30)
+                data = resp.json()
             # OpenAI 格式: {"data": [{"id": "...", "owned_by": "..."}]}
             models = data.get("data", [])
             return [
@@ -207,7 +301,230 @@ class OpenAIClient:
         except requests.exceptions.Timeout:
             raise TimeoutError("获取模型列表超时。")
         except requests.exceptions.HTTPError as e:
-            status = e.response.status_code if e.response else "unknown"
+            status = e.response.status_code if e.response is not None else "unknown"
             if status == 401:
                 raise PermissionError("API Key 无效，无法获取模型列表。")
             raise RuntimeError(f"获取模型列表失败 (HTTP {status})")
+
+
+class AsyncOpenAIClient(_BaseOpenAIClient):
+    """
+    asyncio 版 OpenAI 兼容客户端，接口与 OpenAIClient 一致（chat_stream 为异步生成器）。
+    所有调用共享一个 aiohttp 连接池，并由全局信号量限制同时在途的请求数，
+    便于在少量线程上复用大量并发的模型调用。需要安装 aiohttp。
+    连接池与信号量绑定创建它们的事件循环，在新的事件循环中使用（如先后两次 asyncio.run）时会重新创建；
+    同一时刻只应在一个事件循环中使用，并应在每个事件循环结束前 aclose()（或使用 async with）。
+    """
+
+    def __init__(self, base_url: str = "", api_key: str = "", default_model: str = "",
+                 pool_size: int = 100, max_concurrency: int = 64, **kwargs):
+        if aiohttp is None:
+            raise RuntimeError("AsyncOpenAIClient 需要 aiohttp，请执行 pip install aiohttp")
+        super().__init__(base_url, api_key, default_model, **kwargs)
+        self.pool_size = pool_size
+        self.max_concurrency = max_concurrency
+        self._loop = None
+        self._semaphore = None
+        self._session = None
+
+    def _bind_loop(self):
+        """首次使用或事件循环变化时，为当前循环创建信号量；旧循环的连接池不能在新循环中使用，一并丢弃"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._session = None
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        self._bind_loop()
+        return self._semaphore
+
+    def _get_session(self):
+        # ClientSession 必须在事件循环内创建
+        self._bind_loop()
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, limit_per_host=self.pool_size)
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    async def aclose(self):
+        """关闭连接池"""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
+
+    async def _send(self, method: str, path: str, read_timeout: float = None, **kwargs):
+        """
+        发送请求并按 OpenAIClient._request 的规则重试，返回未读取的 2xx 响应，调用方负责 release()。
+        """
+        url = f"{self.base_url}{path}"
+        timeout = aiohttp.ClientTimeout(
+            total=None, sock_connect=self.connect_timeout, sock_read=read_timeout or self.read_timeout
+        )
+        session = self._get_session()
+        for attempt in range(self.max_retries + 1):
+            try:
+                resp = await session.request(method, url, headers=self._headers(), timeout=timeout, **kwargs)
+            except (aiohttp.ClientConnectorError, aiohttp.ConnectionTimeoutError):
+                if attempt >= self.max_retries:
+                    raise
+                OPENAI_RETRIES.inc(reason="connection")
+                await asyncio.sleep(self._backoff_delay(attempt))
+                continue
+
+            if resp.status in RETRY_STATUS_CODES and attempt < self.max_retries:
+                OPENAI_RETRIES.inc(reason=str(resp.status))
+                delay = self._backoff_delay(attempt, resp)
+                resp.release()
+                await asyncio.sleep(delay)
+                continue
+
+            if resp.status >= 400:
+                resp.release()
+                resp.raise_for_status()
+            return resp
+
+    async def _post_json(self, payload: dict, method: str) -> dict:
+        try:
+            # 计时包含等待信号量的时间，即调用方感受到的延迟
+            with OPENAI_REQUEST_SECONDS.time(method=method, model=payload["model"]):
+                async with self._get_semaphore():
+                    resp = await self._send("POST", "/chat/completions", json=payload)
+                    async with resp:
+                        return await resp.json(content_type=None)
+        except (aiohttp.ClientConnectorError, aiohttp.ConnectionTimeoutError):
+            raise ConnectionError(f"无法连接到 API 服务器: {self.base_url}")
+        except asyncio.TimeoutError:
+            raise TimeoutError("API 请求超时。")
+        except aiohttp.ClientResponseError as e:
+            raise RuntimeError(f"API 请求失败 (HTTP {e.status})")
+
+    # ── 流式对话 ────────────────────────────────────────────────────
+
+    async def chat_stream(self, messages: list, model: str = None):
+        """流式对话，异步生成器，每次 yield 一段文本 chunk。"""
+        self._check_config()
+        resolved_model = self._resolve_model(model)
+        start = time.perf_counter()
+        outcome = "error"
+        first = True
+        try:
+            async for content in self._stream(messages, resolved_model):
+                if first:
+                    OPENAI_FIRST_CHUNK_SECONDS.observe(time.perf_counter() - start, model=resolved_model)
+                    first = False
+                yield content
+            outcome = "ok"
+        except GeneratorExit:
+            outcome = "cancelled"
+            raise
+        finally:
+            OPENAI_REQUEST_SECONDS.observe(time.perf_counter() - start, method="chat_stream",
+                                           model=resolved_model, outcome=outcome)
+
+    async def _stream(self, messages: list, resolved_model: str):
+        payload = {
+            "model": resolved_model,
+            "messages": messages,
+            "stream": True,
+        }
+
+        async with self._get_semaphore():
+            try:
+                resp = await self._send("POST", "/chat/completions", json=payload)
+            except (aiohttp.ClientConnectorError, aiohttp.ConnectionTimeoutError):
+                raise ConnectionError(f"无法连接到 API 服务器: {self.base_url}")
+            except asyncio.TimeoutError:
+                raise TimeoutError("API 请求超时，请检查网络连接。")
+            except aiohttp.ClientResponseError as e:
+                status = e.status
+                if status == 401:
+                    raise PermissionError("API Key 无效或已过期，请检查设置。")
+                elif status == 404:
+                    raise ValueError(f"模型 {resolved_model} 不可用或 API 路径错误。")
+                elif status == 429:
+                    raise RuntimeError("API 请求频率超限，请稍后再试。")
+                else:
+                    raise RuntimeError(f"API 请求失败 (HTTP {status}): {e}")
+
+            async with resp:
+                async for raw_line in resp.content:
+                    done, content = _parse_stream_line(raw_line.decode("utf-8").strip())
+                    if done:
+                        # 读完结束分块，连接才能回到连接池
+                        await resp.read()
+                        break
+                    if content:
+                        yield content
+
+    # ── 非流式对话 ──────────────────────────────────────────────────
+
+    async def chat(self, messages: list, model: str = None) -> str:
+        """非流式对话，返回完整响应文本。"""
+        self._check_config()
+        payload = {
+            "model": self._resolve_model(model),
+            "messages": messages,
+            "stream": False,
+        }
+        data = await self._post_json(payload, "chat")
+        return data["choices"][0]["message"]["content"]
+
+    # ── 工具调用 ────────────────────────────────────────────────────
+
+    async def chat_with_tools(self, messages: list, tools: list, model: str = None) -> dict:
+        """带工具调用的对话（非流式），返回 OpenAI 格式的完整响应 dict。"""
+        self._check_config()
+        payload = {
+            "model": self._resolve_model(model),
+            "messages": messages,
+            "tools": tools,
+            "tool_choice": "auto",
+            "stream": False,
+        }
+        return await self._post_json(payload, "chat_with_tools")
+
+    # ── 视觉对话 ────────────────────────────────────────────────────
+
+    async def vision_chat(self, messages: list, model: str = None) -> str:
+        """视觉模型对话（非流式），messages 使用 OpenAI Vision 格式。"""
+        self._check_config()
+        payload = {
+            "model": self._resolve_model(model),
+            "messages": messages,
+            "stream": False,
+        }
+        data = await self._post_json(payload, "vision_chat")
+        return data["choices"][0]["message"]["content"]
+
+    # ── 模型列表 ────────────────────────────────────────────────────
+
+    async def list_models(self) -> list:
+        """获取可用模型列表，返回 [{"id": "...", "owned_by": "..."}]"""
+        self._check_config()
+        try:
+            with OPENAI_REQUEST_SECONDS.time(method="list_models", model=""):
+                async with self._get_semaphore():
+                    resp = await self._send("GET", "/models", read_timeout=30)
+                    async with resp:
+                        data = await resp.json(content_type=None)
+        except (aiohttp.ClientConnectorError, aiohttp.ConnectionTimeoutError):
+            raise ConnectionError(f"无法连接到 API 服务器: {self.base_url}")
+        except asyncio.TimeoutError:
+            raise TimeoutError("获取模型列表超时。")
+        except aiohttp.ClientResponseError as e:
+            if e.status == 401:
+                raise PermissionError("API Key 无效，无法获取模型列表。")
+            raise RuntimeError(f"获取模型列表失败 (HTTP {e.status})")
+
+        return [
+            {"id": m.get("id", ""), "owned_by": m.get("owned_by", "")}
+            for m in data.get("data", [])
+            if m.get("id")
+        ]
@@ -0,0 +1,12 @@
+"""
+开发服务器入口：python run.py（Flask 调试模式，端口 5001）
+
+解码进程池以 spawn 方式启动子进程，子进程会重新导入主模块。直接 python app.py 时，
+app.py 的模块级初始化（数据库、SAM3 模型、任务队列线程、缓存）会在每个解码进程里再执行一遍；
+本模块只在 __main__ 下导入 app，被子进程导入时不做任何事。
+"""
+
+if __name__ == '__main__':
+    from app import app
+
+    app.run(debug=True, port=5001, host='0.0.0.0')
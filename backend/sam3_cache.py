@@ -0,0 +1,179 @@
+"""
+SAM 3 分析结果缓存（内容寻址）
+键 = sha256(视频内容哈希 + 预测器配置指纹)，配置指纹包含引擎/模型版本、提示词、判定阈值、
+prompt_mode 与推理参数（见 SAM3Predictor.config_fingerprint），任一项变化都会得到新键，
+因此无需显式失效。每个条目在磁盘上是一个结果 JSON 加一个可选的轨迹 .npz；
+SQLite 索引记录条目大小与最近访问时间，查询无需扫描目录，总大小超过上限时按 LRU 淘汰。
+通过 checkout() 取出的条目在 with 块内被钉住，淘汰与 clear() 都会跳过它，读取/复制其文件期间不会被删除。
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from track_store import save_tracks
+
+
+INDEX_FILENAME = "index.sqlite"
+
+
+def cache_key(video_sha256: str, config: dict) -> str:
+    payload = json.dumps(config, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(f"{video_sha256}:{payload}".encode("utf-8")).hexdigest()
+
+
+class SAM3ResultCache:
+    """磁盘上的 SAM 3 结果缓存；max_bytes <= 0 时禁用（get 总是未命中，put 不写入）。"""
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        # 被 checkout() 钉住的条目 key -> 引用计数
+        self._pins = {}
+        os.makedirs(root, exist_ok=True)
+        self._index_path = os.path.join(root, INDEX_FILENAME)
+        with self._connect() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                " key TEXT PRIMARY KEY, video_sha256 TEXT NOT NULL, config TEXT NOT NULL,"
+                " size INTEGER NOT NULL, has_tracks INTEGER NOT NULL,"
+                " created_at REAL NOT NULL, last_access REAL NOT NULL, hits INTEGER NOT NULL DEFAULT 0)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)")
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    @contextmanager
+    def _connect(self):
+        db = sqlite3.connect(self._index_path, timeout=10)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def result_path(self, key: str) -> str:
+        return os.path.join(self.root, f"{key}.json")
+
+    def tracks_path(self, key: str) -> str:
+        return os.path.join(self.root, f"{key}_tracks.npz")
+
+    def get(self, key: str, _pin: bool = False) -> dict | None:
+        """
+        命中时返回 {"result": 结果 dict, "tracks_path": 轨迹 .npz 路径或 None} 并刷新访问时间；
+        索引存在但文件已丢失的条目视为未命中并删除。
+        返回后条目仍可能被其他线程的写入淘汰，需要读取 tracks_path 时用 checkout()。
+        """
+        if not self.enabled:
+            return None
+        with self._lock, self._connect() as db:
+            row = db.execute("SELECT has_tracks FROM entries WHERE key = ?", (key,)).fetchone()
+            result = None
+            if row is not None:
+                tracks_file = self.tracks_path(key) if row[0] else None
+                try:
+                    with open(self.result_path(key), "r", encoding="utf-8") as f:
+                        result = json.load(f)
+                    if tracks_file is not None and not os.path.exists(tracks_file):
+                        result = None
+                except (OSError, ValueError):
+                    result = None
+                if result is None:
+                    self._delete(db, key)
+            if result is None:
+                self.misses += 1
+                return None
+            db.execute("UPDATE entries SET last_access = ?, hits = hits + 1 WHERE key = ?", (time.time(), key))
+            self.hits += 1
+            if _pin:
+                self._pins[key] = self._pins.get(key, 0) + 1
+        return {"result": result, "tracks_path": tracks_file}
+
+    @contextmanager
+    def checkout(self, key: str):
+        """同 get，命中的条目在 with 块内不会被淘汰或清除：with cache.checkout(key) as entry: ..."""
+        entry = self.get(key, _pin=True)
+        try:
+            yield entry
+        finally:
+            if entry is not None:
+                with self._lock:
+                    self._pins[key] -= 1
+                    if not self._pins[key]:
+                        del self._pins[key]
+
+    def put(self, key: str, video_sha256: str, config: dict, result: dict, tracks: dict = None):
+        """写入一个条目（result 不应包含 tracks），随后按 LRU 淘汰到容量以内。"""
+        if not self.enabled:
+            return
+        result_file = self.result_path(key)
+        tmp_path = f"{result_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False)
+        os.replace(tmp_path, result_file)
+        size = os.path.getsize(result_file)
+        if tracks is not None:
+            save_tracks(self.tracks_path(key), tracks)
+            size += os.path.getsize(self.tracks_path(key))
+
+        now = time.time()
+        with self._lock, self._connect() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO entries (key, video_sha256, config, size, has_tracks, created_at, last_access)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, video_sha256, json.dumps(config, sort_keys=True, ensure_ascii=False),
+                 size, int(tracks is not None), now, now),
+            )
+            self._evict(db)
+
+    def _evict(self, db):
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in db.execute("SELECT key, size FROM entries ORDER BY last_access ASC").fetchall():
+            if total <= self.max_bytes:
+                break
+            if key in self._pins:
+                continue
+            self._delete(db, key)
+            total -= size
+            self.evictions += 1
+
+    def _delete(self, db, key: str):
+        db.execute("DELETE FROM entries WHERE key = ?", (key,))
+        for path in (self.result_path(key), self.tracks_path(key)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def clear(self):
+        with self._lock, self._connect() as db:
+            for (key,) in db.execute("SELECT key FROM entries").fetchall():
+                if key not in self._pins:
+                    self._delete(db, key)
+
+    def stats(self) -> dict:
+        with self._lock, self._connect() as db:
+            entries, total = db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": entries,
+                "bytes": total,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,403 @@
+"""
+SAM 3 分析任务队列
+提交即返回任务 ID；有界工作线程池按优先级（高优先）+ FIFO 顺序执行；
+任务记录在提交与每次状态变化时持久化到磁盘，客户端可轮询状态或按事件序号订阅进度（断线后从 since 继续）。
+进程重启时仍处于排队/运行中的任务标记为失败（客户端可重新提交，已完成的推理会命中结果缓存）。
+任务只对提交它的用户可见。
+"""
+
+import itertools
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import deque
+
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+# 内存中最多保留的已结束任务数（更早的任务仍可从磁盘读取）
+MAX_FINISHED_IN_MEMORY = 200
+# 延迟统计的滑动窗口大小
+LATENCY_WINDOW = 500
+# 进度事件最短间隔（百分比不变时也按此间隔上报一次，便于发现卡顿）
+PROGRESS_MIN_INTERVAL_SEC = 1.0
+# 吞吐量（帧/秒）按最近若干秒的滑动窗口计算
+THROUGHPUT_WINDOW_SEC = 5.0
+# 每个任务在内存与记录中保留的最近事件数；更早的事件被丢弃，序号 seq 仍连续递增
+MAX_EVENTS_PER_JOB = 1000
+# 未结束任务的标记文件后缀，启动时据此找出被中断的任务
+PENDING_SUFFIX = ".pending"
+
+
+class SAM3Job:
+    """单个分析任务的状态与事件日志。"""
+
+    def __init__(self, video_name: str, video_path: str, priority: int = 0, job_id: str = None,
+                 options: dict = None):
+        self.id = job_id or uuid.uuid4().hex
+        self.video_name = video_name
+        self.video_path = video_path
+        self.priority = priority
+        # 推理参数（frame_stride / downscale / roi），原样传给 SAM3Predictor.process_video
+        self.options = options or {}
+        self.status = JOB_QUEUED
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.progress = 0
+        self.fps = None
+        self.eta_sec = None
+        self.result = None
+        self.error = None
+        self.events = deque(maxlen=MAX_EVENTS_PER_JOB)
+        # 已产生的事件总数，即下一条事件的 seq
+        self.event_count = 0
+        # 可查看该任务的用户 ID（相同视频与参数的重复提交复用同一任务，提交者都加入）
+        self.owners = set()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (JOB_DONE, JOB_FAILED)
+
+    def to_dict(self, include_result: bool = True) -> dict:
+        data = {
+            "job_id": self.id,
+            "video": self.video_name,
+            "priority": self.priority,
+            "options": self.options,
+            "status": self.status,
+            "progress": self.progress,
+            "fps": self.fps,
+            "eta_sec": self.eta_sec,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "error": self.error,
+            "event_count": self.event_count,
+        }
+        if include_result:
+            data["result"] = self.result
+        return data
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "SAM3Job":
+        job = cls(data["video"], None, data.get("priority", 0), job_id=data["job_id"],
+                  options=data.get("options"))
+        for field in ("status", "progress", "fps", "eta_sec", "created_at", "started_at", "finished_at", "error", "result"):
+            setattr(job, field, data.get(field))
+        job.events = deque(data.get("events", []), maxlen=MAX_EVENTS_PER_JOB)
+        job.event_count = data.get("event_count", len(job.events))
+        job.owners = set(data.get("owners", []))
+        return job
+
+    def events_since(self, since: int) -> list:
+        """seq >= since 的事件（已被丢弃的更早事件不再返回）"""
+        first = self.event_count - len(self.events)
+        return list(itertools.islice(self.events, max(0, since - first), None))
+
+
+class SAM3JobQueue:
+    """
+    有界工作线程池 + 优先级队列。run_fn(job, emit) 执行实际分析并返回结果 dict，
+    emit(event_dict) 向任务事件日志追加一条事件（自动带 seq 序号）。
+    """
+
+    def __init__(self, run_fn, results_dir: str, workers: int = 1):
+        self.run_fn = run_fn
+        self.results_dir = results_dir
+        os.makedirs(results_dir, exist_ok=True)
+
+        self._queue = queue.PriorityQueue()
+        self._seq = itertools.count()
+        self._jobs = {}
+        self._finished_order = deque()
+        self._cond = threading.Condition()
+        self._running = 0
+        self._completed = 0
+        self._failed = 0
+        self._wait_times = deque(maxlen=LATENCY_WINDOW)
+        self._run_times = deque(maxlen=LATENCY_WINDOW)
+        # 记录文件写入在锁外进行；_io_lock 串行化写盘，并丢弃比已写入版本更旧的快照
+        self._io_lock = threading.Lock()
+        self._written_revision = {}
+
+        self._recover_interrupted()
+
+        self._workers = []
+        for i in range(max(1, workers)):
+            t = threading.Thread(target=self._worker, name=f"sam3-job-{i}", daemon=True)
+            t.start()
+            self._workers.append(t)
+
+    # ── 提交与查询 ──────────────────────────────────────────────────
+
+    def submit(self, video_name: str, video_path: str, priority: int = 0, options: dict = None,
+               owner=None) -> SAM3Job:
+        """提交任务；同一视频、相同推理参数已有排队/运行中的任务时直接复用（owner 加入该任务的可见用户）。"""
+        options = options or {}
+        with self._cond:
+            for job in self._jobs.values():
+                if job.video_path == video_path and job.options == options and not job.finished:
+                    if owner is None or owner in job.owners:
+                        return job
+                    job.owners.add(owner)
+                    snapshot = self._snapshot(job)
+                    break
+            else:
+                job = SAM3Job(video_name, video_path, priority, options=options)
+                if owner is not None:
+                    job.owners.add(owner)
+                self._jobs[job.id] = job
+                self._append_event(job, {"type": "queued", "job_id": job.id})
+                snapshot = self._snapshot(job)
+                # 优先级高的先执行，同优先级按提交顺序（工作线程的新状态不会被这里较旧的快照覆盖，见 _write_record）
+                self._queue.put((-priority, next(self._seq), job.id))
+        self._write_record(job.id, *snapshot)
+        return job
+
+    def get(self, job_id: str, owner=None) -> SAM3Job | None:
+        """按 ID 查找任务；指定 owner 时只返回该用户提交的任务。"""
+        with self._cond:
+            job = self._jobs.get(job_id)
+        if job is None:
+            job = self._load_record(job_id)
+        if job is None or (owner is not None and owner not in job.owners):
+            return None
+        return job
+
+    def iter_events(self, job_id: str, since: int = 0, heartbeat_sec: float = 15.0):
+        """
+        依次产出任务事件（从第 since 条开始），任务结束后停止。
+        长时间无新事件时产出 None，调用方可借此发送心跳。
+        """
+        job = self.get(job_id)
+        if job is None:
+            return
+        while True:
+            with self._cond:
+                if job.event_count <= since and not job.finished:
+                    self._cond.wait(heartbeat_sec)
+                new_events = job.events_since(since)
+                total = job.event_count
+                finished = job.finished
+            if not new_events and not finished:
+                yield None
+            for event in new_events:
+                yield event
+            since = max(since, total)
+            if finished:
+                return
+
+    def metrics(self) -> dict:
+        with self._cond:
+            waits = sorted(self._wait_times)
+            runs = sorted(self._run_times)
+            return {
+                "queue_depth": self._queue.qsize(),
+                "running": self._running,
+                "workers": len(self._workers),
+                "completed": self._completed,
+                "failed": self._failed,
+                "wait_sec": _latency_summary(waits),
+                "run_sec": _latency_summary(runs),
+            }
+
+    # ── 内部实现 ────────────────────────────────────────────────────
+
+    def _record_path(self, job_id: str) -> str | None:
+        if not job_id.isalnum():
+            return None
+        return os.path.join(self.results_dir, f"{job_id}.json")
+
+    def _load_record(self, job_id: str) -> SAM3Job | None:
+        path = self._record_path(job_id)
+        if not path or not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return SAM3Job.from_dict(json.load(f))
+
+    def _append_event(self, job: SAM3Job, event: dict):
+        """调用方需持有 self._cond。"""
+        job.events.append({**event, "seq": job.event_count})
+        job.event_count += 1
+        self._cond.notify_all()
+
+    def _emit(self, job: SAM3Job, event: dict):
+        with self._cond:
+            if event.get("type") == "progress":
+                job.progress = event.get("percent", job.progress)
+                job.fps = event.get("fps", job.fps)
+                job.eta_sec = event.get("eta_sec", job.eta_sec)
+            self._append_event(job, event)
+
+    def _worker(self):
+        while True:
+            _, _, job_id = self._queue.get()
+            with self._cond:
+                job = self._jobs.get(job_id)
+                if job is None:
+                    continue
+                job.status = JOB_RUNNING
+                job.started_at = time.time()
+                self._running += 1
+                self._wait_times.append(job.started_at - job.created_at)
+                self._append_event(job, {"type": "started"})
+                snapshot = self._snapshot(job)
+            self._write_record(job.id, *snapshot)
+
+            try:
+                result = self.run_fn(job, lambda event: self._emit(job, event))
+                error = result.get("error") if isinstance(result, dict) else None
+            except Exception as e:
+                print(f"ERROR: SAM 3 job {job.id} failed: {e}")
+                result, error = None, str(e)
+
+            with self._cond:
+                job.finished_at = time.time()
+                job.result = result
+                job.error = error
+                job.status = JOB_FAILED if error else JOB_DONE
+                if not error:
+                    job.progress = 100
+                job.eta_sec = None
+                self._running -= 1
+                self._run_times.append(job.finished_at - job.started_at)
+                if error:
+                    self._failed += 1
+                else:
+                    self._completed += 1
+                self._append_event(job, {"type": job.status, "error": error} if error else {"type": job.status})
+                snapshot = self._snapshot(job)
+            self._write_record(job.id, *snapshot)
+            with self._cond:
+                self._forget_old_jobs(job)
+
+    def _snapshot(self, job: SAM3Job) -> tuple:
+        """调用方需持有 self._cond：序列化任务记录，返回 (版本号, JSON 文本, 是否已结束)。"""
+        record = job.to_dict(include_result=True)
+        record["events"] = list(job.events)
+        record["owners"] = sorted(job.owners, key=str)
+        return job.event_count, json.dumps(record, ensure_ascii=False), job.finished
+
+    def _write_record(self, job_id: str, revision: int, text: str, finished: bool):
+        """在 self._cond 之外写盘；未结束的任务另有 .pending 标记。"""
+        path = self._record_path(job_id)
+        with self._io_lock:
+            if revision < self._written_revision.get(job_id, -1):
+                return
+            self._written_revision[job_id] = revision
+            tmp_path = f"{path}.tmp"
+            try:
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    f.write(text)
+                os.replace(tmp_path, path)
+                if finished:
+                    if os.path.exists(path + PENDING_SUFFIX):
+                        os.unlink(path + PENDING_SUFFIX)
+                else:
+                    open(path + PENDING_SUFFIX, "w").close()
+            except OSError as e:
+                print(f"ERROR: Failed to persist SAM 3 job {job_id}: {e}")
+
+    def _recover_interrupted(self):
+        """启动时把上次进程退出时仍在排队/运行的任务标记为失败。"""
+        interrupted = 0
+        for name in os.listdir(self.results_dir):
+            if not name.endswith(".json" + PENDING_SUFFIX):
+                continue
+            job_id = name[:-len(".json" + PENDING_SUFFIX)]
+            try:
+                job = self._load_record(job_id)
+            except (OSError, ValueError) as e:
+                print(f"ERROR: Failed to load interrupted SAM 3 job {job_id}: {e}")
+                job = None
+            if job is None:
+                os.unlink(os.path.join(self.results_dir, name))
+                continue
+            with self._cond:
+                if not job.finished:
+                    job.status = JOB_FAILED
+                    job.error = "服务重启，任务被中断，请重新提交"
+                    job.finished_at = time.time()
+                    job.eta_sec = None
+                    self._append_event(job, {"type": JOB_FAILED, "error": job.error})
+                    interrupted += 1
+                snapshot = self._snapshot(job)
+            self._write_record(job.id, *snapshot)
+        if interrupted:
+            print(f"WARNING: Marked {interrupted} interrupted SAM 3 job(s) in {self.results_dir} as failed")
+
+    def _forget_old_jobs(self, job: SAM3Job):
+        self._finished_order.append(job.id)
+        while len(self._finished_order) > MAX_FINISHED_IN_MEMORY:
+            job_id = self._finished_order.popleft()
+            self._jobs.pop(job_id, None)
+            self._written_revision.pop(job_id, None)
+
+
+class ProgressMeter:
+    """
+    推理进度回调 progress_callback(processed, total, prompt=None) 的适配器：
+    计算吞吐量（帧/秒，滑动窗口）与预计剩余时间，并按百分比变化、提示词切换或时间间隔节流后
+    通过 emit 上报 progress 事件，避免逐帧事件撑大任务事件日志。
+    """
+
+    def __init__(self, emit, min_interval: float = PROGRESS_MIN_INTERVAL_SEC,
+                 window_sec: float = THROUGHPUT_WINDOW_SEC):
+        self.emit = emit
+        self.min_interval = min_interval
+        self.window_sec = window_sec
+        self.started_at = time.monotonic()
+        self._samples = deque()
+        self._last_pct = -1
+        self._last_prompt = None
+        self._last_emit = 0.0
+
+    def throughput(self, now: float, processed: int) -> float | None:
+        self._samples.append((now, processed))
+        while len(self._samples) > 2 and now - self._samples[0][0] > self.window_sec:
+            self._samples.popleft()
+        t0, p0 = self._samples[0]
+        if now - t0 <= 0:
+            return None
+        return (processed - p0) / (now - t0)
+
+    def __call__(self, processed: int, total: int, prompt: str = None):
+        now = time.monotonic()
+        fps = self.throughput(now, processed)
+        pct = int(processed / total * 100) if total > 0 else 0
+        if (pct == self._last_pct and prompt == self._last_prompt
+                and now - self._last_emit < self.min_interval):
+            return
+        self._last_pct, self._last_prompt, self._last_emit = pct, prompt, now
+
+        eta = (total - processed) / fps if fps and fps > 0 else None
+        self.emit({
+            "type": "progress",
+            "percent": pct,
+            "current": processed,
+            "total": total,
+            "prompt": prompt,
+            "fps": round(fps, 1) if fps is not None else None,
+            "eta_sec": round(eta, 1) if eta is not None else None,
+            "elapsed_sec": round(now - self.started_at, 1),
+        })
+
+
+def _latency_summary(sorted_values: list) -> dict:
+    if not sorted_values:
+        return {"count": 0, "avg": 0.0, "p50": 0.0, "p95": 0.0, "max": 0.0}
+    n = len(sorted_values)
+    return {
+        "count": n,
+        "avg": round(sum(sorted_values) / n, 3),
+        "p50": round(sorted_values[int(0.5 * (n - 1))], 3),
+        "p95": round(sorted_values[int(0.95 * (n - 1))], 3),
+        "max": round(sorted_values[-1], 3),
+    }
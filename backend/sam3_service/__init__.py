@@ -1,3 +1,8 @@
-from .predictor import SAM3Predictor, analyze_violations
+from .predictor import (
+    SAM3Predictor, StationaryRunTracker, analyze_violations, dedupe_tracks, tracks_to_columns, is_stream_url
+)
 
-__all__ = ["SAM3Predictor", "analyze_violations"]
+__all__ = [
+    "SAM3Predictor", "StationaryRunTracker", "analyze_violations", "dedupe_tracks", "tracks_to_columns",
+    "is_stream_url",
+]
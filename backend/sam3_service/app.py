@@ -6,39 +6,268 @@ Usage:
     pip install -e /path/to/sam3
     pip install -r requirements.txt
     uvicorn app:app --host 0.0.0.0 --port 8100
+
+Videos are kept in a content-addressed store (SAM3_VIDEO_STORE) so clients can
+skip re-uploading footage the service already holds:
+    HEAD /videos/{sha256}            -> 200 if stored, 404 otherwise
+    PUT  /videos/{sha256}            -> raw request body, streamed to disk
+    POST /segment-video/{sha256}     -> analyse a stored video; optional JSON body
+                                        {"frame_stride", "downscale", "roi"}
+
+Pass ?include_tracks=true to also receive the per-frame tracks as columns
+(track_id, frame_index, bbox, score, interpolated) under "tracks".
+
+Inference runs in the threadpool, so /health keeps answering while a video is
+being processed. Uploads are size-checked as they stream in, and videos with a
+request in flight are never pruned from the store.
 """
 
+import hashlib
 import os
+import re
 import tempfile
+from collections import Counter
 
-from fastapi import FastAPI, File, UploadFile
-from fastapi.responses import JSONResponse
+from fastapi import Body, FastAPI, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, Response
+from python_multipart.multipart import MultipartParser, parse_options_header
 
 from predictor import SAM3Predictor, analyze_violations
 
 app = FastAPI(title="SAM 3 Vehicle Tracking Service")
 
 USE_MOCK = os.environ.get("SAM3_MOCK", "false").lower() == "true"
-predictor = SAM3Predictor(use_mock=USE_MOCK)
+PROMPT_MODE = os.environ.get("SAM3_PROMPT_MODE", "single_pass")
+# Videos longer than SAM3_CHUNK_SEC are tracked in overlapping chunks (0 = one session per video)
+CHUNK_SEC = float(os.environ.get("SAM3_CHUNK_SEC", "0"))
+CHUNK_WORKERS = int(os.environ.get("SAM3_CHUNK_WORKERS", "1"))
+predictor = SAM3Predictor(use_mock=USE_MOCK, prompt_mode=PROMPT_MODE, chunk_sec=CHUNK_SEC,
+                          chunk_workers=CHUNK_WORKERS)
 
+MAX_UPLOAD_BYTES = int(os.environ.get("SAM3_MAX_UPLOAD_MB", "4096")) * 1024 * 1024
+VIDEO_STORE = os.environ.get("SAM3_VIDEO_STORE", os.path.join(tempfile.gettempdir(), "sam3_videos"))
+VIDEO_STORE_MAX_BYTES = int(os.environ.get("SAM3_VIDEO_STORE_MAX_GB", "20")) * 1024 ** 3
+os.makedirs(VIDEO_STORE, exist_ok=True)
+
+_SHA256_RE = re.compile(r"^[0-9a-f]{64}$")
+# Headers and boundaries of a multipart upload on top of the video itself
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+# Keyword arguments of SAM3Predictor.process_video that clients may set
+INFERENCE_OPTIONS = {"frame_stride", "downscale", "roi", "online"}
+
+# Stored path -> number of requests currently reading it. Only touched from the event loop.
+_in_flight = Counter()
+
+
+def _stored_path(sha256: str) -> str:
+    if not _SHA256_RE.match(sha256):
+        raise HTTPException(status_code=400, detail="invalid sha256")
+    return os.path.join(VIDEO_STORE, sha256)
+
+
+def _prune_store(keep: str):
+    """
+    Drop the least recently used videos once the store exceeds its byte budget.
+    Videos that a request is still segmenting are skipped.
+    """
+    entries = []
+    for name in os.listdir(VIDEO_STORE):
+        path = os.path.join(VIDEO_STORE, name)
+        if _SHA256_RE.match(name) and path != keep and not _in_flight[path]:
+            st = os.stat(path)
+            entries.append((st.st_mtime, st.st_size, path))
+    total = sum(size for _, size, _ in entries) + os.path.getsize(keep)
+    for _, size, path in sorted(entries):
+        if total <= VIDEO_STORE_MAX_BYTES:
+            break
+        os.unlink(path)
+        total -= size
 
-@app.post("/segment-video")
-async def segment_video(video: UploadFile = File(...)):
-    suffix = os.path.splitext(video.filename or "video.mp4")[1]
-    with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as tmp:
-        content = await video.read()
-        tmp.write(content)
-        tmp_path = tmp.name
 
+async def _write_chunks(chunks, dest_path: str) -> str:
+    """
+    Stream byte chunks into dest_path, enforcing MAX_UPLOAD_BYTES.
+    Returns the sha256 of the written content.
+    """
+    digest = hashlib.sha256()
+    written = 0
     try:
-        result = predictor.process_video(tmp_path)
-        if "error" in result:
-            return JSONResponse(status_code=400, content=result)
-        return result
+        with open(dest_path, "wb") as f:
+            async for chunk in chunks:
+                written += len(chunk)
+                if written > MAX_UPLOAD_BYTES:
+                    raise HTTPException(status_code=413, detail="video exceeds SAM3_MAX_UPLOAD_MB")
+                digest.update(chunk)
+                f.write(chunk)
+    except BaseException:
+        if os.path.exists(dest_path):
+            os.unlink(dest_path)
+        raise
+    return digest.hexdigest()
+
+
+def _check_content_length(request: Request, limit: int):
+    """Reject a declared oversized body before reading any of it."""
+    length = request.headers.get("content-length")
+    if length is not None and length.isdigit() and int(length) > limit:
+        raise HTTPException(status_code=413, detail="video exceeds SAM3_MAX_UPLOAD_MB")
+
+
+async def _multipart_file_chunks(request: Request, field: str):
+    """
+    Yield the bytes of one file field of a multipart/form-data body as they arrive,
+    parsed straight from the request stream (nothing is spooled beforehand).
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise HTTPException(status_code=400, detail="expected multipart/form-data")
+
+    pending = []
+    part = {"header": b"", "value": b"", "wanted": False, "found": False}
+
+    def on_part_begin():
+        part.update(header=b"", value=b"", wanted=False)
+
+    def on_header_field(data: bytes, start: int, end: int):
+        part["header"] += data[start:end]
+
+    def on_header_value(data: bytes, start: int, end: int):
+        part["value"] += data[start:end]
+
+    def on_header_end():
+        if part["header"].lower() == b"content-disposition":
+            _, disposition = parse_options_header(part["value"])
+            if disposition.get(b"name") == field.encode() and not part["found"]:
+                part.update(wanted=True, found=True)
+        part.update(header=b"", value=b"")
+
+    def on_part_data(data: bytes, start: int, end: int):
+        if part["wanted"]:
+            pending.append(data[start:end])
+
+    parser = MultipartParser(params[b"boundary"], {
+        "on_part_begin": on_part_begin, "on_header_field": on_header_field,
+        "on_header_value": on_header_value, "on_header_end": on_header_end, "on_part_data": on_part_data,
+    })
+    async for body in request.stream():
+        parser.write(body)
+        for chunk in pending:
+            yield chunk
+        pending.clear()
+    parser.finalize()
+    if not part["found"]:
+        raise HTTPException(status_code=422, detail=f"missing file field '{field}'")
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _validate_options(options: dict | None, include_tracks: bool) -> dict:
+    """
+    Check the client's inference options before any work starts, so that a TypeError
+    or ValueError raised later inside inference is a server error (500), not a 400.
+    """
+    options = dict(options or {})
+    unknown = set(options) - INFERENCE_OPTIONS
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"unknown inference options: {sorted(unknown)}")
+    stride = options.get("frame_stride", 1)
+    if not isinstance(stride, int) or isinstance(stride, bool) or stride < 1:
+        raise HTTPException(status_code=400, detail="frame_stride must be an integer >= 1")
+    downscale = options.get("downscale", 1.0)
+    if not _is_number(downscale) or not 0 < downscale <= 1:
+        raise HTTPException(status_code=400, detail="downscale must be a number in (0, 1]")
+    roi = options.get("roi")
+    if roi is not None and not (isinstance(roi, list) and len(roi) >= 3 and all(
+            isinstance(p, list) and len(p) == 2 and all(_is_number(c) for c in p) for p in roi)):
+        raise HTTPException(status_code=400, detail="roi must be a polygon of at least 3 [x, y] points")
+    online = options.get("online", False)
+    if not isinstance(online, bool):
+        raise HTTPException(status_code=400, detail="online must be a boolean")
+    if online and include_tracks:
+        raise HTTPException(status_code=400, detail="online analysis keeps no per-frame tracks to return")
+    return options
+
+
+async def _segment(video_path: str, options: dict = None, include_tracks: bool = False):
+    options = _validate_options(options, include_tracks)
+    _in_flight[video_path] += 1
+    try:
+        # Blocking inference off the event loop: /health and uploads stay responsive meanwhile
+        result = await run_in_threadpool(predictor.process_video, video_path, return_tracks=include_tracks,
+                                         **options)
     finally:
+        _in_flight[video_path] -= 1
+        if not _in_flight[video_path]:
+            del _in_flight[video_path]
+    if "tracks" in result:
+        result["tracks"] = {name: column.tolist() for name, column in result["tracks"].items()}
+    if "error" in result:
+        return JSONResponse(status_code=400, content=result)
+    return result
+
+
+@app.post("/segment-video")
+async def segment_video(request: Request, include_tracks: bool = False):
+    """Multipart upload with the video in the "video" field."""
+    _check_content_length(request, MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES)
+    fd, tmp_path = tempfile.mkstemp(dir=VIDEO_STORE, suffix=".part")
+    os.close(fd)
+    sha256 = await _write_chunks(_multipart_file_chunks(request, "video"), tmp_path)
+
+    # Keep the upload in the store so later requests can reference it by hash
+    stored = _stored_path(sha256)
+    os.replace(tmp_path, stored)
+    _prune_store(keep=stored)
+    return await _segment(stored, include_tracks=include_tracks)
+
+
+@app.head("/videos/{sha256}")
+async def has_video(sha256: str):
+    stored = _stored_path(sha256)
+    if not os.path.exists(stored):
+        return Response(status_code=404)
+    os.utime(stored)
+    return Response(status_code=200, headers={"Content-Length": str(os.path.getsize(stored))})
+
+
+@app.put("/videos/{sha256}")
+async def put_video(sha256: str, request: Request):
+    stored = _stored_path(sha256)
+    if os.path.exists(stored):
+        os.utime(stored)
+        return {"sha256": sha256, "stored": True, "uploaded": False}
+
+    _check_content_length(request, MAX_UPLOAD_BYTES)
+    fd, tmp_path = tempfile.mkstemp(dir=VIDEO_STORE, suffix=".part")
+    os.close(fd)
+    actual = await _write_chunks(request.stream(), tmp_path)
+    if actual != sha256:
         os.unlink(tmp_path)
+        raise HTTPException(status_code=400, detail=f"sha256 mismatch: got {actual}")
+    os.replace(tmp_path, stored)
+    _prune_store(keep=stored)
+    return {"sha256": sha256, "stored": True, "uploaded": True}
+
+
+@app.post("/segment-video/{sha256}")
+async def segment_stored_video(sha256: str, options: dict | None = Body(default=None),
+                               include_tracks: bool = False):
+    stored = _stored_path(sha256)
+    if not os.path.exists(stored):
+        raise HTTPException(status_code=404, detail="video not stored, upload it first")
+    os.utime(stored)
+    return await _segment(stored, options, include_tracks)
 
 
 @app.get("/health")
 async def health():
-    return {"status": "ok", "mock_mode": predictor.use_mock}
+    return {
+        "status": "ok",
+        "mock_mode": predictor.use_mock,
+        "prompt_mode": predictor.prompt_mode,
+        # Base configuration fingerprint (default inference options), lets clients key result caches
+        "config": predictor.config_fingerprint(),
+    }
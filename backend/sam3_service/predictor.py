@@ -3,10 +3,15 @@ SAM 3 Video Predictor wrapper for vehicle segmentation and tracking.
 Provides both real SAM 3 inference (requires CUDA) and mock mode for development.
 """
 
+import json
 import math
 import os
 import random
+import tempfile
+import threading
 import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 import cv2
 import numpy as np
@@ -16,18 +21,270 @@ VEHICLE_PROMPTS = ["car", "truck", "van", "bus"]
 STATIONARY_THRESHOLD_PX = 10  # pixels per second
 VIOLATION_DURATION_SEC = 5.0
 
+# "single_pass": add every vehicle prompt to one session, then propagate once.
+# "per_prompt": reset and propagate the session once per prompt (previous behaviour).
+PROMPT_MODES = ("single_pass", "per_prompt")
+# Tracks whose boxes overlap at least this much on shared frames are the same vehicle
+DEDUP_IOU_THRESHOLD = 0.7
+# ...provided they share at least this fraction of the shorter track's frames
+DEDUP_MIN_OVERLAP = 0.5
+# Detection gaps up to this long are filled by linear interpolation on the stride grid
+MAX_INTERP_GAP_SEC = 2.0
+
+# Live sources are tracked in windows of this length; a violation is reported at the end of
+# the window in which it occurs, so this bounds the detection latency
+STREAM_WINDOW_SEC = 2.0
+# Reading a stream ends after this long without a new frame
+STREAM_IDLE_TIMEOUT_SEC = 10.0
+# Tracks of consecutive windows with at least this box IoU at the boundary are the same vehicle
+STREAM_STITCH_IOU = 0.3
+# Long videos are tracked in chunks (SAM3Predictor chunk_sec) that overlap by this long;
+# tracks of neighbouring chunks are stitched on the frames both tracked
+CHUNK_OVERLAP_SEC = 2.0
+# ...when their boxes on those frames overlap at least this much on average
+CHUNK_STITCH_IOU = 0.5
+STREAM_URL_SCHEMES = ("rtsp://", "rtsps://", "rtmp://", "http://", "https://", "udp://", "tcp://", "srt://")
+# Files that are still being written are followed in reads of this size, polling this often at the end
+FOLLOW_CHUNK_BYTES = 256 * 1024
+FOLLOW_POLL_SEC = 0.05
+
 
 def _bbox_center(bbox):
     x1, y1, x2, y2 = bbox
     return ((x1 + x2) / 2, (y1 + y2) / 2)
 
 
+def pack_track_frames(frames: list) -> tuple:
+    """
+    Pack a track's frame dicts into column arrays.
+    Returns (frame_index[int64, N], boxes[float64, N x 4], scores[float64, N]).
+    """
+    n = len(frames)
+    frame_index = np.fromiter((f["frame_index"] for f in frames), dtype=np.int64, count=n)
+    boxes = np.array([f["bbox"] for f in frames], dtype=np.float64).reshape(n, 4)
+    scores = np.fromiter((f.get("score", 0.0) for f in frames), dtype=np.float64, count=n)
+    return frame_index, boxes, scores
+
+
+def longest_stationary_run(frame_index: np.ndarray, boxes: np.ndarray, fps: float) -> tuple:
+    """
+    Vectorized search for the longest stationary run of a track.
+    Returns (duration_sec, start_frame_index, end_frame_index); (0, 0, 0) if no run
+    lasts longer than zero seconds. Ties resolve to the earliest run.
+    """
+    centers = (boxes[:, 0:2] + boxes[:, 2:4]) / 2
+    dt = np.diff(frame_index) / fps
+    dist = np.sqrt(np.square(np.diff(centers[:, 0])) + np.square(np.diff(centers[:, 1])))
+
+    # Pairs with dt <= 0 are skipped: they neither break nor extend a run
+    valid = dt > 0
+    speed = np.divide(dist, dt, out=np.zeros_like(dist), where=valid)
+    breaks = np.flatnonzero(valid & (speed >= STATIONARY_THRESHOLD_PX)) + 1
+
+    starts = np.concatenate(([0], breaks))
+    ends = np.concatenate((breaks - 1, [len(frame_index) - 1]))
+    durations = (frame_index[ends] - frame_index[starts]) / fps
+
+    best = int(np.argmax(durations))
+    if durations[best] <= 0:
+        return 0, 0, 0
+    return float(durations[best]), int(frame_index[starts[best]]), int(frame_index[ends[best]])
+
+
+def tracks_to_columns(tracks: list) -> dict:
+    """
+    Flatten tracks into one struct-of-arrays table, one row per (track, frame),
+    sorted by frame_index then track_id so frame ranges can be sliced by bisection.
+    """
+    rows = [(t["track_id"], f) for t in tracks for f in t["frames"]]
+    n = len(rows)
+    track_id = np.fromiter((tid for tid, _ in rows), dtype=np.int32, count=n)
+    frame_index = np.fromiter((f["frame_index"] for _, f in rows), dtype=np.int32, count=n)
+    bbox = np.array([f["bbox"] for _, f in rows], dtype=np.float32).reshape(n, 4)
+    score = np.fromiter((f.get("score", 0.0) for _, f in rows), dtype=np.float32, count=n)
+    interpolated = np.fromiter((f.get("interpolated", False) for _, f in rows), dtype=bool, count=n)
+    order = np.lexsort((track_id, frame_index))
+    return {
+        "track_id": track_id[order],
+        "frame_index": frame_index[order],
+        "bbox": bbox[order],
+        "score": score[order],
+        "interpolated": interpolated[order],
+    }
+
+
+def box_iou(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Row-wise IoU of two N x 4 arrays of [x1, y1, x2, y2] boxes."""
+    iw = np.clip(np.minimum(a[:, 2], b[:, 2]) - np.maximum(a[:, 0], b[:, 0]), 0, None)
+    ih = np.clip(np.minimum(a[:, 3], b[:, 3]) - np.maximum(a[:, 1], b[:, 1]), 0, None)
+    inter = iw * ih
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    union = area_a + area_b - inter
+    return np.divide(inter, union, out=np.zeros_like(inter), where=union > 0)
+
+
+def dedupe_tracks(tracks: list, iou_threshold: float = DEDUP_IOU_THRESHOLD,
+                  min_overlap: float = DEDUP_MIN_OVERLAP) -> list:
+    """
+    Merge tracks that follow the same vehicle (e.g. detected under both "car" and "van").
+    Two tracks are duplicates when they share at least min_overlap of the shorter
+    track's frames and their mean IoU on those frames is >= iou_threshold.
+    The track with the higher mean score keeps its class; frames are unioned,
+    preferring that track's boxes where both have one. Track ids are renumbered.
+    """
+    packed = [pack_track_frames(t["frames"]) for t in tracks]
+    mean_scores = [float(scores.mean()) if len(scores) else 0.0 for _, _, scores in packed]
+    # Visit higher-scoring tracks first so they absorb their duplicates
+    order = sorted(range(len(tracks)), key=lambda i: -mean_scores[i])
+    merged_into = {}
+
+    for pos, i in enumerate(order):
+        if i in merged_into:
+            continue
+        fi_i, boxes_i, _ = packed[i]
+        for j in order[pos + 1:]:
+            if j in merged_into:
+                continue
+            fi_j, boxes_j, _ = packed[j]
+            shared, idx_i, idx_j = np.intersect1d(fi_i, fi_j, assume_unique=True, return_indices=True)
+            shorter = min(len(fi_i), len(fi_j))
+            if shorter == 0 or len(shared) < min_overlap * shorter:
+                continue
+            if box_iou(boxes_i[idx_i], boxes_j[idx_j]).mean() >= iou_threshold:
+                merged_into[j] = i
+
+    results = []
+    for i in order:
+        if i in merged_into:
+            continue
+        by_frame = {}
+        for j in (j for j, root in merged_into.items() if root == i):
+            by_frame.update((f["frame_index"], f) for f in tracks[j]["frames"])
+        by_frame.update((f["frame_index"], f) for f in tracks[i]["frames"])
+        results.append({
+            **tracks[i],
+            "frames": [by_frame[k] for k in sorted(by_frame)],
+        })
+
+    results.sort(key=lambda t: t["track_id"])
+    for new_id, track in enumerate(results, start=1):
+        track["track_id"] = new_id
+    return results
+
+
+def points_in_polygon(points: np.ndarray, polygon: np.ndarray) -> np.ndarray:
+    """Even-odd test of N x 2 points against an M x 2 polygon, vectorized over points and edges."""
+    x, y = points[:, 0:1], points[:, 1:2]
+    px, py = polygon[:, 0], polygon[:, 1]
+    qx, qy = np.roll(px, -1), np.roll(py, -1)
+    crosses = (py > y) != (qy > y)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x_cross = px + (y - py) * (qx - px) / (qy - py)
+    return np.count_nonzero(crosses & (x < x_cross), axis=1) % 2 == 1
+
+
+def filter_tracks_to_roi(tracks: list, roi) -> list:
+    """Keep only frames whose bbox center lies inside the ROI polygon; drop tracks left empty."""
+    polygon = np.asarray(roi, dtype=np.float64)
+    results = []
+    for track in tracks:
+        if not track["frames"]:
+            continue
+        _, boxes, _ = pack_track_frames(track["frames"])
+        inside = points_in_polygon((boxes[:, 0:2] + boxes[:, 2:4]) / 2, polygon)
+        if inside.any():
+            results.append({**track, "frames": [track["frames"][i] for i in np.flatnonzero(inside)]})
+    return results
+
+
+def interpolate_track_frames(frames: list, step: int, max_gap: int) -> list:
+    """
+    Fill missing samples on the step grid by linear interpolation between the
+    neighbouring detections, for gaps of at most max_gap frames. Interpolated
+    frames are marked with "interpolated": True. Speeds between consecutive
+    samples are unchanged, so stationary runs are preserved.
+    """
+    if len(frames) < 2 or step < 1:
+        return frames
+    frame_index, boxes, scores = pack_track_frames(frames)
+    grid = np.arange(frame_index[0], frame_index[-1] + 1, step)
+    missing = grid[~np.isin(grid, frame_index)]
+    if len(missing) == 0:
+        return frames
+
+    right = np.searchsorted(frame_index, missing)
+    left = right - 1
+    gap = frame_index[right] - frame_index[left]
+    keep = gap <= max_gap
+    missing, left, right, gap = missing[keep], left[keep], right[keep], gap[keep]
+    if len(missing) == 0:
+        return frames
+
+    w = ((missing - frame_index[left]) / gap)[:, None]
+    interp_boxes = np.round(boxes[left] * (1 - w) + boxes[right] * w, 1)
+    interp_scores = np.round(scores[left] * (1 - w[:, 0]) + scores[right] * w[:, 0], 3)
+    filled = [
+        {"frame_index": int(fi), "bbox": box.tolist(), "score": float(score), "interpolated": True}
+        for fi, box, score in zip(missing, interp_boxes, interp_scores)
+    ]
+    return sorted(frames + filled, key=lambda f: f["frame_index"])
+
+
 def analyze_violations(tracks: list, fps: float) -> list:
     """
     Given a list of vehicle tracks, determine which ones are violations.
     A vehicle is in violation if its bbox center moves < STATIONARY_THRESHOLD_PX/sec
     for more than VIOLATION_DURATION_SEC consecutive seconds.
     """
+    if fps <= 0:
+        return _analyze_violations_scalar(tracks, fps)
+
+    results = []
+    for track in tracks:
+        frames = track["frames"]
+        if len(frames) < 2:
+            results.append({**track, "is_violation": False, "stationary_duration_sec": 0})
+            continue
+
+        frame_index, boxes, _ = pack_track_frames(frames)
+        max_stationary_duration, range_start, range_end = longest_stationary_run(frame_index, boxes, fps)
+
+        is_violation = max_stationary_duration >= VIOLATION_DURATION_SEC
+        start_sec = round(range_start / fps, 1)
+        end_sec = round(range_end / fps, 1)
+
+        # Pick best frame for license plate recognition (middle of stationary period)
+        best_frame_idx = (range_start + range_end) // 2
+        matches = np.flatnonzero(frame_index == best_frame_idx)
+        best_pos = int(matches[0]) if len(matches) else len(frames) // 2
+        best_frame_data = frames[best_pos]
+
+        result = {
+            "track_id": track["track_id"],
+            "class": track["class"],
+            "is_violation": is_violation,
+            "stationary_duration_sec": round(max_stationary_duration, 1),
+            "best_frame_index": best_frame_data["frame_index"],
+            "best_frame_bbox": best_frame_data["bbox"],
+        }
+        if is_violation:
+            result["violation_reason"] = (
+                f"车辆在第{start_sec}s-{end_sec}s期间静止不动"
+                f"（{round(max_stationary_duration, 1)}秒），超过{VIOLATION_DURATION_SEC}秒阈值"
+            )
+            # Collect bbox samples for the report
+            sample_mask = np.isin(frame_index, [range_start, best_frame_data["frame_index"], range_end])
+            result["bbox_samples"] = [frames[i]["bbox"] for i in np.flatnonzero(sample_mask)]
+        results.append(result)
+    return results
+
+
+def _analyze_violations_scalar(tracks: list, fps: float) -> list:
+    """
+    Reference per-frame implementation of analyze_violations.
+    Kept for parity checks and benchmarks against the columnar engine.
+    """
     results = []
     for track in tracks:
         frames = track["frames"]
@@ -93,38 +350,422 @@ def analyze_violations(tracks: list, fps: float) -> list:
     return results
 
 
+class StationaryRunTracker:
+    """
+    Online counterpart of analyze_violations: consumes (track_id, frame_index, bbox)
+    observations one at a time, in frame order per track, and keeps O(1) state per
+    track: the current stationary run, the longest run so far and a running score.
+    Speeds and run boundaries follow longest_stationary_run, so the longest run and
+    the verdict match analyze_violations on the same observations. The best frame is
+    the kept sample nearest the middle of the longest run; the current run keeps at
+    most 2 * RUN_SAMPLES evenly spaced samples, so it is within about 1/RUN_SAMPLES of
+    the run's length from the exact middle that analyze_violations picks.
+
+    update() reports a run the moment it reaches VIOLATION_DURATION_SEC (once per run;
+    a vehicle that moves off and parks again is reported again). vehicles() / query()
+    give analyze_violations-style verdicts at any point, snapshot() / from_snapshot()
+    save and restore the whole state as plain JSON-serializable data.
+    """
+
+    RUN_SAMPLES = 8
+
+    def __init__(self, fps: float):
+        self.fps = fps
+        self._tracks = {}
+
+    def __len__(self) -> int:
+        return len(self._tracks)
+
+    def update(self, track_id: int, vehicle_class: str, frame_index: int, bbox, score: float = 0.0) -> dict | None:
+        """Add one observation; returns a violation event if it completes one, else None."""
+        bbox = [float(v) for v in bbox]
+        center = _bbox_center(bbox)
+        state = self._tracks.get(track_id)
+        if state is None:
+            self._tracks[track_id] = {
+                "class": vehicle_class, "observations": 1, "score_sum": float(score),
+                "first_frame": frame_index, "first_bbox": bbox,
+                "last_frame": frame_index, "last_bbox": bbox, "last_center": list(center),
+                "run": self._new_run(frame_index, bbox), "reported": False,
+                # Longest run that has ended: [duration_sec, start, end, best_frame, best_bbox, start_bbox, end_bbox]
+                "longest": None,
+            }
+            return None
+
+        state["observations"] += 1
+        state["score_sum"] += float(score)
+        dt = (frame_index - state["last_frame"]) / self.fps
+        if dt > 0:
+            dist = math.sqrt((center[0] - state["last_center"][0]) ** 2 + (center[1] - state["last_center"][1]) ** 2)
+            if dist / dt >= STATIONARY_THRESHOLD_PX:
+                self._close_run(state)
+                state["run"] = self._new_run(frame_index, bbox)
+                state["reported"] = False
+        run = state["run"]
+        if frame_index != run["samples"][-1][0]:
+            run["seen"] += 1
+            if run["seen"] % run["every"] == 0:
+                run["samples"].append([frame_index, bbox])
+                if len(run["samples"]) >= 2 * self.RUN_SAMPLES:
+                    run["samples"] = run["samples"][::2]
+                    run["every"] *= 2
+        run["end"] = frame_index
+        run["end_bbox"] = bbox
+        state["last_frame"] = frame_index
+        state["last_bbox"] = bbox
+        state["last_center"] = list(center)
+
+        duration = (frame_index - run["start"]) / self.fps
+        if state["reported"] or duration < VIOLATION_DURATION_SEC:
+            return None
+        state["reported"] = True
+        return {
+            "track_id": track_id,
+            "class": state["class"],
+            "frame_index": frame_index,
+            "bbox": bbox,
+            "stationary_start_frame": run["start"],
+            "stationary_duration_sec": round(duration, 1),
+            "violation_reason": self._reason(run["start"], frame_index, duration),
+        }
+
+    @staticmethod
+    def _new_run(frame_index: int, bbox: list) -> dict:
+        return {"start": frame_index, "end": frame_index, "end_bbox": bbox,
+                "samples": [[frame_index, bbox]], "seen": 0, "every": 1}
+
+    def _run_summary(self, run: dict) -> list:
+        middle = (run["start"] + run["end"]) // 2
+        candidates = run["samples"] + [[run["end"], run["end_bbox"]]]
+        best_frame, best_bbox = min(candidates, key=lambda s: abs(s[0] - middle))
+        return [(run["end"] - run["start"]) / self.fps, run["start"], run["end"], best_frame, best_bbox,
+                run["samples"][0][1], run["end_bbox"]]
+
+    def _close_run(self, state: dict):
+        # Strictly longer only: ties keep the earliest run, as in longest_stationary_run
+        run = state["run"]
+        duration = (run["end"] - run["start"]) / self.fps
+        if duration > 0 and (state["longest"] is None or duration > state["longest"][0]):
+            state["longest"] = self._run_summary(run)
+
+    def _reason(self, start: int, end: int, duration: float) -> str:
+        return (
+            f"车辆在第{round(start / self.fps, 1)}s-{round(end / self.fps, 1)}s期间静止不动"
+            f"（{round(duration, 1)}秒），超过{VIOLATION_DURATION_SEC}秒阈值"
+        )
+
+    def query(self, track_id: int) -> dict | None:
+        """Verdict for one track as analyze_violations would give it for the observations so far."""
+        state = self._tracks.get(track_id)
+        if state is None:
+            return None
+        longest = state["longest"]
+        run = state["run"]
+        current = (run["end"] - run["start"]) / self.fps
+        if current > 0 and (longest is None or current > longest[0]):
+            longest = self._run_summary(run)
+
+        if state["observations"] < 2 or longest is None:
+            return {
+                "track_id": track_id,
+                "class": state["class"],
+                "is_violation": False,
+                "stationary_duration_sec": 0,
+                "best_frame_index": state["first_frame"],
+                "best_frame_bbox": state["first_bbox"],
+            }
+        duration, start, end, best_frame, best_bbox, start_bbox, end_bbox = longest
+        result = {
+            "track_id": track_id,
+            "class": state["class"],
+            "is_violation": duration >= VIOLATION_DURATION_SEC,
+            "stationary_duration_sec": round(duration, 1),
+            "best_frame_index": best_frame,
+            "best_frame_bbox": best_bbox,
+        }
+        if result["is_violation"]:
+            result["violation_reason"] = self._reason(start, end, duration)
+            result["bbox_samples"] = [start_bbox, best_bbox, end_bbox]
+        return result
+
+    def vehicles(self, dedupe: bool = False) -> list:
+        """
+        Verdicts of all tracks, ordered by track id. With dedupe, tracks that are the same
+        vehicle seen under several prompts are merged the way dedupe_tracks would, judged
+        on O(1) state only: their frame spans overlap by at least DEDUP_MIN_OVERLAP of the
+        shorter span, and both their first and last boxes overlap by DEDUP_IOU_THRESHOLD.
+        The track with the higher mean score is kept.
+        """
+        ids = sorted(self._tracks)
+        if dedupe:
+            ids = self._dedupe(ids)
+        return [self.query(track_id) for track_id in ids]
+
+    def _dedupe(self, ids: list) -> list:
+        states = [self._tracks[i] for i in ids]
+        order = sorted(range(len(ids)), key=lambda k: -states[k]["score_sum"] / states[k]["observations"])
+        first = np.array([s["first_bbox"] for s in states], dtype=np.float64).reshape(-1, 4)
+        last = np.array([s["last_bbox"] for s in states], dtype=np.float64).reshape(-1, 4)
+        dropped = set()
+        for pos, a in enumerate(order):
+            if a in dropped:
+                continue
+            for b in order[pos + 1:]:
+                if b in dropped:
+                    continue
+                sa, sb = states[a], states[b]
+                shared = min(sa["last_frame"], sb["last_frame"]) - max(sa["first_frame"], sb["first_frame"])
+                shorter = min(sa["last_frame"] - sa["first_frame"], sb["last_frame"] - sb["first_frame"])
+                if shared < DEDUP_MIN_OVERLAP * shorter:
+                    continue
+                if (box_iou(first[[a]], first[[b]])[0] >= DEDUP_IOU_THRESHOLD
+                        and box_iou(last[[a]], last[[b]])[0] >= DEDUP_IOU_THRESHOLD):
+                    dropped.add(b)
+        return [track_id for k, track_id in enumerate(ids) if k not in dropped]
+
+    def prune(self, before_frame: int) -> list:
+        """Forget tracks last seen before before_frame; returns their final verdicts."""
+        gone = [t for t, state in self._tracks.items() if state["last_frame"] < before_frame]
+        verdicts = [self.query(t) for t in gone]
+        for track_id in gone:
+            del self._tracks[track_id]
+        return verdicts
+
+    def snapshot(self) -> dict:
+        """The complete state as JSON-serializable data (see from_snapshot)."""
+        return json.loads(json.dumps({"fps": self.fps, "tracks": [[k, v] for k, v in self._tracks.items()]}))
+
+    @classmethod
+    def from_snapshot(cls, data: dict) -> "StationaryRunTracker":
+        tracker = cls(data["fps"])
+        tracker._tracks = {track_id: state for track_id, state in data["tracks"]}
+        return tracker
+
+
+def match_boxes(a: np.ndarray, b: np.ndarray, iou_threshold: float) -> list:
+    """
+    Greedy one-to-one matching of N x 4 boxes a to M x 4 boxes b, highest IoU first.
+    Returns [(i, j)] for pairs with IoU >= iou_threshold.
+    """
+    if len(a) == 0 or len(b) == 0:
+        return []
+    iou = box_iou(np.repeat(a, len(b), axis=0), np.tile(b, (len(a), 1))).reshape(len(a), len(b))
+    return _greedy_pairs(iou, iou_threshold)
+
+
+def _greedy_pairs(score: np.ndarray, threshold: float) -> list:
+    """One-to-one (row, column) pairs of an N x M score matrix, highest score first, down to threshold."""
+    pairs = []
+    if score.size == 0:
+        return pairs
+    cols = score.shape[1]
+    for flat in np.argsort(-score, axis=None):
+        i, j = divmod(int(flat), cols)
+        if score[i, j] < threshold:
+            break
+        if all(i != pi and j != pj for pi, pj in pairs):
+            pairs.append((i, j))
+    return pairs
+
+
+class _TrackStitcher:
+    """
+    Stable track ids across independently tracked windows. A window's track continues
+    an open track when their boxes overlap by iou_threshold: averaged over the frames
+    both have, when windows overlap by up to overlap frames, otherwise the open track's
+    last box against the new track's first box, provided the gap is at most max_gap frames.
+    """
+
+    def __init__(self, max_gap: int, iou_threshold: float = STREAM_STITCH_IOU, overlap: int = 0):
+        self.max_gap = max_gap
+        self.iou_threshold = iou_threshold
+        self.overlap = overlap
+        self._tails = {}  # track id -> {frame_index: bbox} of its last overlap + 1 frames
+        self._next_id = 1
+
+    def _score(self, tail: dict, frames: list) -> float:
+        shared = [(tail[f["frame_index"]], f["bbox"]) for f in frames if f["frame_index"] in tail]
+        if not shared:
+            shared = [(tail[max(tail)], frames[0]["bbox"])]
+        a = np.array([old for old, _ in shared], dtype=np.float64)
+        b = np.array([new for _, new in shared], dtype=np.float64)
+        return float(box_iou(a, b).mean())
+
+    def assign(self, tracks: list):
+        """Rewrite the track_id of each (non-empty) track in place."""
+        tracks = [t for t in tracks if t["frames"]]
+        window_start = min((t["frames"][0]["frame_index"] for t in tracks), default=0)
+        open_ids = [tid for tid, tail in self._tails.items() if window_start - max(tail) <= self.max_gap]
+        score = np.array([[self._score(self._tails[tid], t["frames"]) for t in tracks] for tid in open_ids],
+                         dtype=np.float64).reshape(len(open_ids), len(tracks))
+        continued = {j: open_ids[i] for i, j in _greedy_pairs(score, self.iou_threshold)}
+        for j, track in enumerate(tracks):
+            track_id = continued.get(j)
+            if track_id is None:
+                track_id = self._next_id
+                self._next_id += 1
+            track["track_id"] = track_id
+            last = track["frames"][-1]["frame_index"]
+            self._tails[track_id] = {f["frame_index"]: f["bbox"] for f in track["frames"]
+                                     if f["frame_index"] >= last - self.overlap}
+        for tid in [tid for tid, tail in self._tails.items() if window_start - max(tail) > self.max_gap]:
+            del self._tails[tid]
+
+
 class SAM3Predictor:
     """
     Wraps SAM 3 video predictor for vehicle segmentation and tracking.
     Falls back to mock mode when SAM 3 is not available (no CUDA / not installed).
     """
 
-    def __init__(self, use_mock: bool = False):
+    def __init__(self, use_mock: bool = False, prompt_mode: str = "single_pass", chunk_sec: float = 0.0,
+                 chunk_overlap_sec: float = CHUNK_OVERLAP_SEC, chunk_workers: int = 1,
+                 mock_seed: int = None, mock_vehicles: tuple = (2, 4)):
+        if prompt_mode not in PROMPT_MODES:
+            raise ValueError(f"prompt_mode must be one of {PROMPT_MODES}, got {prompt_mode!r}")
+        if chunk_sec < 0 or chunk_overlap_sec < 0:
+            raise ValueError("chunk_sec and chunk_overlap_sec must not be negative")
         self.use_mock = use_mock
+        self.prompt_mode = prompt_mode
+        # Videos longer than chunk_sec are tracked in overlapping chunks (see process_video); 0 disables
+        self.chunk_sec = float(chunk_sec)
+        self.chunk_overlap_sec = float(chunk_overlap_sec)
+        self.chunk_workers = max(1, int(chunk_workers))
+        # Mock engine: (min, max) number of simulated vehicles; with mock_seed its output is a
+        # function of the video's shape, so load tests are reproducible
+        self.mock_seed = mock_seed
+        self.mock_vehicles = tuple(mock_vehicles)
         self.model = None
+        self.model_version = "mock"
         if not use_mock:
             try:
                 from sam3.model_builder import build_sam3_video_predictor
                 self.model = build_sam3_video_predictor()
+                self.model_version = _package_version("sam3")
             except Exception:
                 self.use_mock = True
 
-    def process_video(self, video_path: str, progress_callback=None) -> dict:
+    def config_fingerprint(self, frame_stride: int = 1, downscale: float = 1.0, roi=None) -> dict:
+        """
+        Everything that determines the output for a given video: engine and model
+        version, prompts, analysis thresholds and inference options. Used as part of
+        result cache keys, so any change here invalidates cached analyses.
+        """
+        return {
+            "engine": "mock" if self.use_mock else "sam3",
+            "model_version": self.model_version,
+            "prompts": list(VEHICLE_PROMPTS),
+            "prompt_mode": self.prompt_mode,
+            "stationary_threshold_px": STATIONARY_THRESHOLD_PX,
+            "violation_duration_sec": VIOLATION_DURATION_SEC,
+            "dedup_iou_threshold": DEDUP_IOU_THRESHOLD,
+            "dedup_min_overlap": DEDUP_MIN_OVERLAP,
+            "max_interp_gap_sec": MAX_INTERP_GAP_SEC,
+            "chunk_sec": self.chunk_sec,
+            "chunk_overlap_sec": self.chunk_overlap_sec if self.chunk_sec else None,
+            "frame_stride": max(1, int(frame_stride)),
+            "downscale": float(downscale),
+            "roi": [[float(x), float(y)] for x, y in roi] if roi is not None else None,
+        }
+
+    def process_video(self, video_path: str, progress_callback=None, frame_stride: int = 1,
+                      downscale: float = 1.0, roi=None, return_tracks: bool = False,
+                      online: bool = False) -> dict:
         """
         Process a video file and return vehicle tracking + violation analysis.
-        progress_callback(current_frame, total_frames) is called periodically.
+        progress_callback(processed, total, prompt) is called as frames are tracked;
+        processed/total count frame-steps summed over all propagation passes, so the
+        ratio is monotonic across the whole run.
+
+        Throughput/accuracy trade-offs:
+          frame_stride  track every Nth frame only (tracks are interpolated back onto the stride grid)
+          downscale     resize factor in (0, 1] applied before tracking; boxes are mapped back
+          roi           polygon [[x, y], ...] in source pixels; pixels outside are masked out and
+                        detections whose center falls outside are dropped
+
+        The result includes per-stage wall-clock timings in seconds under "timings".
+        With return_tracks=True it also carries the per-frame tracks under "tracks"
+        as tracks_to_columns() arrays; "vehicles" only holds the per-track verdicts.
+
+        With online=True detections go straight into a StationaryRunTracker as they are
+        propagated instead of being collected into per-frame tracks, so memory stays flat
+        however long the video is. Verdicts are those of analyze_violations (interpolation
+        never changes a stationary run); duplicates are merged by
+        StationaryRunTracker.vehicles(dedupe=True) and best frames are approximate.
+        Cannot be combined with return_tracks.
+
+        Videos longer than the predictor's chunk_sec (plus chunk_overlap_sec) are tracked
+        in chunks, each in its own session, so model memory is bounded by the chunk length
+        rather than the video's. Chunks overlap by chunk_overlap_sec and a chunk's tracks
+        continue the previous chunk's tracks whose boxes on the shared frames overlap by
+        CHUNK_STITCH_IOU on average, so track ids stay stable across chunks. Up to
+        chunk_workers chunks are tracked concurrently (sessions share the model). Combined
+        with online=True, memory stays flat end to end.
         """
+        if online and return_tracks:
+            raise ValueError("online analysis keeps no per-frame tracks to return")
+        frame_stride = max(1, int(frame_stride))
+        downscale = float(downscale)
+        if not 0 < downscale <= 1:
+            raise ValueError(f"downscale must be in (0, 1], got {downscale}")
+        if roi is not None and len(roi) < 3:
+            raise ValueError("roi must be a polygon with at least 3 points")
+
+        timings = {}
+        start = time.perf_counter()
         video_info = _get_video_info(video_path)
         if not video_info:
             return {"error": "无法读取视频文件"}
 
-        if self.use_mock:
-            tracks = self._mock_inference(video_info, progress_callback)
+        runs = StationaryRunTracker(video_info["fps"]) if online else None
+        observe = _roi_observer(runs, roi) if online else None
+        step = frame_stride if frame_stride > 1 or not self.use_mock else max(1, int(video_info["fps"]))
+        chunks = _chunk_ranges(video_info["total_frames"], video_info["fps"], step,
+                               self.chunk_sec, self.chunk_overlap_sec)
+        if len(chunks) > 1:
+            tracks = self._chunked_inference(video_path, video_info, chunks, progress_callback, timings,
+                                             step, downscale, roi, observe)
+        elif self.use_mock:
+            stage_start = time.perf_counter()
+            tracks = self._mock_inference(video_info, progress_callback, step)
+            if online:
+                for track in tracks:
+                    for frame in track["frames"]:
+                        observe(track["track_id"], track["class"], frame)
+                tracks = []
+            timings["inference"] = time.perf_counter() - stage_start
         else:
-            tracks = self._real_inference(video_path, video_info, progress_callback)
+            tracks = self._real_inference(video_path, video_info, progress_callback, timings,
+                                          frame_stride, downscale, roi, on_observation=observe)
+
+        if online:
+            stage_start = time.perf_counter()
+            vehicles = runs.vehicles(dedupe=True)
+            timings["violation_analysis"] = time.perf_counter() - stage_start
+            timings["total"] = time.perf_counter() - start
+            return self._result(video_info, vehicles, frame_stride, downscale, roi, timings)
+
+        stage_start = time.perf_counter()
+        if roi is not None:
+            tracks = filter_tracks_to_roi(tracks, roi)
+        tracks = dedupe_tracks(tracks)
+        max_gap = max(step, int(MAX_INTERP_GAP_SEC * video_info["fps"]))
+        for track in tracks:
+            track["frames"] = interpolate_track_frames(track["frames"], step, max_gap)
+        timings["postprocess"] = time.perf_counter() - stage_start
 
+        stage_start = time.perf_counter()
         vehicles = analyze_violations(tracks, video_info["fps"])
+        timings["violation_analysis"] = time.perf_counter() - stage_start
+        timings["total"] = time.perf_counter() - start
 
+        result = self._result(video_info, vehicles, frame_stride, downscale, roi, timings)
+        if return_tracks:
+            result["tracks"] = tracks_to_columns(tracks)
+        return result
+
+    def _result(self, video_info: dict, vehicles: list, frame_stride: int, downscale: float, roi,
+                timings: dict) -> dict:
         return {
             "fps": video_info["fps"],
             "total_frames": video_info["total_frames"],
@@ -132,79 +773,336 @@ class SAM3Predictor:
             "width": video_info["width"],
             "height": video_info["height"],
             "vehicles": vehicles,
+            "inference_options": {"frame_stride": frame_stride, "downscale": downscale, "roi": roi},
+            "predictor_config": self.config_fingerprint(frame_stride, downscale, roi),
+            "timings": {k: round(v, 4) for k, v in timings.items()},
         }
 
-    def _real_inference(self, video_path: str, video_info: dict, progress_callback=None) -> list:
-        """Run actual SAM 3 inference."""
+    def process_stream(self, source: str, window_sec: float = STREAM_WINDOW_SEC, frame_stride: int = 1,
+                       downscale: float = 1.0, roi=None, idle_timeout_sec: float = STREAM_IDLE_TIMEOUT_SEC,
+                       stop_event: threading.Event = None):
+        """
+        Incrementally analyse a live source; a generator of event dicts.
+        source is a stream URL (STREAM_URL_SCHEMES) or the path of a file that is still
+        being written, e.g. an MPEG-TS recording. Reading ends once no new frame has
+        arrived for idle_timeout_sec, or when stop_event is set.
+
+        Frames are buffered into windows of window_sec and each window is tracked on its
+        own (the mock engine simulates one scene for the whole stream). Track ids are
+        stitched across windows by box IoU, and StationaryRunTracker reports a
+        violation as soon as a vehicle has been stationary for VIOLATION_DURATION_SEC.
+        frame_stride / downscale / roi work as in process_video.
+
+        Events:
+          {"type": "stream_info", "fps", "width", "height"}
+          {"type": "window", "start_frame", "end_frame", "tracks", "inference_sec"}
+          {"type": "violation", ...StationaryRunTracker.update() event, "latency_sec"}: latency_sec runs from
+              reading the frame that completed the violation to emitting the event
+          {"type": "end", "frames", "violations", "duration_sec"}
+          {"type": "error", "error"} if the source cannot be opened
+        """
+        frame_stride = max(1, int(frame_stride))
+        downscale = float(downscale)
+        if not 0 < downscale <= 1:
+            raise ValueError(f"downscale must be in (0, 1], got {downscale}")
+        if roi is not None and len(roi) < 3:
+            raise ValueError("roi must be a polygon with at least 3 points")
+
+        cap = _open_stream(source, idle_timeout_sec)
+        if cap is None:
+            yield {"type": "error", "error": "无法打开视频流"}
+            return
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        fps = fps if fps and fps > 0 else 25.0
+        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        yield {"type": "stream_info", "fps": fps, "width": width, "height": height}
+
+        geometry = _work_geometry(width, height, downscale, roi)
+        window_frames = max(frame_stride, int(round(window_sec * fps)))
+        max_gap = max(frame_stride, int(MAX_INTERP_GAP_SEC * fps))
+        runs = StationaryRunTracker(fps)
+        stitcher = _TrackStitcher(max_gap)
+        scene = _mock_scene(width, height, self._mock_rng(fps, width, height), self.mock_vehicles) \
+            if self.use_mock else None
+
+        # (frame_index, time read, working frame); the mock engine needs no pixels
+        buffer = []
+        frame_idx = 0
+        violations = 0
+        try:
+            while stop_event is None or not stop_event.is_set():
+                if not cap.grab():
+                    break
+                if frame_idx % frame_stride == 0:
+                    frame = None
+                    if not self.use_mock:
+                        ok, raw = cap.retrieve()
+                        if not ok:
+                            break
+                        frame = _to_work_frame(raw, geometry)
+                    buffer.append((frame_idx, time.monotonic(), frame))
+                frame_idx += 1
+                end_of_window = buffer and frame_idx - buffer[0][0] >= window_frames
+                if not end_of_window:
+                    continue
+                for event in self._stream_window(buffer, fps, geometry, frame_stride, roi, scene,
+                                                 stitcher, runs):
+                    violations += event["type"] == "violation"
+                    yield event
+                runs.prune(buffer[0][0] - max_gap)
+                buffer = []
+            if buffer:
+                for event in self._stream_window(buffer, fps, geometry, frame_stride, roi, scene,
+                                                 stitcher, runs):
+                    violations += event["type"] == "violation"
+                    yield event
+        finally:
+            cap.release()
+        yield {"type": "end", "frames": frame_idx, "violations": violations,
+               "duration_sec": round(frame_idx / fps, 2)}
+
+    def _stream_window(self, buffer: list, fps: float, geometry: dict, frame_stride: int, roi, scene,
+                       stitcher: "_TrackStitcher", runs: "StationaryRunTracker"):
+        """Track one buffered window and feed its observations to the run tracker in frame order."""
+        stage_start = time.perf_counter()
+        if self.use_mock:
+            tracks = _mock_scene_tracks(scene, [fi for fi, _, _ in buffer], fps)
+        else:
+            fd, work_path = tempfile.mkstemp(suffix=".mp4")
+            os.close(fd)
+            try:
+                writer = cv2.VideoWriter(work_path, cv2.VideoWriter_fourcc(*"mp4v"),
+                                         max(1.0, fps / frame_stride), geometry["size"])
+                for _, _, frame in buffer:
+                    writer.write(frame)
+                writer.release()
+                mapping = _work_mapping(geometry, frame_stride, len(buffer), start_frame=buffer[0][0])
+                tracks = self._track_prompts(work_path, mapping, None, {})
+            finally:
+                os.unlink(work_path)
+        if roi is not None:
+            tracks = filter_tracks_to_roi(tracks, roi)
+        tracks = dedupe_tracks(tracks)
+        stitcher.assign(tracks)
+        yield {"type": "window", "start_frame": buffer[0][0], "end_frame": buffer[-1][0], "tracks": len(tracks),
+               "inference_sec": round(time.perf_counter() - stage_start, 4)}
+
+        read_at = {fi: t for fi, t, _ in buffer}
+        observations = sorted((f["frame_index"], t["track_id"], t["class"], f["bbox"], f.get("score", 0.0))
+                              for t in tracks for f in t["frames"])
+        for frame_index, track_id, vehicle_class, bbox, score in observations:
+            event = runs.update(track_id, vehicle_class, frame_index, bbox, score)
+            if event is not None:
+                latency = time.monotonic() - read_at.get(frame_index, read_at[buffer[-1][0]])
+                yield {"type": "violation", **event, "latency_sec": round(latency, 3)}
+
+    def _real_inference(self, video_path: str, video_info: dict, progress_callback=None,
+                        timings: dict = None, frame_stride: int = 1, downscale: float = 1.0,
+                        roi=None, on_observation=None, frames: tuple = None) -> list:
+        """
+        Run actual SAM 3 inference.
+        In single_pass mode every vehicle prompt is added to the session on frame 0 and
+        the video is propagated once; objects are classified by the prompt that first
+        produced them. per_prompt mode resets and propagates the session per prompt.
+        Stride/downscale/ROI are applied by tracking a reduced working clip; frame
+        indices and boxes are mapped back to the source video.
+        With on_observation(track_id, class, frame) every detection is passed on as it is
+        propagated and no tracks are collected (an empty list is returned).
+        frames=(start, end) tracks only that range of source frames (end exclusive).
+        """
+        timings = timings if timings is not None else {}
+        stage_start = time.perf_counter()
+        work_path, mapping = _prepare_video(video_path, video_info, frame_stride, downscale, roi, frames)
+        timings["prepare"] = time.perf_counter() - stage_start
+        try:
+            return self._track_prompts(work_path, mapping, progress_callback, timings, on_observation)
+        finally:
+            if work_path != video_path:
+                os.unlink(work_path)
+
+    def _track_prompts(self, work_path: str, mapping: dict, progress_callback, timings: dict,
+                       on_observation=None) -> list:
+        stage_start = time.perf_counter()
         response = self.model.handle_request(
-            request=dict(type="start_session", resource_path=video_path)
+            request=dict(type="start_session", resource_path=work_path)
         )
         session_id = response["session_id"]
+        timings["session_start"] = time.perf_counter() - stage_start
+        timings["prompting"] = 0.0
+        timings["propagation"] = 0.0
+
+        stride = mapping["stride"]
+        start_frame = mapping["start_frame"]
+        sx, sy = mapping["scale"]
+        x0, y0 = mapping["offset"]
+        to_source = np.array([1 / sx, 1 / sy, 1 / sx, 1 / sy])
+        offset = np.array([x0, y0, x0, y0], dtype=np.float64)
+
+        total_frames = max(1, mapping["total_frames"])
+        passes = [VEHICLE_PROMPTS] if self.prompt_mode == "single_pass" else [[p] for p in VEHICLE_PROMPTS]
+        total_steps = total_frames * len(passes)
 
         all_tracks = []
-        for prompt_text in VEHICLE_PROMPTS:
-            resp = self.model.handle_request(
-                request=dict(
-                    type="add_prompt",
-                    session_id=session_id,
-                    frame_index=0,
-                    text=prompt_text,
+        next_track_id = 1
+        for pass_pos, prompts in enumerate(passes):
+            done_before = pass_pos * total_frames
+            label = "+".join(prompts)
+            if progress_callback:
+                progress_callback(done_before, total_steps, label)
+
+            stage_start = time.perf_counter()
+            if pass_pos > 0:
+                self.model.handle_request(request=dict(type="reset_session", session_id=session_id))
+            obj_class = {}
+            for prompt_text in prompts:
+                resp = self.model.handle_request(
+                    request=dict(
+                        type="add_prompt",
+                        session_id=session_id,
+                        frame_index=0,
+                        text=prompt_text,
+                    )
                 )
-            )
-            outputs = resp.get("outputs", {})
-            for obj_id, obj_data in outputs.items():
-                track = {
-                    "track_id": len(all_tracks) + 1,
-                    "class": prompt_text,
-                    "frames": [],
-                }
-                for frame_idx, frame_data in obj_data.items():
+                for obj_id in resp.get("outputs", {}):
+                    obj_class.setdefault(obj_id, prompt_text)
+            timings["prompting"] += time.perf_counter() - stage_start
+
+            # obj_id -> list of frame dicts, filled as propagation streams frame outputs;
+            # track ids are numbered in order of first appearance
+            stage_start = time.perf_counter()
+            objects = {}
+            track_ids = {}
+            for frames_seen, frame_resp in enumerate(self.model.handle_stream_request(
+                request=dict(type="propagate_in_video", session_id=session_id)
+            ), start=1):
+                frame_idx = start_frame + int(frame_resp["frame_index"]) * stride
+                for obj_id, frame_data in frame_resp.get("outputs", {}).items():
                     if frame_data.get("boxes") is not None and len(frame_data["boxes"]) > 0:
-                        bbox = frame_data["boxes"][0].tolist()
-                        score = float(frame_data.get("scores", [0.9])[0])
-                        track["frames"].append({
-                            "frame_index": int(frame_idx),
-                            "bbox": bbox,
-                            "score": score,
-                        })
-                if track["frames"]:
-                    track["frames"].sort(key=lambda f: f["frame_index"])
-                    all_tracks.append(track)
+                        bbox = np.asarray(frame_data["boxes"][0], dtype=np.float64) * to_source + offset
+                        frame = {
+                            "frame_index": frame_idx,
+                            "bbox": bbox.tolist(),
+                            "score": float(frame_data.get("scores", [0.9])[0]),
+                        }
+                        track_id = track_ids.setdefault(obj_id, next_track_id + len(track_ids))
+                        if on_observation is not None:
+                            # Objects first seen after frame 0 have no prompt of their own
+                            on_observation(track_id, obj_class.get(obj_id, prompts[0]), frame)
+                        else:
+                            objects.setdefault(obj_id, []).append(frame)
+                if progress_callback:
+                    progress_callback(done_before + min(frames_seen, total_frames), total_steps, label)
+            timings["propagation"] += time.perf_counter() - stage_start
+            next_track_id += len(track_ids)
 
-            if progress_callback:
-                progress_callback(video_info["total_frames"], video_info["total_frames"])
+            for obj_id, frames in objects.items():
+                frames.sort(key=lambda f: f["frame_index"])
+                all_tracks.append({
+                    "track_id": track_ids[obj_id],
+                    "class": obj_class.get(obj_id, prompts[0]),
+                    "frames": frames,
+                })
+
+        self.model.handle_request(request=dict(type="close_session", session_id=session_id))
+        if progress_callback:
+            progress_callback(total_steps, total_steps, None)
 
         return all_tracks
 
-    def _mock_inference(self, video_info: dict, progress_callback=None) -> list:
-        """Generate realistic mock tracking data for development."""
+    def _chunked_inference(self, video_path: str, video_info: dict, chunks: list, progress_callback,
+                           timings: dict, step: int, downscale: float, roi, on_observation=None) -> list:
+        """
+        Track each (start, end) frame range of chunks in its own session (up to chunk_workers
+        at a time), then stitch the chunks' tracks in order. The mock engine slices one
+        simulated run into the same chunks. Frames tracked by two chunks are kept from the
+        earlier one. Returns the stitched tracks; with on_observation every detection is
+        passed on instead, in frame order per chunk, and an empty list is returned.
+        """
+        stage_start = time.perf_counter()
+        progress = _ChunkProgress(progress_callback, chunks, step, 1 if self.prompt_mode == "single_pass"
+                                  else len(VEHICLE_PROMPTS))
+        mock_tracks = self._mock_inference(video_info, None, step) if self.use_mock else None
+
+        def track_chunk(index: int) -> tuple:
+            chunk_timings = {}
+            if self.use_mock:
+                tracks = _slice_tracks(mock_tracks, *chunks[index])
+                progress(index, 1, 1, None)
+            else:
+                tracks = self._real_inference(video_path, video_info, lambda done, total, label: progress(
+                    index, done, total, label), chunk_timings, step, downscale, roi, frames=chunks[index])
+            if roi is not None:
+                tracks = filter_tracks_to_roi(tracks, roi)
+            return dedupe_tracks(tracks), chunk_timings
+
+        overlap = chunks[0][1] - chunks[1][0]
+        stitcher = _TrackStitcher(max(step, int(MAX_INTERP_GAP_SEC * video_info["fps"])), CHUNK_STITCH_IOU, overlap)
+        merged = {}
+        passed_until = {}
+        for tracks, chunk_timings in _ordered_map(track_chunk, len(chunks), self.chunk_workers):
+            for stage, elapsed in chunk_timings.items():
+                timings[stage] = timings.get(stage, 0.0) + elapsed
+            stitcher.assign(tracks)
+            for track in tracks:
+                track_id = track["track_id"]
+                kept = merged.get(track_id) if on_observation is None else None
+                last = kept["frames"][-1]["frame_index"] if kept else passed_until.get(track_id, -1)
+                new_frames = [f for f in track["frames"] if f["frame_index"] > last]
+                if on_observation is not None:
+                    track["frames"] = new_frames
+                    if new_frames:
+                        passed_until[track_id] = new_frames[-1]["frame_index"]
+                elif kept is None:
+                    merged[track_id] = track
+                else:
+                    kept["frames"].extend(new_frames)
+            if on_observation is not None:
+                observations = sorted((((f["frame_index"], t["track_id"]), t["class"], f)
+                                       for t in tracks for f in t["frames"]), key=lambda o: o[0])
+                for (_, track_id), vehicle_class, frame in observations:
+                    on_observation(track_id, vehicle_class, frame)
+        timings["inference"] = time.perf_counter() - stage_start
+        progress.finish()
+        return [merged[track_id] for track_id in sorted(merged)]
+
+    def _mock_rng(self, *key):
+        """Random source of the mock engine: the random module, or one seeded by mock_seed and key."""
+        return random if self.mock_seed is None else random.Random(repr((self.mock_seed, *key)))
+
+    def _mock_inference(self, video_info: dict, progress_callback=None, sample_interval: int = None) -> list:
+        """Generate realistic mock tracking data for development (one sample per second by default)."""
         fps = video_info["fps"]
         total_frames = video_info["total_frames"]
         w, h = video_info["width"], video_info["height"]
+        rng = self._mock_rng(fps, total_frames, w, h)
 
-        num_vehicles = random.randint(2, 4)
+        num_vehicles = rng.randint(*self.mock_vehicles)
+        total_steps = max(1, total_frames) * num_vehicles
         tracks = []
 
         for i in range(num_vehicles):
             track_id = i + 1
             is_stationary = i == 0  # First vehicle is always a violator for testing
+            vehicle_class = rng.choice(VEHICLE_PROMPTS)
+            done_before = i * max(1, total_frames)
 
-            base_x = random.randint(int(w * 0.2), int(w * 0.7))
-            base_y = random.randint(int(h * 0.3), int(h * 0.7))
-            vw = random.randint(80, 160)
-            vh = random.randint(60, 120)
+            base_x = rng.randint(int(w * 0.2), int(w * 0.7))
+            base_y = rng.randint(int(h * 0.3), int(h * 0.7))
+            vw = rng.randint(80, 160)
+            vh = rng.randint(60, 120)
 
             frames = []
-            sample_interval = max(1, int(fps))  # Sample once per second
+            sample_interval = sample_interval or max(1, int(fps))
 
             for frame_idx in range(0, total_frames, sample_interval):
                 if is_stationary:
-                    jitter_x = random.uniform(-2, 2)
-                    jitter_y = random.uniform(-2, 2)
+                    jitter_x = rng.uniform(-2, 2)
+                    jitter_y = rng.uniform(-2, 2)
                 else:
                     elapsed = frame_idx / fps
-                    jitter_x = elapsed * random.uniform(15, 30)
-                    jitter_y = random.uniform(-3, 3)
+                    jitter_x = elapsed * rng.uniform(15, 30)
+                    jitter_y = rng.uniform(-3, 3)
 
                 bbox = [
                     base_x + jitter_x,
@@ -215,24 +1113,308 @@ class SAM3Predictor:
                 frames.append({
                     "frame_index": frame_idx,
                     "bbox": [round(v, 1) for v in bbox],
-                    "score": round(random.uniform(0.85, 0.98), 3),
+                    "score": round(rng.uniform(0.85, 0.98), 3),
                 })
 
-                if progress_callback and frame_idx % (sample_interval * 5) == 0:
-                    progress_callback(frame_idx, total_frames)
+                if progress_callback:
+                    progress_callback(done_before + frame_idx, total_steps, vehicle_class)
 
             tracks.append({
                 "track_id": track_id,
-                "class": random.choice(VEHICLE_PROMPTS),
+                "class": vehicle_class,
                 "frames": frames,
             })
 
         if progress_callback:
-            progress_callback(total_frames, total_frames)
+            progress_callback(total_steps, total_steps, None)
 
         return tracks
 
 
+def _chunk_ranges(total_frames: int, fps: float, step: int, chunk_sec: float, overlap_sec: float) -> list:
+    """
+    (start, end) source frame ranges, end exclusive, of chunk_sec each plus overlap_sec
+    shared with the next chunk; both are rounded to whole steps so every chunk starts on
+    the stride grid. A single range when chunk_sec is 0 or the video is short enough.
+    """
+    if chunk_sec <= 0:
+        return [(0, total_frames)]
+    length = max(step, int(round(chunk_sec * fps)) // step * step)
+    overlap = max(step, -(-int(round(overlap_sec * fps)) // step) * step)
+    ranges = [(0, min(total_frames, length + overlap))]
+    while ranges[-1][1] < total_frames:
+        start = ranges[-1][0] + length
+        ranges.append((start, min(total_frames, start + length + overlap)))
+    return ranges
+
+
+def _slice_tracks(tracks: list, start: int, end: int) -> list:
+    """The parts of tracks within [start, end), numbered as a separate session would number them."""
+    sliced = []
+    for track in tracks:
+        frames = [f for f in track["frames"] if start <= f["frame_index"] < end]
+        if frames:
+            sliced.append({"track_id": len(sliced) + 1, "class": track["class"], "frames": frames})
+    return sliced
+
+
+def _ordered_map(fn, count: int, workers: int):
+    """Yield fn(0) .. fn(count - 1) in order, computing up to workers of them at a time."""
+    if workers <= 1:
+        for index in range(count):
+            yield fn(index)
+        return
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for index in range(count):
+            pending.append(executor.submit(fn, index))
+            if len(pending) >= workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+class _ChunkProgress:
+    """
+    Combines the progress_callback calls of concurrently tracked chunks into one
+    monotonic progress over the whole video, each chunk weighted by its frame-steps.
+    """
+
+    def __init__(self, progress_callback, chunks: list, step: int, passes: int):
+        self.progress_callback = progress_callback
+        self.weights = [-(-(end - start) // step) * passes for start, end in chunks]
+        self.total = sum(self.weights)
+        self.done = [0.0] * len(chunks)
+        self._lock = threading.Lock()
+
+    def __call__(self, index: int, done: int, total: int, label):
+        if self.progress_callback is None:
+            return
+        with self._lock:
+            self.done[index] = self.weights[index] * min(1.0, done / max(1, total))
+            processed = int(sum(self.done))
+            # A chunk's final call has no label; the whole video is not finished then
+            if processed < self.total:
+                self.progress_callback(processed, self.total, label)
+
+    def finish(self):
+        if self.progress_callback is not None:
+            self.progress_callback(self.total, self.total, None)
+
+
+def _roi_observer(runs: StationaryRunTracker, roi):
+    """on_observation callback feeding detections whose bbox center lies inside roi (if any) to runs."""
+    polygon = np.asarray(roi, dtype=np.float64) if roi is not None else None
+
+    def observe(track_id: int, vehicle_class: str, frame: dict):
+        if polygon is not None and not points_in_polygon(np.array([_bbox_center(frame["bbox"])]), polygon)[0]:
+            return
+        runs.update(track_id, vehicle_class, frame["frame_index"], frame["bbox"], frame.get("score", 0.0))
+
+    return observe
+
+
+def _mock_scene(width: int, height: int, rng=random, count: tuple = (2, 4)) -> list:
+    """Vehicles of a simulated stream: the first one parked, the others driving across at constant speed."""
+    vehicles = []
+    for i in range(rng.randint(*count)):
+        vehicles.append({
+            "class": rng.choice(VEHICLE_PROMPTS),
+            "x": rng.randint(int(width * 0.2), int(width * 0.7)),
+            "y": rng.randint(int(height * 0.3), int(height * 0.7)),
+            "w": rng.randint(80, 160),
+            "h": rng.randint(60, 120),
+            "speed": 0.0 if i == 0 else rng.uniform(15, 30),
+        })
+    return vehicles
+
+
+def _mock_scene_tracks(scene: list, frame_indices: list, fps: float) -> list:
+    tracks = []
+    for i, v in enumerate(scene):
+        frames = []
+        for fi in frame_indices:
+            x = v["x"] + v["speed"] * fi / fps
+            frames.append({
+                "frame_index": fi,
+                "bbox": [round(x, 1), float(v["y"]), round(x + v["w"], 1), float(v["y"] + v["h"])],
+                "score": 0.9,
+            })
+        tracks.append({"track_id": i + 1, "class": v["class"], "frames": frames})
+    return tracks
+
+
+def is_stream_url(source: str) -> bool:
+    return source.lower().startswith(STREAM_URL_SCHEMES)
+
+
+def _open_stream(source: str, idle_timeout_sec: float, retry_sec: float = 0.5):
+    """
+    Open a stream URL, or a file that is still being written (see _open_growing_file).
+    Opening and each read block for at most idle_timeout_sec; the timeouts are passed
+    as open parameters of this capture only, so other captures in the process keep
+    their defaults. The source may not be up yet, so opening is retried for
+    idle_timeout_sec. Returns None on failure.
+    """
+    if not is_stream_url(source):
+        return _open_growing_file(source, idle_timeout_sec)
+    timeout_ms = int(idle_timeout_sec * 1000)
+    params = [cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, timeout_ms, cv2.CAP_PROP_READ_TIMEOUT_MSEC, timeout_ms]
+    deadline = time.monotonic() + idle_timeout_sec
+    while True:
+        cap = cv2.VideoCapture(source, cv2.CAP_FFMPEG, params)
+        if cap.isOpened():
+            return cap
+        cap.release()
+        if time.monotonic() >= deadline:
+            return None
+        time.sleep(retry_sec)
+
+
+def _follow_file(path: str, fifo: str, idle_timeout_sec: float):
+    """
+    Copy path into fifo like tail -f: keep reading past the current end of the file, and
+    close the FIFO (end of stream for the reader) once no new data has arrived for
+    idle_timeout_sec, including while waiting for the file to appear.
+    """
+    src = None
+    try:
+        with open(fifo, "wb", buffering=0) as out:
+            idle_since = time.monotonic()
+            while True:
+                if src is None and os.path.exists(path):
+                    src = open(path, "rb", buffering=0)
+                chunk = src.read(FOLLOW_CHUNK_BYTES) if src is not None else b""
+                if chunk:
+                    out.write(chunk)
+                    idle_since = time.monotonic()
+                elif time.monotonic() - idle_since >= idle_timeout_sec:
+                    return
+                else:
+                    time.sleep(FOLLOW_POLL_SEC)
+    except (BrokenPipeError, FileNotFoundError):
+        # The capture was released, or never opened the FIFO
+        pass
+    finally:
+        if src is not None:
+            src.close()
+
+
+def _open_growing_file(path: str, idle_timeout_sec: float):
+    """
+    Open a recording that may still be growing. OpenCV stops at the first end of file it
+    sees, so the file is fed to the capture through a FIFO by a _follow_file thread; reads
+    block until more data is written and the stream ends after idle_timeout_sec without
+    growth. Without FIFOs (Windows) the file is read as it is. Returns None on failure.
+    """
+    if not hasattr(os, "mkfifo"):
+        cap = cv2.VideoCapture(path, cv2.CAP_FFMPEG)
+        if cap.isOpened():
+            return cap
+        cap.release()
+        return None
+
+    tmp_dir = tempfile.mkdtemp(prefix="sam3_follow_")
+    fifo = os.path.join(tmp_dir, "stream")
+    os.mkfifo(fifo)
+    threading.Thread(target=_follow_file, args=(path, fifo, idle_timeout_sec), daemon=True).start()
+    try:
+        cap = cv2.VideoCapture(fifo, cv2.CAP_FFMPEG)
+    finally:
+        # The follower's open() waits for a reader; if the capture never opened the FIFO,
+        # release it so the follower fails on its first write instead of blocking forever
+        os.close(os.open(fifo, os.O_RDONLY | os.O_NONBLOCK))
+        os.unlink(fifo)
+        os.rmdir(tmp_dir)
+    if cap.isOpened():
+        return cap
+    cap.release()
+    return None
+
+
+def _work_geometry(width: int, height: int, downscale: float, roi) -> dict:
+    """
+    Crop box, ROI mask and output size of the working clip for a source of the given
+    size: the ROI's bounding box (or the whole frame), scaled by downscale.
+    """
+    x0, y0, x1, y1 = 0, 0, width, height
+    mask = None
+    if roi is not None:
+        polygon = np.round(np.asarray(roi, dtype=np.float64)).astype(np.int32)
+        x0, y0 = max(0, int(polygon[:, 0].min())), max(0, int(polygon[:, 1].min()))
+        x1, y1 = min(width, int(polygon[:, 0].max()) + 1), min(height, int(polygon[:, 1].max()) + 1)
+        mask = np.zeros((y1 - y0, x1 - x0), dtype=np.uint8)
+        cv2.fillPoly(mask, [polygon - np.array([x0, y0], dtype=np.int32)], 255)
+    out_w = max(2, int(round((x1 - x0) * downscale)))
+    out_h = max(2, int(round((y1 - y0) * downscale)))
+    return {"crop": (x0, y0, x1, y1), "mask": mask, "size": (out_w, out_h)}
+
+
+def _to_work_frame(frame: np.ndarray, geometry: dict) -> np.ndarray:
+    x0, y0, x1, y1 = geometry["crop"]
+    frame = frame[y0:y1, x0:x1]
+    if geometry["mask"] is not None:
+        frame = cv2.bitwise_and(frame, frame, mask=geometry["mask"])
+    if geometry["size"] != (x1 - x0, y1 - y0):
+        frame = cv2.resize(frame, geometry["size"], interpolation=cv2.INTER_AREA)
+    return frame
+
+
+def _work_mapping(geometry: dict, frame_stride: int, total_frames: int, start_frame: int = 0) -> dict:
+    """Converts working-clip frame indices and boxes back to the source (see _track_prompts)."""
+    x0, y0, x1, y1 = geometry["crop"]
+    out_w, out_h = geometry["size"]
+    return {"stride": frame_stride, "scale": (out_w / (x1 - x0), out_h / (y1 - y0)), "offset": (x0, y0),
+            "total_frames": total_frames, "start_frame": start_frame}
+
+
+def _prepare_video(video_path: str, video_info: dict, frame_stride: int, downscale: float, roi,
+                   frames: tuple = None) -> tuple:
+    """
+    Write the reduced clip SAM 3 should track: every frame_stride-th frame, cropped
+    to the ROI bounding box with pixels outside the polygon blacked out, then resized
+    by downscale. frames=(start, end) limits the clip to that range of source frames.
+    Returns (path, mapping) where mapping converts results back to source coordinates;
+    the source path is returned untouched when nothing changes.
+    """
+    geometry = _work_geometry(video_info["width"], video_info["height"], downscale, roi)
+    start_frame, end_frame = frames if frames is not None else (0, video_info["total_frames"])
+    if frame_stride == 1 and downscale == 1 and roi is None and frames is None:
+        return video_path, _work_mapping(geometry, frame_stride, video_info["total_frames"])
+
+    fd, out_path = tempfile.mkstemp(suffix=".mp4")
+    os.close(fd)
+    out_fps = max(1.0, video_info["fps"] / frame_stride)
+    writer = cv2.VideoWriter(out_path, cv2.VideoWriter_fourcc(*"mp4v"), out_fps, geometry["size"])
+    cap = cv2.VideoCapture(video_path)
+    if start_frame:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+    written = 0
+    frame_idx = start_frame
+    try:
+        # grab() skips decoding-to-BGR for frames the stride drops
+        while frame_idx < end_frame and cap.grab():
+            if (frame_idx - start_frame) % frame_stride == 0:
+                ok, frame = cap.retrieve()
+                if not ok:
+                    break
+                writer.write(_to_work_frame(frame, geometry))
+                written += 1
+            frame_idx += 1
+    finally:
+        cap.release()
+        writer.release()
+    return out_path, _work_mapping(geometry, frame_stride, written, start_frame)
+
+
+def _package_version(name: str) -> str:
+    try:
+        from importlib.metadata import version
+        return version(name)
+    except Exception:
+        return "unknown"
+
+
 def _get_video_info(video_path: str) -> dict | None:
     if not os.path.exists(video_path):
         return None
@@ -0,0 +1,132 @@
+"""
+SSE 编码层
+所有流式接口共用：
+- dumps：已安装 orjson 时使用 orjson，否则回退到标准库 json（紧凑分隔符，不转义中文）
+- sse_event：把一个事件对象编码为一条 "data: ...\n\n" 消息
+- SSEEnvelope：每个流只编码一次固定的外层结构（如 output/choices/message/content 包装），
+  每个 token 只需编码文本本身再拼接前后缀
+- coalesce：把细碎的 token 片段按大小/时间阈值合并后再发送，减少消息条数
+"""
+
+import json
+import queue
+import threading
+import time
+
+try:
+    import orjson
+except ImportError:  # orjson 为可选依赖
+    orjson = None
+
+
+# token 合并阈值：累计字符数达到该值，或距上次发送超过该时间即发送一次
+COALESCE_MAX_CHARS = 64
+COALESCE_MAX_DELAY_SEC = 0.05
+
+_ORJSON_OPTIONS = (orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY) if orjson is not None else 0
+
+
+def dumps(obj) -> str:
+    if orjson is not None:
+        return orjson.dumps(obj, option=_ORJSON_OPTIONS).decode("utf-8")
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+
+def sse_event(obj) -> str:
+    return f"data: {dumps(obj)}\n\n"
+
+
+class SSEEnvelope:
+    """
+    预编码的 SSE 消息外壳。build(value) 返回完整事件对象，其中 value 只出现一次；
+    构造时用占位值编码一次并拆成前后缀，之后 encode(value) 只需编码 value 本身。
+    """
+
+    _PLACEHOLDER = "\x00sse-envelope-value\x00"
+
+    def __init__(self, build):
+        encoded = sse_event(build(self._PLACEHOLDER))
+        self.prefix, self.suffix = encoded.split(dumps(self._PLACEHOLDER))
+
+    def encode(self, value) -> str:
+        return f"{self.prefix}{dumps(value)}{self.suffix}"
+
+
+def text_envelope(**extra) -> SSEEnvelope:
+    """前端通用的文本消息格式：{"output": {"choices": [{"message": {"content": [{"text": ...}]}}]}}"""
+    return SSEEnvelope(lambda text: {
+        "output": {"choices": [{"message": {"content": [{"text": text}]}}]},
+        **extra,
+    })
+
+
+class _UpstreamError:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+_END = object()
+
+
+def _drain(chunks, out: queue.Queue, stop: threading.Event):
+    """读取线程：把上游片段放入队列；消费方停止后不再读取并关闭上游（如释放模型连接）。"""
+    try:
+        for chunk in chunks:
+            if stop.is_set():
+                break
+            if chunk:
+                out.put(chunk)
+    except BaseException as e:
+        out.put(_UpstreamError(e))
+    finally:
+        close = getattr(chunks, "close", None)
+        if close is not None:
+            close()
+        out.put(_END)
+
+
+def coalesce(chunks, max_chars: int = COALESCE_MAX_CHARS, max_delay: float = COALESCE_MAX_DELAY_SEC):
+    """
+    合并细碎的文本片段：缓冲累计达到 max_chars 个字符时立即输出；否则缓冲中最早的片段等待满 max_delay 秒
+    时输出（即使上游此时没有新片段，如模型停顿），结束时输出剩余内容。第一个片段立即输出，保证首字延迟不变。
+    上游在单独的读取线程中迭代，上游抛出的异常在输出已缓冲内容后原样抛出。
+    """
+    pending = queue.Queue()
+    stop = threading.Event()
+    threading.Thread(target=_drain, args=(iter(chunks), pending, stop), name="sse-coalesce", daemon=True).start()
+
+    buffer = []
+    size = 0
+    deadline = None
+    first = True
+    try:
+        while True:
+            try:
+                item = pending.get(timeout=None if deadline is None else max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                # 时间阈值到期：输出缓冲内容
+                yield "".join(buffer)
+                buffer.clear()
+                size = 0
+                deadline = None
+                continue
+            if item is _END:
+                break
+            if isinstance(item, _UpstreamError):
+                if buffer:
+                    yield "".join(buffer)
+                raise item.error
+            buffer.append(item)
+            size += len(item)
+            if first or size >= max_chars:
+                yield "".join(buffer)
+                buffer.clear()
+                size = 0
+                deadline = None
+                first = False
+            elif deadline is None:
+                deadline = time.monotonic() + max_delay
+        if buffer:
+            yield "".join(buffer)
+    finally:
+        stop.set()
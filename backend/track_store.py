@@ -0,0 +1,214 @@
+"""
+SAM 3 逐帧轨迹存储
+每个视频的真实轨迹以列式（struct-of-arrays）NumPy .npz 保存在 {video}_sam3.json 旁边：
+track_id / frame_index / bbox / score / interpolated 每列一个数组，按 frame_index 排序，
+按帧区间读取标注切片时只需二分查找，无需重新推理，也不再伪造轨迹数据。
+
+标注输出有两种格式：
+- frame_annotations：每帧一个完整对象（frame_annotation 事件 / 接口默认格式）
+- annotation_batches：按帧窗口分批、bbox 差分编码的紧凑格式（frame_annotation_batch 事件）
+"""
+
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+TRACK_COLUMNS = {
+    "track_id": np.int32,
+    "frame_index": np.int32,
+    "bbox": np.float32,
+    "score": np.float32,
+    "interpolated": bool,
+}
+# 内存中缓存的轨迹文件数
+MAX_CACHED_TRACK_FILES = 8
+# 差分编码的坐标量化倍数（10 即 0.1 像素精度），置信度以千分之一取整
+ANNOTATION_QUANT = 10
+# 每个批次覆盖的源视频帧数
+ANNOTATION_WINDOW_FRAMES = 300
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def tracks_path(upload_folder: str, video_name: str) -> str:
+    return os.path.join(upload_folder, f"{video_name}_tracks.npz")
+
+
+def save_tracks(path: str, columns: dict):
+    """
+    保存轨迹列（numpy 数组或远程服务返回的 JSON 列表均可），先写临时文件再原子替换。
+    """
+    n = len(columns["frame_index"])
+    arrays = {
+        name: np.asarray(columns.get(name, []), dtype=dtype)
+        for name, dtype in TRACK_COLUMNS.items()
+    }
+    arrays["bbox"] = arrays["bbox"].reshape(n, 4)
+    if len(arrays["interpolated"]) != n:
+        arrays["interpolated"] = np.zeros(n, dtype=bool)
+    # 远程服务或旧数据未必有序，这里统一按 (frame_index, track_id) 排序
+    order = np.lexsort((arrays["track_id"], arrays["frame_index"]))
+    arrays = {name: column[order] for name, column in arrays.items()}
+
+    # 临时文件名按线程区分：同一视频的并发请求各写各的，最后一次替换生效
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez_compressed(f, **arrays)
+    os.replace(tmp_path, path)
+    with _cache_lock:
+        _cache.pop(path, None)
+
+
+def load_tracks(path: str) -> dict | None:
+    """读取整段轨迹列；按 (mtime, size) 校验后缓存最近使用的文件。文件不存在时返回 None。"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    signature = (st.st_mtime_ns, st.st_size)
+
+    with _cache_lock:
+        entry = _cache.get(path)
+        if entry is not None and entry[0] == signature:
+            _cache.move_to_end(path)
+            return entry[1]
+
+    with np.load(path) as data:
+        columns = {name: data[name] for name in TRACK_COLUMNS}
+
+    with _cache_lock:
+        _cache[path] = (signature, columns)
+        _cache.move_to_end(path)
+        while len(_cache) > MAX_CACHED_TRACK_FILES:
+            _cache.popitem(last=False)
+    return columns
+
+
+def slice_frames(columns: dict, start: int = 0, end: int = None) -> dict:
+    """返回 start <= frame_index < end 的行（数组视图，不复制）。"""
+    frame_index = columns["frame_index"]
+    lo = int(np.searchsorted(frame_index, start, side="left"))
+    hi = len(frame_index) if end is None else int(np.searchsorted(frame_index, end, side="left"))
+    return {name: column[lo:hi] for name, column in columns.items()}
+
+
+def group_by_frame(columns: dict):
+    """按帧遍历切片，依次产出 (frame_index, 行下标区间 slice)。"""
+    frame_index = columns["frame_index"]
+    if len(frame_index) == 0:
+        return
+    bounds = np.flatnonzero(np.diff(frame_index)) + 1
+    starts = np.concatenate(([0], bounds))
+    ends = np.concatenate((bounds, [len(frame_index)]))
+    for lo, hi in zip(starts.tolist(), ends.tolist()):
+        yield int(frame_index[lo]), slice(lo, hi)
+
+
+def sample_frames(columns: dict, step: int) -> dict:
+    """每 step 帧分为一桶，每桶只保留最早一帧的所有车辆框，用于按客户端指定的采样率降采样。"""
+    frame_index = columns["frame_index"]
+    if step <= 1 or len(frame_index) == 0:
+        return columns
+    bucket = frame_index // step
+    new_bucket = np.concatenate(([True], bucket[1:] != bucket[:-1]))
+    first_frame = frame_index[new_bucket][np.cumsum(new_bucket) - 1]
+    keep = frame_index == first_frame
+    return {name: column[keep] for name, column in columns.items()}
+
+
+def delta_encode(columns: dict) -> list:
+    """
+    把切片中的每一行编码为整数数组 [track_id, x1, y1, x2, y2, conf]：坐标乘以 ANNOTATION_QUANT
+    取整，置信度以千分之一取整。同一轨迹在切片内第二次及以后出现时，坐标为相对其上一次出现的差值，
+    首次出现为绝对值，因此每个切片都可以独立解码。行顺序与输入一致。
+    """
+    track_id = columns["track_id"].astype(np.int64)
+    quantized = np.rint(columns["bbox"].astype(np.float64) * ANNOTATION_QUANT).astype(np.int64)
+    # 按 (track_id, frame_index) 排序后，相邻且属于同一轨迹的行做差
+    order = np.lexsort((columns["frame_index"], track_id))
+    by_track = quantized[order]
+    same_track = np.concatenate(([False], track_id[order][1:] == track_id[order][:-1]))
+    deltas = by_track.copy()
+    deltas[same_track] = by_track[same_track] - by_track[np.flatnonzero(same_track) - 1]
+    encoded = np.empty_like(quantized)
+    encoded[order] = deltas
+    confidence = np.rint(columns["score"].astype(np.float64) * 1000).astype(np.int64)
+    return np.column_stack((track_id, encoded, confidence)).tolist()
+
+
+def _track_labels(vehicles: list) -> dict:
+    return {
+        v["track_id"]: {"label": f"车辆 #{v['track_id']} ({v.get('class', '未知')})",
+                        "is_violation": v.get("is_violation", False)}
+        for v in vehicles
+    }
+
+
+def frame_annotations(columns: dict, vehicles: list, fps: float):
+    """把轨迹切片转换为逐帧标注（同一帧的所有车辆框合并在一条中）"""
+    labels = _track_labels(vehicles)
+    track_ids = columns["track_id"].tolist()
+    bboxes = np.round(columns["bbox"].astype(np.float64), 1).tolist()
+    scores = np.round(columns["score"].astype(np.float64), 3).tolist()
+
+    for frame_index, rows in group_by_frame(columns):
+        boxes = []
+        for i in range(rows.start, rows.stop):
+            track_id = track_ids[i]
+            meta = labels.get(track_id, {"label": f"车辆 #{track_id}", "is_violation": False})
+            boxes.append({
+                "track_id": track_id,
+                "bbox": bboxes[i],
+                "label": meta["label"],
+                "is_violation": meta["is_violation"],
+                "confidence": scores[i],
+            })
+        yield {
+            "frame_index": frame_index,
+            "timestamp_sec": round(frame_index / fps, 2) if fps else 0,
+            "fps": fps,
+            "boxes": boxes,
+        }
+
+
+def annotation_batches(columns: dict, vehicles: list, fps: float, start: int = 0, end: int = None,
+                       step: int = 1, window: int = ANNOTATION_WINDOW_FRAMES):
+    """
+    按 window 帧一批产出紧凑标注：
+      {"fps", "start", "end", "quant",
+       "tracks": {track_id: {"label", "is_violation"}},   # 仅包含本流中首次出现的轨迹
+       "frames": [[frame_index, [[track_id, x1, y1, x2, y2, conf], ...]], ...]}
+    坐标编码见 delta_encode；step > 1 时按 step 帧降采样。
+    """
+    labels = _track_labels(vehicles)
+    sent_tracks = set()
+    columns = sample_frames(slice_frames(columns, start, end), step)
+    frame_index = columns["frame_index"]
+    if len(frame_index) == 0:
+        return
+    window = max(1, window)
+    last = int(frame_index[-1]) + 1 if end is None else end
+
+    for window_start in range(max(start, int(frame_index[0]) // window * window), last, window):
+        window_end = min(window_start + window, last)
+        batch = slice_frames(columns, window_start, window_end)
+        if len(batch["frame_index"]) == 0:
+            continue
+        rows = delta_encode(batch)
+        new_tracks = {}
+        for track_id in np.unique(batch["track_id"]).tolist():
+            if track_id not in sent_tracks:
+                sent_tracks.add(track_id)
+                new_tracks[track_id] = labels.get(track_id, {"label": f"车辆 #{track_id}", "is_violation": False})
+        yield {
+            "fps": fps,
+            "start": window_start,
+            "end": window_end,
+            "quant": ANNOTATION_QUANT,
+            "tracks": new_tracks,
+            "frames": [[fi, rows[r.start:r.stop]] for fi, r in group_by_frame(batch)],
+        }
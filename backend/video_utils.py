@@ -1,15 +1,460 @@
 import cv2
 import numpy as np
 import base64
+import bisect
+import hashlib
 import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
 
+from metrics import VIDEO_DECODE_SECONDS, VIDEO_PROBE_SECONDS
 
-def extract_frame(video_path: str, frame_index: int) -> np.ndarray | None:
-    cap = cv2.VideoCapture(video_path)
-    cap.set(cv2.CAP_PROP_POS_FRAMES, frame_index)
-    ret, frame = cap.read()
-    cap.release()
-    return frame if ret else None
+
+# Keep a few decoders open so repeated lookups on the same video skip the container open
+MAX_OPEN_DECODERS = 4
+# Without keyframe positions, forward gaps up to this many frames are walked with grab(); larger gaps seek
+SEEK_GAP_FRAMES = 250
+# cv2's FFmpeg seek to frame N restarts decoding at the last keyframe <= N - SEEK_BACKOFF_FRAMES
+# and decodes forward to N; the seek itself costs about SEEK_OVERHEAD_FRAMES decoded frames
+SEEK_BACKOFF_FRAMES = 16
+SEEK_OVERHEAD_FRAMES = 4
+# Default byte budget of the process-wide decoded frame cache
+FRAME_CACHE_MAX_BYTES = 256 * 1024 * 1024
+# Keyframe lists remembered per (video, mtime, size)
+MAX_KEYFRAME_MEMO = 64
+
+# Limited-range (16-235) luma -> full-range gray, so the native Y plane matches cvtColor(BGR2GRAY)
+_LIMITED_TO_FULL = np.clip(np.round((np.arange(256) - 16) * 255 / 219), 0, 255).astype(np.uint8)
+
+
+def _file_signature(video_path: str) -> tuple | None:
+    try:
+        st = os.stat(video_path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+class FrameCache:
+    """
+    Process-wide LRU cache of decoded frames keyed by (video, frame_index, variant), bounded in bytes.
+    variant is None for full-resolution BGR frames, otherwise the decode options (see _decode_variant).
+    Entries remember the file's (mtime, size); a changed file drops all of its frames.
+    Cached frames are read-only and shared between callers.
+    """
+
+    def __init__(self, max_bytes: int = FRAME_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._signatures = {}
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def configure(self, max_bytes: int):
+        with self._lock:
+            self.max_bytes = max(0, int(max_bytes))
+            self._evict()
+
+    def _evict(self):
+        while self._entries and self.current_bytes > self.max_bytes:
+            _, frame = self._entries.popitem(last=False)
+            self.current_bytes -= frame.nbytes
+            self.evictions += 1
+
+    def _drop_video(self, key: str):
+        for entry_key in [k for k in self._entries if k[0] == key]:
+            self.current_bytes -= self._entries.pop(entry_key).nbytes
+        self._signatures.pop(key, None)
+
+    def _check_signature(self, key: str, signature: tuple):
+        if self._signatures.get(key) != signature:
+            self._drop_video(key)
+            self._signatures[key] = signature
+
+    def get_many(self, video_path: str, frame_indices, variant: tuple = None) -> dict:
+        key = os.path.abspath(video_path)
+        signature = _file_signature(key)
+        found = {}
+        with self._lock:
+            self._check_signature(key, signature)
+            for fi in frame_indices:
+                frame = self._entries.get((key, fi, variant))
+                if frame is None:
+                    self.misses += 1
+                    continue
+                self._entries.move_to_end((key, fi, variant))
+                self.hits += 1
+                found[fi] = frame
+        return found
+
+    def put_many(self, video_path: str, frames: dict, variant: tuple = None):
+        key = os.path.abspath(video_path)
+        signature = _file_signature(key)
+        with self._lock:
+            self._check_signature(key, signature)
+            for fi, frame in frames.items():
+                if frame.nbytes > self.max_bytes:
+                    continue
+                frame.flags.writeable = False
+                old = self._entries.pop((key, fi, variant), None)
+                if old is not None:
+                    self.current_bytes -= old.nbytes
+                self._entries[(key, fi, variant)] = frame
+                self.current_bytes += frame.nbytes
+            self._evict()
+
+    def invalidate(self, video_path: str = None):
+        with self._lock:
+            if video_path is None:
+                self._entries.clear()
+                self._signatures.clear()
+                self.current_bytes = 0
+            else:
+                self._drop_video(os.path.abspath(video_path))
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "videos": len(self._signatures),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+frame_cache = FrameCache()
+
+
+@contextmanager
+def _quiet_opencv():
+    """Silence OpenCV's per-frame warnings while reading raw (non-BGR) frames."""
+    level = cv2.utils.logging.getLogLevel()
+    cv2.utils.logging.setLogLevel(cv2.utils.logging.LOG_LEVEL_ERROR)
+    try:
+        yield
+    finally:
+        cv2.utils.logging.setLogLevel(level)
+
+
+class _SequentialDecoder:
+    """
+    A cv2.VideoCapture that tracks its position and reads sorted frame batches forward.
+    With grayscale=True it asks FFmpeg for the decoder's native frames and keeps only the Y plane,
+    skipping the YUV -> BGR conversion; streams where that is unavailable fall back to cvtColor.
+    """
+
+    def __init__(self, video_path: str, grayscale: bool = False):
+        self.video_path = video_path
+        self.grayscale = grayscale
+        self.lock = threading.Lock()
+        self.cap = None
+        self.pos = 0
+        # None until probed on open; True when cap.read() returns the Y plane directly
+        self.native_gray = None
+        # Keyframe positions, listed on the first backward seek: a demux pass over the whole file
+        # only pays off for random access, so forward-only readers never build it
+        self.keyframes = None
+
+    def _open(self) -> bool:
+        if self.grayscale and self.native_gray is not False:
+            self.cap = cv2.VideoCapture(self.video_path, cv2.CAP_FFMPEG)
+            if self.cap.isOpened() and self.native_gray is None:
+                self.native_gray = self._probe_native_gray()
+            if self.native_gray:
+                self.pos = 0
+                return True
+            self.release()
+        self.cap = cv2.VideoCapture(self.video_path)
+        self.pos = 0
+        if not self.cap.isOpened():
+            self.release()
+            return False
+        return True
+
+    def _probe_native_gray(self) -> bool:
+        """Switch the capture to native output and check the first frame is a full-size 8-bit plane."""
+        height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        with _quiet_opencv():
+            if not self.cap.set(cv2.CAP_PROP_CONVERT_RGB, 0):
+                return False
+            ok, frame = self.cap.read()
+        if not ok or frame.ndim != 2 or frame.dtype != np.uint8 or frame.shape != (height, width):
+            return False
+        self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+        return True
+
+    def release(self):
+        if self.cap is not None:
+            self.cap.release()
+        self.cap = None
+
+    def _read(self):
+        if not self.grayscale:
+            return self.cap.read()
+        if self.native_gray:
+            with _quiet_opencv():
+                ret, frame = self.cap.read()
+            return ret, cv2.LUT(frame, _LIMITED_TO_FULL) if ret else None
+        ret, frame = self.cap.read()
+        return ret, cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if ret else None
+
+    def _should_seek(self, fi: int) -> bool:
+        if self.pos is None:
+            return True
+        if fi < self.pos:
+            if self.keyframes is None:
+                self.keyframes = keyframe_indices(self.video_path)
+            return True
+        if not self.keyframes:
+            return fi - self.pos > SEEK_GAP_FRAMES
+        # With keyframe positions known, seek only when it decodes fewer frames than walking forward
+        return seek_cost_frames(self.keyframes, fi) < fi - self.pos
+
+    def read_batch(self, frame_indices) -> dict:
+        """Decode the requested frames in one forward pass. Caller must hold self.lock."""
+        return dict(self.iter_frames(frame_indices))
+
+    def iter_frames(self, frame_indices):
+        """Yield (frame_index, frame) in ascending order, one forward pass. Caller must hold self.lock."""
+        if self.cap is None and not self._open():
+            return
+
+        for fi in sorted(set(int(i) for i in frame_indices)):
+            if fi < 0:
+                continue
+            if self._should_seek(fi):
+                self.cap.set(cv2.CAP_PROP_POS_FRAMES, fi)
+                self.pos = fi
+            while self.pos < fi and self.cap.grab():
+                self.pos += 1
+            ret, frame = self._read() if self.pos == fi else (False, None)
+            if not ret:
+                # Past the end or a broken stream: position unknown, seek on the next request
+                self.pos = None
+                continue
+            self.pos = fi + 1
+            yield fi, frame
+
+
+_decoders = OrderedDict()
+_decoders_lock = threading.Lock()
+
+
+def _get_decoder(video_path: str, grayscale: bool = False) -> _SequentialDecoder:
+    path = os.path.abspath(video_path)
+    key = (path, grayscale)
+    with _decoders_lock:
+        decoder = _decoders.get(key)
+        if decoder is not None:
+            _decoders.move_to_end(key)
+            return decoder
+        decoder = _SequentialDecoder(path, grayscale)
+        _decoders[key] = decoder
+        evicted = []
+        while len(_decoders) > MAX_OPEN_DECODERS:
+            evicted.append(_decoders.popitem(last=False)[1])
+    for old in evicted:
+        with old.lock:
+            old.release()
+    return decoder
+
+
+def release_decoders(video_path: str = None):
+    """Close the shared decoder for one video (e.g. before deleting it) or all of them."""
+    with _decoders_lock:
+        if video_path is None:
+            evicted = list(_decoders.values())
+            _decoders.clear()
+        else:
+            path = os.path.abspath(video_path)
+            evicted = [_decoders.pop(key) for key in [k for k in _decoders if k[0] == path]]
+    for decoder in evicted:
+        with decoder.lock:
+            decoder.release()
+
+
+def _decode_variant(size: tuple | None, grayscale: bool) -> tuple | None:
+    if size is None and not grayscale:
+        return None
+    return (tuple(int(v) for v in size) if size is not None else None, bool(grayscale))
+
+
+def _resize(frame: np.ndarray, size: tuple) -> np.ndarray:
+    """Resize to size=(width, height); a 0 dimension is derived from the aspect ratio."""
+    h, w = frame.shape[:2]
+    target_w, target_h = size
+    if not target_w:
+        target_w = max(1, round(w * target_h / h))
+    if not target_h:
+        target_h = max(1, round(h * target_w / w))
+    # Halve while at least 2x too large: bilinear at exactly 0.5 is a 2x2 box average, several times
+    # cheaper than INTER_AREA over the whole factor; the remaining < 2x step is bilinear
+    while w >= 2 * target_w and h >= 2 * target_h:
+        w, h = w // 2, h // 2
+        frame = cv2.resize(frame, (w, h), interpolation=cv2.INTER_LINEAR)
+    if (target_w, target_h) == (w, h):
+        return frame
+    return cv2.resize(frame, (target_w, target_h), interpolation=cv2.INTER_LINEAR)
+
+
+def extract_frames(video_path: str, frame_indices, size: tuple = None, grayscale: bool = False,
+                   keyframe_aligned: bool = False) -> dict:
+    """
+    Decode several frames with the video's shared decoder in a single forward pass.
+    Frames already in frame_cache are not decoded again.
+
+    size: (width, height) to downscale to (either may be 0 to keep the aspect ratio).
+    grayscale: return single-channel frames, decoded from the Y plane where the stream allows.
+    keyframe_aligned: snap every index back to the nearest seek-aligned frame (see seek_aligned_frame),
+    so a random access costs a fixed SEEK_BACKOFF_FRAMES + 1 decodes however long the GOP is;
+    the result is keyed by the frame actually decoded.
+
+    Returns {frame_index: frame}; frames that could not be decoded are omitted.
+    """
+    if not os.path.exists(video_path):
+        return {}
+    wanted = sorted(set(int(i) for i in frame_indices if int(i) >= 0))
+    if keyframe_aligned:
+        keyframes = keyframe_indices(video_path)
+        wanted = sorted(set(seek_aligned_frame(keyframes, fi) for fi in wanted))
+    variant = _decode_variant(size, grayscale)
+    frames = frame_cache.get_many(video_path, wanted, variant)
+    missing = [fi for fi in wanted if fi not in frames]
+    if missing:
+        decoder = _get_decoder(video_path, grayscale)
+        with decoder.lock, VIDEO_DECODE_SECONDS.time(op="frames"):
+            # Resize as frames arrive so full-resolution frames are never held together
+            decoded = {fi: _resize(frame, size) if size is not None else frame
+                       for fi, frame in decoder.iter_frames(missing)}
+        frame_cache.put_many(video_path, decoded, variant)
+        frames.update(decoded)
+    return frames
+
+
+def extract_frame(video_path: str, frame_index: int, size: tuple = None, grayscale: bool = False) -> np.ndarray | None:
+    return extract_frames(video_path, [frame_index], size=size, grayscale=grayscale).get(int(frame_index))
+
+
+_keyframe_memo = OrderedDict()
+_keyframe_lock = threading.Lock()
+
+
+def keyframe_indices(video_path: str) -> list:
+    """
+    Frame indices of the video's keyframes, from a demux-only pass (packets are read, not decoded).
+    Memoized per (path, mtime, size). Returns [] when the backend cannot report keyframes.
+    """
+    key = (os.path.abspath(video_path), _file_signature(video_path))
+    with _keyframe_lock:
+        if key in _keyframe_memo:
+            _keyframe_memo.move_to_end(key)
+            return _keyframe_memo[key]
+
+    keyframes = []
+    cap = cv2.VideoCapture(video_path, cv2.CAP_FFMPEG)
+    try:
+        if cap.isOpened() and cap.set(cv2.CAP_PROP_FORMAT, -1):
+            index = 0
+            while cap.grab():
+                if cap.get(cv2.CAP_PROP_LRF_HAS_KEY_FRAME):
+                    keyframes.append(index)
+                index += 1
+    finally:
+        cap.release()
+
+    with _keyframe_lock:
+        _keyframe_memo[key] = keyframes
+        while len(_keyframe_memo) > MAX_KEYFRAME_MEMO:
+            _keyframe_memo.popitem(last=False)
+    return keyframes
+
+
+def nearest_keyframe(keyframes: list, frame_index: int) -> int:
+    """The last keyframe at or before frame_index (frame_index itself when keyframes is empty)."""
+    i = bisect.bisect_right(keyframes, frame_index) - 1
+    return keyframes[i] if i >= 0 else frame_index
+
+
+def seek_cost_frames(keyframes: list, frame_index: int) -> int:
+    """Approximate frames decoded to seek to frame_index (see SEEK_BACKOFF_FRAMES)."""
+    start = nearest_keyframe(keyframes, frame_index - SEEK_BACKOFF_FRAMES) if frame_index >= SEEK_BACKOFF_FRAMES else 0
+    return frame_index - min(start, frame_index) + 1 + SEEK_OVERHEAD_FRAMES
+
+
+def seek_aligned_frame(keyframes: list, frame_index: int) -> int:
+    """
+    The frame at or before frame_index that is cheapest to seek to: SEEK_BACKOFF_FRAMES after a keyframe,
+    where the seek starts decoding right at that keyframe. Used for fast scrubbing (e.g. probe frames).
+    """
+    if not keyframes or frame_index < keyframes[0] + SEEK_BACKOFF_FRAMES:
+        return frame_index
+    return min(frame_index, nearest_keyframe(keyframes, frame_index - SEEK_BACKOFF_FRAMES) + SEEK_BACKOFF_FRAMES)
+
+
+@VIDEO_DECODE_SECONDS.time(op="region_stacks")
+def extract_region_stacks(video_path: str, frame_indices, bboxes: list) -> tuple:
+    """
+    Decode frame_indices in one forward pass and crop every bbox out of each frame as grayscale.
+    Only the crops are kept (full frames are neither stored nor added to frame_cache).
+    Returns (decoded_indices, stacks): stacks[i] is a uint8 array of shape (len(decoded_indices), h, w)
+    for bboxes[i], clipped to the frame; an empty region gives an array with h or w == 0.
+    """
+    wanted = sorted(set(int(i) for i in frame_indices if int(i) >= 0))
+    if not wanted or not os.path.exists(video_path):
+        return [], [np.zeros((0, 0, 0), dtype=np.uint8) for _ in bboxes]
+
+    decoded = []
+    stacks = None
+    windows = None
+    decoder = _get_decoder(video_path)
+    with decoder.lock:
+        for fi, frame in decoder.iter_frames(wanted):
+            if stacks is None:
+                h, w = frame.shape[:2]
+                windows = []
+                for bbox in bboxes:
+                    x1, y1, x2, y2 = [int(v) for v in bbox]
+                    x1, y1, x2, y2 = max(0, x1), max(0, y1), min(w, x2), min(h, y2)
+                    windows.append((x1, y1, max(x1, x2), max(y1, y2)))
+                stacks = [np.empty((len(wanted), y2 - y1, x2 - x1), dtype=np.uint8) for x1, y1, x2, y2 in windows]
+            t = len(decoded)
+            for stack, (x1, y1, x2, y2) in zip(stacks, windows):
+                if stack.size:
+                    cv2.cvtColor(frame[y1:y2, x1:x2], cv2.COLOR_BGR2GRAY, dst=stack[t])
+            decoded.append(fi)
+
+    if stacks is None:
+        return [], [np.zeros((0, 0, 0), dtype=np.uint8) for _ in bboxes]
+    return decoded, [stack[:len(decoded)] for stack in stacks]
+
+
+_sha256_memo = {}
+_sha256_lock = threading.Lock()
+
+
+def file_sha256(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """Content hash of a file, read in chunks; memoized per (path, mtime, size)."""
+    key = (os.path.abspath(path), _file_signature(path))
+    with _sha256_lock:
+        if key in _sha256_memo:
+            return _sha256_memo[key]
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            digest.update(chunk)
+    with _sha256_lock:
+        _sha256_memo[key] = digest.hexdigest()
+    return _sha256_memo[key]
 
 
 def crop_region(frame: np.ndarray, bbox: list) -> np.ndarray:
@@ -25,7 +470,13 @@ def frame_to_base64(frame: np.ndarray, fmt: str = ".jpg") -> str:
     return base64.b64encode(buffer).decode("utf-8")
 
 
-def get_video_info(video_path: str) -> dict | None:
+@VIDEO_PROBE_SECONDS.time()
+def get_video_info(video_path: str, keyframes: bool = False) -> dict | None:
+    """
+    Basic stream properties. With keyframes=True also lists keyframe positions ("keyframes", empty
+    when unknown) so callers can pick frames that are cheap to seek to; that reads every packet of
+    the file, so only ask for it when the positions are used.
+    """
     if not os.path.exists(video_path):
         return None
     cap = cv2.VideoCapture(video_path)
@@ -37,10 +488,13 @@ def get_video_info(video_path: str) -> dict | None:
     height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
     cap.release()
     duration = total_frames / fps if fps > 0 else 0
-    return {
+    info = {
         "fps": fps,
         "total_frames": total_frames,
         "width": width,
         "height": height,
         "duration_sec": round(duration, 2)
     }
+    if keyframes:
+        info["keyframes"] = keyframe_indices(video_path)
+    return info
@@ -0,0 +1,210 @@
+"""
+视觉模型响应缓存
+键 = (模型, 提示词, 图片感知哈希)：同一辆车停在同一位置时，重复分析、相邻片段或几乎相同的帧
+裁剪出的图片哈希相同或只差几位，可直接复用上次的模型输出，省去一次付费且耗时数秒的请求。
+
+- 感知哈希：64 位差值哈希（dHash），对 JPEG 压缩、轻微光照/噪声变化不敏感
+- 近似匹配：汉明距离不超过 max_distance 视为同一图片；另外要求裁剪尺寸相近，避免不同大小的区域误匹配
+- 持久化：SQLite，条目超过 TTL 后失效并定期清理
+哈希按 4 段 16 位分别建索引：距离 <= 3 的两个哈希至少有一段完全相同，按段查询即可找到全部候选；
+max_distance > 3 时退化为扫描同一模型 + 提示词下的全部条目。
+
+近似匹配只适合结果由整体画面决定的请求（如场景分析）。车牌等由细小局部决定的请求不能用：
+9×8 的 dHash 里看不到车牌字符，同一车位上外形颜色相近的另一辆车会拿到上一辆车的车牌。
+这类请求用 get_exact / put_exact，按图片内容的 sha256（content_key）精确匹配。
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+import cv2
+import numpy as np
+
+
+HASH_SIZE = 8
+HASH_BANDS = 4
+BAND_BITS = 64 // HASH_BANDS
+# 裁剪尺寸相对差异超过该比例时不视为同一图片
+MAX_SIZE_RATIO = 0.1
+# 每写入多少次清理一次过期条目
+PRUNE_EVERY = 100
+
+
+def image_key(image: np.ndarray) -> tuple:
+    """返回 (dHash, 宽, 高)：灰度缩放到 (HASH_SIZE+1)×HASH_SIZE，比较水平相邻像素得到 64 位哈希"""
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    small = cv2.resize(gray, (HASH_SIZE + 1, HASH_SIZE), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    value = int.from_bytes(np.packbits(bits).tobytes(), "big")
+    return value, int(image.shape[1]), int(image.shape[0])
+
+
+def content_key(image_b64: str) -> str:
+    """图片内容的精确键：编码后图片（JPEG base64）的 sha256；同一视频同一帧同一区域得到相同的键"""
+    return hashlib.sha256(image_b64.encode("ascii")).hexdigest()
+
+
+def _bands(value: int) -> list:
+    mask = (1 << BAND_BITS) - 1
+    return [(value >> (i * BAND_BITS)) & mask for i in range(HASH_BANDS)]
+
+
+def _size_matches(a: int, b: int) -> bool:
+    return abs(a - b) <= MAX_SIZE_RATIO * max(a, b, 1)
+
+
+class VisionResponseCache:
+    """按感知哈希近似匹配的视觉模型响应缓存；ttl_sec <= 0 时禁用。"""
+
+    def __init__(self, path: str, ttl_sec: float, max_distance: int = 3):
+        self.path = path
+        self.ttl_sec = ttl_sec
+        self.max_distance = max_distance
+        self.hits = 0
+        self.near_hits = 0
+        self.exact_hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " id INTEGER PRIMARY KEY, model TEXT NOT NULL, prompt TEXT NOT NULL, phash TEXT NOT NULL,"
+                " width INTEGER NOT NULL, height INTEGER NOT NULL,"
+                + "".join(f" band{i} INTEGER NOT NULL," for i in range(HASH_BANDS))
+                + " response TEXT NOT NULL, created_at REAL NOT NULL, expires_at REAL NOT NULL,"
+                " hits INTEGER NOT NULL DEFAULT 0)"
+            )
+            for i in range(HASH_BANDS):
+                db.execute(f"CREATE INDEX IF NOT EXISTS responses_band{i} ON responses (model, prompt, band{i})")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS exact_responses ("
+                " model TEXT NOT NULL, prompt TEXT NOT NULL, digest TEXT NOT NULL, response TEXT NOT NULL,"
+                " created_at REAL NOT NULL, expires_at REAL NOT NULL, hits INTEGER NOT NULL DEFAULT 0,"
+                " PRIMARY KEY (model, prompt, digest))"
+            )
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl_sec > 0
+
+    @contextmanager
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=10)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    @staticmethod
+    def _prompt_key(prompt: str) -> str:
+        return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+    def get(self, model: str, prompt: str, key: tuple) -> str | None:
+        """返回汉明距离最近（且不超过 max_distance）的未过期条目的响应文本，没有则返回 None"""
+        if not self.enabled:
+            return None
+        value, width, height = key
+        params = [model or "", self._prompt_key(prompt), time.time()]
+        sql = "SELECT id, phash, width, height, response FROM responses WHERE model = ? AND prompt = ? AND expires_at > ?"
+        if self.max_distance < HASH_BANDS:
+            sql += " AND (" + " OR ".join(f"band{i} = ?" for i in range(HASH_BANDS)) + ")"
+            params += _bands(value)
+
+        best = None
+        with self._lock, self._connect() as db:
+            for row_id, phash, w, h, response in db.execute(sql, params):
+                if not (_size_matches(w, width) and _size_matches(h, height)):
+                    continue
+                distance = bin(int(phash, 16) ^ value).count("1")
+                if distance <= self.max_distance and (best is None or distance < best[0]):
+                    best = (distance, row_id, response)
+            if best is None:
+                self.misses += 1
+                return None
+            db.execute("UPDATE responses SET hits = hits + 1 WHERE id = ?", (best[1],))
+            self.hits += 1
+            if best[0] > 0:
+                self.near_hits += 1
+        return best[2]
+
+    def put(self, model: str, prompt: str, key: tuple, response: str):
+        if not self.enabled:
+            return
+        value, width, height = key
+        now = time.time()
+        with self._lock, self._connect() as db:
+            db.execute(
+                "INSERT INTO responses (model, prompt, phash, width, height, "
+                + "".join(f"band{i}, " for i in range(HASH_BANDS))
+                + "response, created_at, expires_at) VALUES (" + ", ".join("?" * (8 + HASH_BANDS)) + ")",
+                [model or "", self._prompt_key(prompt), f"{value:016x}", width, height,
+                 *_bands(value), response, now, now + self.ttl_sec],
+            )
+            self._writes += 1
+            if self._writes % PRUNE_EVERY == 0:
+                db.execute("DELETE FROM responses WHERE expires_at <= ?", (now,))
+                db.execute("DELETE FROM exact_responses WHERE expires_at <= ?", (now,))
+
+    def get_exact(self, model: str, prompt: str, digest: str) -> str | None:
+        """按图片内容哈希（content_key）精确查找未过期的响应"""
+        if not self.enabled:
+            return None
+        params = (model or "", self._prompt_key(prompt), digest)
+        with self._lock, self._connect() as db:
+            row = db.execute(
+                "SELECT response FROM exact_responses WHERE model = ? AND prompt = ? AND digest = ? AND expires_at > ?",
+                (*params, time.time()),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            db.execute("UPDATE exact_responses SET hits = hits + 1 WHERE model = ? AND prompt = ? AND digest = ?",
+                       params)
+            self.hits += 1
+            self.exact_hits += 1
+        return row[0]
+
+    def put_exact(self, model: str, prompt: str, digest: str, response: str):
+        if not self.enabled:
+            return
+        now = time.time()
+        with self._lock, self._connect() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO exact_responses (model, prompt, digest, response, created_at, expires_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (model or "", self._prompt_key(prompt), digest, response, now, now + self.ttl_sec),
+            )
+            self._writes += 1
+            if self._writes % PRUNE_EVERY == 0:
+                db.execute("DELETE FROM responses WHERE expires_at <= ?", (now,))
+                db.execute("DELETE FROM exact_responses WHERE expires_at <= ?", (now,))
+
+    def clear(self):
+        with self._lock, self._connect() as db:
+            db.execute("DELETE FROM responses")
+            db.execute("DELETE FROM exact_responses")
+
+    def stats(self) -> dict:
+        with self._lock, self._connect() as db:
+            now = time.time()
+            entries = db.execute("SELECT COUNT(*) FROM responses WHERE expires_at > ?", (now,)).fetchone()[0]
+            entries += db.execute("SELECT COUNT(*) FROM exact_responses WHERE expires_at > ?", (now,)).fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": entries,
+            "ttl_sec": self.ttl_sec,
+            "max_distance": self.max_distance,
+            "hits": self.hits,
+            "near_hits": self.near_hits,
+            "exact_hits": self.exact_hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
@@ -64,6 +64,7 @@ export type AgentSSEEvent =
   | { type: 'tool_call'; tool: string; args: Record<string, unknown> }
   | { type: 'tool_result'; tool: string; summary: string }
   | { type: 'frame_annotation'; data: AgentFrameAnnotation }
+  | { type: 'frame_annotation_batch'; data: AgentFrameAnnotationBatch }
   | { type: 'final_report'; violations: AgentViolationRecord[]; markdown: string }
   | { type: 'error'; message: string }
 
@@ -74,6 +75,18 @@ export interface AgentFrameAnnotation {
   boxes: AgentBoundingBox[]
 }
 
+// 批量标注：bbox 坐标乘以 quant 取整；同一轨迹在本批次内再次出现时为相对上次的差值
+export interface AgentFrameAnnotationBatch {
+  fps: number
+  start: number
+  end: number
+  quant: number
+  // 仅包含本次分析中首次出现的轨迹
+  tracks: Record<string, { label: string; is_violation: boolean }>
+  // [frame_index, [[track_id, x1, y1, x2, y2, confidence‰], ...]]
+  frames: Array<[number, Array<[number, number, number, number, number, number]>]>
+}
+
 export interface AgentBoundingBox {
   track_id: number
   bbox: [number, number, number, number]
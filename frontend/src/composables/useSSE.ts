@@ -46,13 +46,16 @@ export function useSSE(url: string, options: UseSSEOptions) {
       }
 
       const decoder = new TextDecoder()
+      // 一条消息可能跨多次 read 到达，未以换行结尾的部分留到下一次拼接
+      let buffer = ''
 
       while (true) {
         const { value, done } = await reader.read()
         if (done) break
 
-        const chunk = decoder.decode(value, { stream: true })
-        const lines = chunk.split('\n')
+        buffer += decoder.decode(value, { stream: true })
+        const lines = buffer.split('\n')
+        buffer = lines.pop() ?? ''
 
         for (const line of lines) {
           if (line.startsWith('data: ')) {
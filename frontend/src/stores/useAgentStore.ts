@@ -1,6 +1,7 @@
 import { defineStore } from 'pinia'
 import { ref, computed } from 'vue'
 import { useSSE } from '@/composables/useSSE'
+import type { AgentFrameAnnotationBatch } from '@/api/types'
 import { useRouter } from 'vue-router'
 
 export interface AgentPhase {
@@ -73,6 +74,9 @@ export const useAgentStore = defineStore('agent', () => {
   // 视频 FPS（从第一个 frame_annotation 事件中获取）
   const videoFps = ref(30)
 
+  // 批量标注中各轨迹的标签与违停状态（每条轨迹只下发一次）
+  const trackMeta = new Map<number, { label: string; is_violation: boolean }>()
+
   // 最终结果
   const violations = ref<ViolationRecord[]>([])
   const finalReport = ref('')
@@ -156,6 +160,41 @@ export const useAgentStore = defineStore('agent', () => {
         }
         break
       }
+      case 'frame_annotation_batch': {
+        const batch = event.data as AgentFrameAnnotationBatch
+        if (batch.fps && batch.fps !== videoFps.value) {
+          videoFps.value = batch.fps
+        }
+        for (const [id, meta] of Object.entries(batch.tracks)) {
+          trackMeta.set(Number(id), meta)
+        }
+        // 差分解码：同一轨迹在本批次内的上一个 bbox（已量化）
+        const previous = new Map<number, number[]>()
+        for (const [frameIndex, rows] of batch.frames) {
+          const boxes: BoundingBox[] = rows.map(([trackId, x1, y1, x2, y2, conf]) => {
+            const prev = previous.get(trackId)
+            const q = prev
+              ? [prev[0] + x1, prev[1] + y1, prev[2] + x2, prev[3] + y2]
+              : [x1, y1, x2, y2]
+            previous.set(trackId, q)
+            const meta = trackMeta.get(trackId)
+            return {
+              track_id: trackId,
+              bbox: q.map(v => v / batch.quant) as [number, number, number, number],
+              label: meta?.label ?? `车辆 #${trackId}`,
+              is_violation: meta?.is_violation ?? false,
+              confidence: conf / 1000,
+            }
+          })
+          frameAnnotations.value.set(frameIndex, {
+            frame_index: frameIndex,
+            timestamp_sec: batch.fps ? frameIndex / batch.fps : 0,
+            fps: batch.fps,
+            boxes,
+          })
+        }
+        break
+      }
       case 'final_report':
         violations.value = event.violations as ViolationRecord[]
         finalReport.value = event.markdown as string
@@ -230,6 +269,7 @@ export const useAgentStore = defineStore('agent', () => {
     isCompleted.value = false
     thoughts.value = []
     frameAnnotations.value = new Map()
+    trackMeta.clear()
     violations.value = []
     finalReport.value = ''
     videoFps.value = 30
@@ -256,6 +296,7 @@ export const useAgentStore = defineStore('agent', () => {
     clearVideoFile()
     thoughts.value = []
     frameAnnotations.value = new Map()
+    trackMeta.clear()
     violations.value = []
     finalReport.value = ''
     isCompleted.value = false
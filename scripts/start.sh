@@ -69,7 +69,7 @@ else
 fi
 
 echo -e "${GREEN}[2/4] Starting Flask backend (port 5001)...${NC}"
-python app.py &
+python run.py &
 BACKEND_PID=$!
 sleep 2
 if ps -p $BACKEND_PID > /dev/null; then